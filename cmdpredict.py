@@ -5,25 +5,45 @@
 import sys, pickle
 
 # local packages
-from mrs.recsys import predict
+from mrs.config import config
 
 # usage: arg1: ['knn', 'ann', 'rbm']
 #        arg2: user_id
 #        arg3: item_id
+#    or: arg1: 'recommend'
+#        arg2: ['knn', 'item']
+#        arg3: user_id
+#        arg4: number of movies, 10 if not given
+#        arg5: genre, all the genres if not given
 
 if __name__ == '__main__':
-    if sys.argv[1] == 'knn':
-        with open('predicted_rating_knn.bin', 'rb') as f:
+    if sys.argv[1] == 'recommend':
+        from mrs.datamodel import loaddata
+        data = loaddata.Data()
+        data.load_data()
+        if sys.argv[2] == 'item':
+            from mrs.recsys.itemknn import ItemKNN
+            predictor = ItemKNN(data)
+        else:
+            from mrs.recsys.knn import KNN
+            predictor = KNN(data)
+        n = int(sys.argv[4]) if len(sys.argv) > 4 else 10
+        genre = sys.argv[5] if len(sys.argv) > 5 else None
+        for item_id, rating in zip(*predictor.recommend(int(sys.argv[3]), n, genre = genre)):
+            print('%5d %.3f %s' % (item_id, rating, data.get_item_by_id(int(item_id)).get_movie_title()))
+    elif sys.argv[1] == 'knn':
+        with open(config.get_model_path('predicted_rating_knn.bin'), 'rb') as f:
             rating = pickle.load(f)
             print(rating[int(sys.argv[2])][int(sys.argv[3])])
     elif sys.argv[1] == 'ann':
-        with open('predicted_rating_ann.bin', 'rb') as f:
+        with open(config.get_model_path('predicted_rating_ann.bin'), 'rb') as f:
             rating = pickle.load(f)
             print(rating[int(sys.argv[2])][int(sys.argv[3])])
     elif sys.argv[1] == 'rbm':
-        with open('predicted_rating_rbm.bin', 'rb') as f:
+        with open(config.get_model_path('predicted_rating_rbm.bin'), 'rb') as f:
             rating = pickle.load(f)
             print(rating[int(sys.argv[2])][int(sys.argv[3])])
+        #from mrs.recsys import predict
         #p = predict.PredictRBM()
         #p.load_hyperparameters()
         #print(p.predict(int(sys.argv[2]), int(sys.argv[3])))
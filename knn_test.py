@@ -18,10 +18,7 @@ if __name__ == '__main__':
     data.load_data()
     _knn = KNN(data)
     print(nusers, nitems)
-    for u in range(1, nusers + 1):
-        print('user with id', u, 'done')
-        for i in range(1, nitems + 1):
-            predicted_rating[u, i] = _knn.score(1, i)
+    predicted_rating[1:, 1:] = _knn.score_users(range(1, nusers + 1))[:, 1:nitems + 1]
 
     f = open('predicted_rating_knn.bin', 'wb')
     pickle.dump(predicted_rating, f)
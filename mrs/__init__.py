@@ -1,3 +1,6 @@
-import pkg_resources
-
-__version__ = pkg_resources.get_distribution(__name__).version
+def __getattr__(name):
+    # the version is looked up only when it is asked for, importing pkg_resources is slow
+    if name == '__version__':
+        import pkg_resources
+        return pkg_resources.get_distribution(__name__).version
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module: config
+   :synopsis: lazily resolved locations of the data set and the trained models
+
+Nothing is read when this module is imported. The data set location is resolved the first time it is needed from, in order,
+
+1. the value given to :py:meth:`Config.set_data_location`
+2. the environment variable *MRS_DATA_LOCATION*
+3. the directory *ml-100k* in the current working directory
+
+and the same way for the directory where trained models and predicted ratings are kept with
+:py:meth:`Config.set_model_location`, *MRS_MODEL_LOCATION* and the current working directory.
+
+:Example:
+
+>>> from mrs.config import config
+>>> config.set_data_location('/srv/mrs/ml-100k')
+>>> config.get_nusers()
+943
+"""
+
+# library packages
+import os
+
+data_location_env  = 'MRS_DATA_LOCATION'
+model_location_env = 'MRS_MODEL_LOCATION'
+
+default_data_dirname = 'ml-100k'
+
+# name of the file in the data set which contains the number of users, items and ratings
+info_filename = 'u.info'
+
+class Config:
+    """
+    Holds the locations used by :py:mod:`mrs.datamodel` and :py:mod:`mrs.recsys`, each of them is resolved on first use and then kept
+    """
+    def __init__(self):
+        self._data_location  = None
+        self._model_location = None
+        self._info           = None
+
+    def set_data_location(self, path):
+        """
+        :param path: directory of the data set
+        :type path:  str
+        """
+        self._data_location = os.path.abspath(path)
+        self._info = None
+
+    def get_data_location(self):
+        """
+        :return: directory of the data set
+        :rtype:  str
+        """
+        if self._data_location is None:
+            self._data_location = os.path.abspath(os.environ.get(data_location_env) or os.path.join(os.getcwd(), default_data_dirname))
+        return self._data_location
+
+    def set_model_location(self, path):
+        """
+        :param path: directory where the trained models and predicted ratings are kept
+        :type path:  str
+        """
+        self._model_location = os.path.abspath(path)
+
+    def get_model_location(self):
+        """
+        :return: directory where the trained models and predicted ratings are kept
+        :rtype:  str
+        """
+        if self._model_location is None:
+            self._model_location = os.path.abspath(os.environ.get(model_location_env) or os.getcwd())
+        return self._model_location
+
+    def get_model_path(self, filename):
+        """
+        :return: path of a file in :py:meth:`get_model_location`
+        :rtype:  str
+        """
+        return os.path.join(self.get_model_location(), filename)
+
+    def get_info(self):
+        """
+        reads the number of users, items and ratings from *u.info* of the data set the first time it is called
+
+        :return: number of users, items and ratings
+        :rtype:  tuple
+        """
+        if self._info is None:
+            with open(os.path.join(self.get_data_location(), info_filename)) as f:
+                l = f.readlines()
+            self._info = tuple(int(l[i].split()[0]) for i in range(3))
+        return self._info
+
+    def get_nusers(self):
+        """
+        :return: number of users in the data set
+        :rtype:  int
+        """
+        return self.get_info()[0]
+
+    def get_nitems(self):
+        """
+        :return: number of items in the data set
+        :rtype:  int
+        """
+        return self.get_info()[1]
+
+    def get_nratings(self):
+        """
+        :return: number of ratings in the data set
+        :rtype:  int
+        """
+        return self.get_info()[2]
+
+# the configuration shared by the whole package
+config = Config()
@@ -7,22 +7,28 @@
 This is responsible for loading the data from the data set and creating user and item objects
 """
 
-# library files
-import os
-
-# path to the data set
-data_location = os.path.join(os.getcwd(), 'ml-100k')
+# local files
+from ..config import config
 
 user_dataset   = '/u.user'
 item_dataset   = '/u.item'
 rating_dataset = '/u.data'
 info = '/u.info'
 
-# load the number of users, items and ratings
-l = open(data_location + info).readlines()
-nusers   = int(l[0].split()[0])
-nitems   = int(l[1].split()[0])
-nratings = int(l[2].split()[0])
+def __getattr__(name):
+    """
+    The path to the data set (*data_location*) and the number of users, items and ratings (*nusers*, *nitems*, *nratings*)
+    are resolved by :py:data:`mrs.config.config` when they are first asked for, nothing is read when the package is imported
+    """
+    if name == 'data_location':
+        return config.get_data_location()
+    if name == 'nusers':
+        return config.get_nusers()
+    if name == 'nitems':
+        return config.get_nitems()
+    if name == 'nratings':
+        return config.get_nratings()
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 genre_names = ["unknown", "Action", "Adventure", "Animation",
                "Children's", "Comedy", "Crime", "Documentary", "Drama", "Fantasy",
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module: cache
+   :synopsis: binary columnar cache of the parsed data set
+
+The first time the data set is loaded the parsed columns are written as raw *.npy* files next to the data set
+together with a small *meta.json* header. Later loads memory-map those files instead of parsing the text files again.
+The header records the cache format version and the size and modification time of every source file, so the cache
+is rebuilt as soon as one of the source files changes.
+"""
+
+# library packages
+import os
+import json
+
+# third party packages
+import numpy as np
+
+# version of the on-disk layout, bump it whenever the set of columns or their dtypes change
+CACHE_VERSION = 1
+
+# name of the directory inside the data set directory where the cache is kept
+cache_dirname = '.mrs_cache'
+
+meta_filename = 'meta.json'
+
+class DataCache:
+    """
+    Reads and writes the columns of the data set to a directory of *.npy* files.
+
+    :param location: path to the data set directory
+    :type location:  str
+    :param sources:  names of the source files the cache is built from, relative to *location*
+    :type sources:   list
+    :param name:     name of the sub directory of the cache, to keep caches built from different sources apart
+    :type name:      str
+    """
+    def __init__(self, location, sources, name = ''):
+        self._location  = location
+        self._sources   = [source.strip('/') for source in sources]
+        self._cache_dir = os.path.join(location, cache_dirname, name)
+
+    def get_cache_dir(self):
+        """
+        :return: the directory where the cache files are kept
+        :rtype:  str
+        """
+        return self._cache_dir
+
+    def fingerprint(self):
+        """
+        :return: size and modification time of every source file, keyed by file name
+        :rtype:  dict
+        :raises FileNotFoundError: if one of the source files is missing
+        """
+        fp = {}
+        for source in self._sources:
+            st = os.stat(os.path.join(self._location, source))
+            fp[source] = [st.st_size, st.st_mtime_ns]
+        return fp
+
+    def is_valid(self):
+        """
+        :return: True if the cache exists, has the current version and was built from the current source files
+        :rtype:  bool
+        """
+        try:
+            with open(os.path.join(self._cache_dir, meta_filename)) as f:
+                meta = json.load(f)
+            return meta.get('version') == CACHE_VERSION and meta.get('sources') == self.fingerprint()
+        except (OSError, ValueError):
+            return False
+
+    def load(self):
+        """
+        Memory-maps the cached columns.
+
+        :return: column name to ndarray, or None if the cache is missing or stale
+        :rtype:  dict
+        """
+        if not self.is_valid():
+            return None
+
+        try:
+            with open(os.path.join(self._cache_dir, meta_filename)) as f:
+                names = json.load(f)['columns']
+            return {name: np.load(os.path.join(self._cache_dir, name + '.npy'), mmap_mode = 'r') for name in names}
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save(self, columns):
+        """
+        Writes the columns to the cache. The header is written last so a partially written cache is never considered valid,
+        and the files are replaced rather than overwritten so the columns other processes have memory-mapped stay intact.
+        Failing to write the cache (e.g. a read only data set directory) is not an error, the data will simply be parsed again next time.
+
+        :param columns: column name to ndarray
+        :type columns:  dict
+        :return: True if the cache was written
+        :rtype:  bool
+        """
+        meta_path = os.path.join(self._cache_dir, meta_filename)
+        try:
+            os.makedirs(self._cache_dir, exist_ok = True)
+            if os.path.exists(meta_path):
+                os.remove(meta_path)
+
+            # every column is written under a temporary name and then renamed, so processes which have the old column
+            # memory-mapped keep it and a cache written by two processes at once is never a mix of both
+            for name, column in columns.items():
+                path = os.path.join(self._cache_dir, name + '.npy')
+                tmp_path = '%s.%d.tmp' % (path, os.getpid())
+                with open(tmp_path, 'wb') as f:
+                    np.save(f, np.ascontiguousarray(column))
+                os.replace(tmp_path, path)
+
+            meta = {'version': CACHE_VERSION, 'sources': self.fingerprint(), 'columns': sorted(columns)}
+            tmp_path = '%s.%d.tmp' % (meta_path, os.getpid())
+            with open(tmp_path, 'w') as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, meta_path)
+        except OSError:
+            return False
+
+        return True
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module: deltalog
+   :synopsis: append-only log of the ratings added after the data set was loaded
+
+Ratings given through the site (e.g. *site/insert_rating.php* or a new registration) are not part of the static data set.
+Every batch passed to :py:meth:`mrs.datamodel.loaddata.Data.add_ratings` is appended to this log as fixed size binary records,
+so a process which loads the data set later can replay the log with :py:meth:`mrs.datamodel.loaddata.Data.open_log` instead of
+reloading anything else.
+"""
+
+# library packages
+import os
+
+# third party packages
+import numpy as np
+
+# one record of the log
+record = np.dtype([('user', '<i4'), ('item', '<i4'), ('rating', '<f4'), ('timestamp', '<i8')])
+
+# default name of the log in the model location of :py:data:`mrs.config.config`
+log_filename = 'ratings.log'
+
+class RatingLog:
+    """
+    :param path: path of the log file, it is created on the first append
+    :type path:  str
+    """
+    def __init__(self, path):
+        self._path = path
+
+    def get_path(self):
+        """
+        :return: path of the log file
+        :rtype:  str
+        """
+        return self._path
+
+    def append(self, users, items, ratings, timestamps):
+        """
+        Appends a batch of ratings to the log and flushes it to disk. A record which was only partially written before is
+        cut off first, the batch would be misaligned after it.
+        """
+        batch = np.empty(len(users), dtype = record)
+        batch['user'], batch['item'], batch['rating'], batch['timestamp'] = users, items, ratings, timestamps
+        with open(self._path, 'ab') as f:
+            size = f.seek(0, os.SEEK_END)
+            if size % record.itemsize:
+                f.truncate(size - size % record.itemsize)
+            f.write(batch.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+    def read(self):
+        """
+        :return: user ids, item ids, ratings and timestamps of all the logged ratings in the order they were appended.
+                 A record which was only partially written (e.g. the process was killed while appending) is ignored.
+        :rtype:  tuple
+        """
+        if not os.path.exists(self._path):
+            batch = np.zeros(0, dtype = record)
+        else:
+            with open(self._path, 'rb') as f:
+                raw = f.read()
+            batch = np.frombuffer(raw[:len(raw) - len(raw) % record.itemsize], dtype = record)
+        return batch['user'], batch['item'], batch['rating'], batch['timestamp']
+
+    def __len__(self):
+        if not os.path.exists(self._path):
+            return 0
+        return os.path.getsize(self._path) // record.itemsize
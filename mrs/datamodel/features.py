@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module: features
+   :synopsis: the features of every item id as one contiguous matrix, for the neural predictors
+
+:py:class:`ItemFeatures` holds the genre flags of every movie, optionally followed by extra columns from
+:py:data:`extra_columns`, in one *float32* matrix indexed by item id like the columns of the rating matrices. The features of
+any number of items are gathered by an array of item ids, so training and prediction never go through the item objects.
+
+:Example:
+
+>>> features = d.get_item_features(extra = ('year', 'popularity'))
+>>> features.gather(np.array([1, 50, 181]))
+"""
+
+# third party packages
+import numpy as np
+
+# local files
+from . import genre_names
+
+def release_year(items, nitems, item_count):
+    """
+    :return: release year of every item id scaled to [0, 1] over the years of the movies, the mean for unknown years
+    :rtype:  ndarray
+    """
+    years = np.full(nitems, np.nan)
+    dates = np.char.strip(items.release_dates.astype(str))
+    known = (items.ids < nitems) & (np.char.str_len(dates) >= 4)
+    years[items.ids[known]] = [int(date[-4:]) for date in dates[known].tolist()]
+    if not np.isfinite(years).any():
+        return np.zeros(nitems)
+    low, high = np.nanmin(years), np.nanmax(years)
+    years = np.where(np.isfinite(years), years, np.nanmean(years))
+    return (years - low) / (high - low) if high > low else np.zeros(nitems)
+
+def popularity(items, nitems, item_count):
+    """
+    :return: logarithm of the number of ratings of every item id scaled to [0, 1]
+    :rtype:  ndarray
+    """
+    counts = np.log1p(np.asarray(item_count, dtype = np.float64)[:nitems])
+    return counts / counts.max() if len(counts) and counts.max() > 0 else counts
+
+# name of an extra column to the function which computes it from the item table, the number of item ids and the number of
+# ratings of every item id
+extra_columns = {'year': release_year, 'popularity': popularity}
+
+# the extra columns computed from the number of ratings of every item id, they change when ratings are added
+count_columns = ('popularity',)
+
+class ItemFeatures:
+    """
+    :param items:      the movies
+    :type items:       :py:class:`mrs.datamodel.tables.ItemTable`
+    :param nitems:     number of item ids, the number of columns of the rating matrices
+    :type nitems:      int
+    :param extra:      names in :py:data:`extra_columns` of the columns added after the genres
+    :type extra:       tuple
+    :param item_count: number of ratings of every item id, needed for 'popularity'
+    :type item_count:  ndarray
+    """
+    def __init__(self, items, nitems, extra = (), item_count = None):
+        for name in extra:
+            if name not in extra_columns:
+                raise ValueError("unknown feature %s, choose from %s" % (name, ', '.join(sorted(extra_columns))))
+        self.extra   = tuple(extra)
+        self.columns = list(genre_names) + list(extra)
+
+        # genre flags by item id, zero for ids which aren't in the item table
+        ids = items.ids[items.ids < nitems]
+        self.genres = np.zeros((nitems, len(genre_names)), dtype = np.uint8)
+        self.genres[ids] = items.get_genre_matrix(ids)
+
+        self.matrix = np.zeros((nitems, len(self.columns)), dtype = np.float32)
+        self.matrix[:, :len(genre_names)] = self.genres
+        for j, name in enumerate(extra):
+            self.matrix[:, len(genre_names) + j] = extra_columns[name](items, nitems, item_count)
+
+    def update(self, items, nitems, item_count = None):
+        """
+        Grows the features for new item ids and recomputes the columns in :py:data:`count_columns` in place after ratings
+        were added, the genres and the other columns of the known item ids are kept.
+
+        :param items:      the movies
+        :type items:       :py:class:`mrs.datamodel.tables.ItemTable`
+        :param nitems:     number of item ids
+        :type nitems:      int
+        :param item_count: number of ratings of every item id, needed for 'popularity'
+        :type item_count:  ndarray
+        """
+        old = len(self.matrix)
+        if nitems > old:
+            ids = items.ids[(items.ids >= old) & (items.ids < nitems)]
+            genres = np.zeros((nitems, len(genre_names)), dtype = np.uint8)
+            genres[:old] = self.genres
+            genres[ids] = items.get_genre_matrix(ids)
+            matrix = np.zeros((nitems, len(self.columns)), dtype = np.float32)
+            matrix[:old] = self.matrix
+            matrix[old:, :len(genre_names)] = genres[old:]
+            for j, name in enumerate(self.extra):
+                if name not in count_columns:
+                    matrix[old:, len(genre_names) + j] = extra_columns[name](items, nitems, item_count)[old:]
+            self.genres, self.matrix = genres, matrix
+        for j, name in enumerate(self.extra):
+            if name in count_columns:
+                self.matrix[:, len(genre_names) + j] = extra_columns[name](items, nitems, item_count)
+
+    def get_nfeatures(self):
+        """
+        :return: number of features of an item
+        :rtype:  int
+        """
+        return len(self.columns)
+
+    def gather(self, item_ids, dtype = np.float64):
+        """
+        :param item_ids: ids of the items
+        :type item_ids:  array_like
+        :param dtype:    type of the returned features
+        :type dtype:     type
+        :return: one row of features per item
+        :rtype:  ndarray
+        """
+        return np.take(self.matrix, np.asarray(item_ids, dtype = np.int64), axis = 0).astype(dtype, copy = False)
+
+    def gather_genres(self, item_ids):
+        """
+        :return: one row of *uint8* genre flags per item
+        :rtype:  ndarray
+        """
+        return np.take(self.genres, np.asarray(item_ids, dtype = np.int64), axis = 0)
@@ -3,57 +3,192 @@
 
 """this module will act as an intermediate through which other classes will get the data from"""
 
-from . import data_location
+# library packages
+import time
+import hashlib
+
+# third party packages
+import numpy as np
+
+from ..config import config
 from . import user_dataset, item_dataset, rating_dataset
 
-from .user import User
-from .item import Item
+from .tables import UserTable, ItemTable
 from .matrix import Matrix
+from .stats import RatingStats
+from .features import ItemFeatures, count_columns
+from .cache import DataCache
+from .stream import StreamingLoader, chunk_bytes
+from .deltalog import RatingLog, log_filename
+from .shared import SharedArrays
+
+# names of the parsed columns, in the order the fields appear in the data set files
+user_columns   = ('user_id', 'user_age', 'user_gender', 'user_occupation', 'user_zip_code')
+item_columns   = ('item_id', 'item_title', 'item_release_date', 'item_video_release_date', 'item_IMDb_URL', 'item_genres')
+rating_columns = ('rating_user', 'rating_item', 'rating_value', 'rating_timestamp')
+
+def read_ratings(path):
+    """
+    reads a file of ratings in the format of *u.data*, which is also the format of the *.base* and *.test* files of the folds
+
+    :param path: path of the file
+    :type path:  str
+    :return: user ids, item ids, ratings and timestamps
+    :rtype:  tuple
+    """
+    with open(path) as f:
+        ratings = np.array(f.read().split(), dtype = np.int64).reshape(-1, 4)
+    return ratings[:, 0].astype(np.int32), ratings[:, 1].astype(np.int32), ratings[:, 2].astype(np.int8), ratings[:, 3]
 
 class Data:
     """
     Loads the data from the dataset and puts the data in to variables for later processing.
     Any algorithm wants to access the data can call the function from this class to access a particular type of data.
-    :py:attr:`users` is a dict which contains the user ids as keys and instance of :py:class:`mrs.datamodel.user.User` as values
-    :py:attr:`items` is a dict which contains the item ids as keys and instance of :py:class:`mrs.datamodel.item.Item` as values
+    :py:attr:`users` is a :py:class:`mrs.datamodel.tables.UserTable` which maps the user ids to rows with the accessors of :py:class:`mrs.datamodel.user.User`
+    :py:attr:`items` is a :py:class:`mrs.datamodel.tables.ItemTable` which maps the item ids to rows with the accessors of :py:class:`mrs.datamodel.item.Item`
     
     .. note:: This class should act as an intermediate to access the data from the dataset. If any other type of data is needed then write a function in this class to convert the data into that type and return it
     
     .. todo:: if possible write the attributes in unordered list format
     """
     def __init__(self):
-        self._users   = {}
-        self._items   = {}
+        self._users   = UserTable()
+        self._items   = ItemTable()
+        self._columns = {}
 
-    def load_data(self):
+        # everything derived from the ratings (rating arrays, matrices, statistics), created once and dropped when the ratings change
+        self._memo         = {}
+        self._memo_version = None
+
+        # the features of the items by their extra columns, built when the data is loaded and updated by add_ratings
+        self._features = {}
+
+        # shape of the rating matrices when it isn't the one given by u.info, see load_stream and add_ratings
+        self._shape = None
+
+        # the file or directory the ratings were loaded from, see get_source
+        self._source = None
+
+        # functions called with the changed user ids and item ids after ratings are added, and the log the ratings are appended to
+        self._listeners = []
+        self._log       = None
+
+    def load_data(self, ratings = rating_dataset):
         """
         loads the dataset from *u.data* to :py:attr:`_users` and *u.item* to :py:attr:`_items` and adds the rating given by a user to its instance
+
+        The parsed columns are kept in a binary cache (see :py:mod:`mrs.datamodel.cache`), so only the first load parses the text files.
+        Later loads memory-map the cached columns as long as the source files are unchanged.
+
+        :param ratings: file of the data set the ratings are read from instead of *u.data*, e.g. the training part of a fold like */u1.base*
+        :type ratings:  str
+        """
+        data_location = config.get_data_location()
+        cache   = DataCache(data_location, [user_dataset, item_dataset, ratings], '' if ratings == rating_dataset else ratings.strip('/'))
+        columns = cache.load()
+        if columns is None:
+            columns = self.parse_dataset(data_location, ratings)
+            if len(columns) == len(user_columns) + len(item_columns) + len(rating_columns):
+                cache.save(columns)
+
+        self._columns = columns
+        self.create_objects(columns)
+        self._source = data_location + ratings
+        self._memo = {}
+        self._build_features()
+
+    def load_stream(self, location, nbytes = chunk_bytes, verbose = True):
         """
+        loads one of the large MovieLens data sets (ML-1M, ML-10M, ML-20M, ML-25M) from *location* in bounded memory chunks,
+        see :py:class:`mrs.datamodel.stream.StreamingLoader`. The raw user and movie ids are remapped to dense ids starting from 1,
+        the maps are kept in :py:attr:`user_ids` and :py:attr:`item_ids`
+
+        :param location: directory which contains *ratings.dat* or *ratings.csv*
+        :type location:  str
+        :param nbytes:   number of bytes of the ratings file read at once
+        :type nbytes:    int
+        :param verbose:  print the progress and the peak memory after every chunk
+        :type verbose:   bool
+        """
+        loader = StreamingLoader(location, nbytes, verbose)
+        loader.load()
+
+        self._users = loader.get_user_table()
+        self._items = loader.get_item_table()
+        self.user_ids, self.item_ids = loader.user_ids, loader.item_ids
+        self._shape = (len(self._users) + 1, len(self._items) + 1)
+        self._source = location
+        self._columns = {}
+        self._memo = {}
+        self._build_features()
+
+    def parse_dataset(self, data_location, ratings = rating_dataset):
+        """
+        parses *u.user*, *u.item* and *u.data* into columns
+
+        :param data_location: directory of the data set
+        :type data_location:  str
+        :param ratings:       file the ratings are read from
+        :type ratings:        str
+        :return: column name to ndarray, the columns of a missing file are left out
+        :rtype:  dict
+        """
+        columns = {}
         try:
-            for data in open(data_location + user_dataset):
-                l = data.strip().split('|')
-                self._users[int(l[0])] = User(l)
+            with open(data_location + user_dataset) as f:
+                rows = [data.strip().split('|') for data in f]
+            user_id, age, gender, occupation, zip_code = zip(*rows)
+            columns['user_id']         = np.array(user_id, dtype = np.int32)
+            columns['user_age']        = np.array(age, dtype = np.int16)
+            columns['user_gender']     = np.array(gender)
+            columns['user_occupation'] = np.array(occupation)
+            columns['user_zip_code']   = np.array(zip_code)
         except FileNotFoundError:
             print("The file couldn't be located")
 
         try:
-            for data in open(data_location + item_dataset, encoding = 'CP1252'):
-                l = data.strip().split('|')
-                self._items[int(l[0])] = Item(l)
+            with open(data_location + item_dataset, encoding = 'CP1252') as f:
+                rows = [data.strip().split('|') for data in f]
+            columns['item_id']                 = np.array([row[0] for row in rows], dtype = np.int32)
+            columns['item_title']              = np.array([row[1] for row in rows])
+            columns['item_release_date']       = np.array([row[2] for row in rows])
+            columns['item_video_release_date'] = np.array([row[3] for row in rows])
+            columns['item_IMDb_URL']           = np.array([row[4] for row in rows])
+            columns['item_genres']             = np.array([row[5:] for row in rows], dtype = np.uint8)
         except FileNotFoundError:
             print("The file couldn't be located")
 
         try:
-            for data in open(data_location + rating_dataset):
-                l = [int(val) for val in data.strip().split()]
-                self._users[l[0]].add_movie(l[1:])
+            users, items, values, timestamps = read_ratings(data_location + ratings)
+            columns['rating_user']      = users
+            columns['rating_item']      = items
+            columns['rating_value']     = values
+            columns['rating_timestamp'] = timestamps
         except FileNotFoundError:
             print("The file couldn't be located")
 
+        return columns
+
+    def create_objects(self, columns):
+        """
+        creates the :py:class:`mrs.datamodel.tables.UserTable` and :py:class:`mrs.datamodel.tables.ItemTable` from the parsed columns
+
+        :param columns: column name to ndarray as returned by :py:meth:`parse_dataset`
+        :type columns:  dict
+        """
+        if 'user_id' in columns:
+            self._users = UserTable(*(columns[name] for name in user_columns))
+
+        if 'item_id' in columns:
+            self._items = ItemTable(*(columns[name] for name in item_columns))
+
+        if 'rating_user' in columns:
+            self._users.set_ratings(*(columns[name] for name in rating_columns))
+
     def get_users(self):
         """
         :return: :py:attr:`_users`
-        :rtype:  dict
+        :rtype:  :py:class:`mrs.datamodel.tables.UserTable`
         """
         return self._users
 
@@ -65,7 +200,7 @@ class Data:
     def get_items(self):
         """
         :return: :py:attr:`_items`
-        :rtype:  dict
+        :rtype:  :py:class:`mrs.datamodel.tables.ItemTable`
         """
         return self._items
 
@@ -74,6 +209,105 @@ class Data:
         """
         return self._items[item_id]
 
+    def _memoize(self, key, create):
+        """
+        returns the value created by *create*, it is created only once and then reused until the ratings of :py:attr:`_users` change
+        """
+        if self._memo_version != self._users.version:
+            self._memo = {}
+            self._memo_version = self._users.version
+        if key not in self._memo:
+            self._memo[key] = create()
+        return self._memo[key]
+
+    def get_shape(self):
+        """
+        :return: shape of the rating matrices, the number of users and items plus one as the ids start from 1
+        :rtype:  tuple
+        """
+        if self._shape is not None:
+            return self._shape
+        return config.get_nusers() + 1, config.get_nitems() + 1
+
+    def get_ratings(self):
+        """
+        :return: user ids, item ids and ratings of all the ratings as contiguous arrays, one entry per rating
+        :rtype:  tuple
+        """
+        return self._memoize('ratings', self._users.get_rating_arrays)
+
+    def get_fingerprint(self):
+        """
+        :return: hash of the shape and of all the ratings, it changes as soon as a rating is added or changed, e.g. to find
+                 out if something computed from the ratings and saved is stale
+        :rtype:  str
+        """
+        def create():
+            h = hashlib.sha1(repr(self.get_shape()).encode())
+            for column in self.get_ratings():
+                h.update(np.ascontiguousarray(column).view(np.uint8))
+            return h.hexdigest()
+        return self._memoize('fingerprint', create)
+
+    def get_source(self):
+        """
+        :return: the ratings file or the directory the data set was loaded from, None if it wasn't loaded from a file,
+                 e.g. to tell apart things saved for different data sets or folds
+        :rtype:  str
+        """
+        return self._source
+
+    def get_user_fingerprints(self):
+        """
+        :return: hash of the ratings of every user id, the one of a user changes as soon as one of its ratings is added or
+                 changed, e.g. to find out which users something computed from the ratings and saved is stale for
+        :rtype:  ndarray
+        """
+        def create():
+            users, items, ratings = self.get_ratings()
+            h = (np.asarray(items, dtype = np.uint64) << np.uint64(8)) + np.rint(np.asarray(ratings, dtype = np.float64) * 2).astype(np.uint64) + np.uint64(1)
+            # mix every rating with the finalizer of splitmix64, the sum of the ratings of a user doesn't depend on their order
+            h = (h ^ (h >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+            h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+            h ^= h >> np.uint64(31)
+            fingerprints = np.zeros(self.get_shape()[0], dtype = np.uint64)
+            np.add.at(fingerprints, np.asarray(users, dtype = np.int64), h)
+            return fingerprints
+        return self._memoize('user_fingerprints', create)
+
+    def get_stats(self):
+        """
+        :return: count, sum, mean and variance of the ratings of every user and item, computed once and recomputed only after ratings are added
+        :rtype:  :py:class:`mrs.datamodel.stats.RatingStats`
+        """
+        return self._memoize('stats', lambda: RatingStats(*self.get_ratings(), shape = self.get_shape()))
+
+    def _get_item_count(self, extra):
+        """
+        :return: number of ratings of every item id if one of the columns in *extra* is computed from it, None otherwise
+        :rtype:  ndarray
+        """
+        return self.get_stats().item_count if set(extra) & set(count_columns) else None
+
+    def _build_features(self):
+        """
+        builds the genre features of the items when the data is loaded, the features with extra columns are dropped
+        """
+        self._features = {(): ItemFeatures(self._items, self.get_shape()[1])}
+
+    def get_item_features(self, extra = ()):
+        """
+        :param extra: names of extra columns after the genres, see :py:data:`mrs.datamodel.features.extra_columns`
+        :type extra:  tuple
+        :return: the features of every item id. The genres are built when the data is loaded and the extra columns the first
+                 time they are asked for, both are kept and updated in place by :py:meth:`add_ratings`
+        :rtype:  :py:class:`mrs.datamodel.features.ItemFeatures`
+        """
+        extra = tuple(extra)
+        if extra not in self._features:
+            self._features[extra] = ItemFeatures(self._items, self.get_shape()[1], extra, self._get_item_count(extra))
+        return self._features[extra]
+
     def get_rating_matrix_with_nan(self):
         """
         :return: :py:attr:`mrs.datamodel.matrix.Matrix.rating_matrix`
@@ -90,19 +324,161 @@ class Data:
         1.0
         >>> r[244, 51]
         2.0
+
+        .. note:: the matrix is created once and shared by every caller, copy it before modifying it
         """
-        m = Matrix()
-        return m.create_rating_matrix(self._users)
+        return self._memoize('nan', lambda: Matrix().create_rating_matrix(self.get_ratings(), shape = self.get_shape()))
 
 
     def get_rating_matrix_with_zero(self):
         """
         :return: the user item matrix with missing values as zero
+
+        .. note:: the matrix is created once and shared by every caller, copy it before modifying it
+        """
+        return self._memoize('zero', lambda: Matrix().create_rating_matrix_with_missing_as_zero(self.get_ratings(), shape = self.get_shape()))
+
+    def get_sparse_rating_matrix(self, dtype = np.float32):
+        """
+        :param dtype: type of the stored ratings, *int8* or *float32*
+        :type dtype:  numpy.dtype
+        :return: the user item matrix which only stores the given ratings, missing ratings read as nan for float types and zero for integer types
+        :rtype:  :py:class:`mrs.datamodel.matrix.SparseRatingMatrix`
+        """
+        return self._memoize(('sparse', np.dtype(dtype).str), lambda: Matrix().create_sparse_rating_matrix(self.get_ratings(), dtype, shape = self.get_shape()))
+
+    def publish(self, extra = None, path = None):
+        """
+        Publishes the tables, the rating matrix with nan and the statistics once into shared memory so that worker processes
+        attach to them with :py:meth:`attach` instead of loading the data set and building the matrix each.
+
+        :Example:
+
+        >>> shared = d.publish({'correlation': knn.correlation_matrix})
+        >>> handle = shared.get_handle()               # picklable, pass it to the workers
+        >>> w = loaddata.Data()                        # in a worker
+        >>> view = w.attach(SharedArrays.attach(handle))
+        >>> knn = KNN(w, correlation_matrix = view['correlation'])
+
+        :param extra: more arrays to publish by name, e.g. a similarity matrix
+        :type extra:  dict
+        :param path:  memory-mapped file to publish to instead of shared memory
+        :type path:   str
+        :return: the published arrays, call :py:meth:`mrs.datamodel.shared.SharedArrays.unlink` after the workers are done
+        :rtype:  :py:class:`mrs.datamodel.shared.SharedArrays`
         """
-        return Matrix().create_rating_matrix_with_missing_as_zero(self._users)
+        arrays = {'shape': np.array(self.get_shape(), dtype = np.int64), 'rating_matrix': self.get_rating_matrix_with_nan()}
+        for prefix, values in (('users/', self._users.get_arrays()), ('items/', self._items.get_arrays()), ('stats/', self.get_stats().get_arrays())):
+            for name, array in values.items():
+                arrays[prefix + name] = array
+        arrays.update(extra or {})
+        return SharedArrays.publish(arrays, path)
+
+    def attach(self, shared):
+        """
+        Uses the arrays published by :py:meth:`publish` in another process as the data of this one, nothing is copied.
+        The attached arrays are read only, ratings added later are applied to copies.
+
+        :param shared: the attached arrays
+        :type shared:  :py:class:`mrs.datamodel.shared.SharedArrays`
+        :return: *shared*, which also holds the extra arrays given to :py:meth:`publish`
+        :rtype:  :py:class:`mrs.datamodel.shared.SharedArrays`
+        """
+        def group(prefix):
+            return {name[len(prefix):]: shared[name] for name in shared.keys() if name.startswith(prefix)}
+
+        self._users = UserTable.from_arrays(group('users/'))
+        self._items = ItemTable.from_arrays(group('items/'))
+        self._shape = tuple(shared['shape'].tolist())
+        self._columns = {}
+        self._memo = {'nan': shared['rating_matrix'], 'stats': RatingStats.from_arrays(group('stats/'))}
+        self._memo_version = self._users.version
+        self._build_features()
+        return shared
+
+    def add_listener(self, listener):
+        """
+        :param listener: called as *listener(user_ids, item_ids)* with the ids whose ratings changed every time ratings are added
+        :type listener:  callable
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """
+        :param listener: a listener given to :py:meth:`add_listener`
+        :type listener:  callable
+        """
+        self._listeners.remove(listener)
+
+    def open_log(self, path = None):
+        """
+        Attaches the append-only log of added ratings (see :py:mod:`mrs.datamodel.deltalog`) and replays the ratings already in it.
+        Every later call of :py:meth:`add_ratings` appends to it.
+
+        :param path: path of the log, by default *ratings.log* in the model location of :py:data:`mrs.config.config`
+        :type path:  str
+        """
+        self._log = RatingLog(path or config.get_model_path(log_filename))
+        users, items, ratings, timestamps = self._log.read()
+        if len(users):
+            self.add_ratings((users, items, ratings, timestamps), log = False)
+
+    def add_ratings(self, batch, log = True):
+        """
+        Adds a batch of new or changed ratings without reloading anything.
+
+        The user tables are updated, the dense rating matrices, the statistics and the item features already created are updated in place
+        and the rating arrays and sparse matrices are recreated on their next use. Then every listener is called with the
+        ids of the users and items whose ratings changed. Unknown users are added, if a user or item id is beyond the current
+        matrices they are recreated with the larger shape instead.
+
+        :param batch: *(user ids, item ids, ratings)* or *(user ids, item ids, ratings, timestamps)* arrays, or a list of such tuples one per rating
+        :type batch:  tuple
+        :param log:   append the batch to the log opened by :py:meth:`open_log`
+        :type log:    bool
+        """
+        if isinstance(batch, list):
+            batch = tuple(zip(*batch))
+        users, items, ratings = (np.asarray(column) for column in batch[:3])
+        if len(users) == 0:
+            return
+        timestamps = np.asarray(batch[3]) if len(batch) > 3 else np.full(len(users), fill_value = int(time.time()), dtype = np.int64)
+
+        if log and self._log is not None:
+            self._log.append(users, items, ratings, timestamps)
+
+        in_place = self._memo_version == self._users.version
+        users, items, ratings, timestamps, previous = self._users.add_ratings(users, items, ratings, timestamps)
+
+        shape = self.get_shape()
+        if users.max() >= shape[0] or items.max() >= shape[1]:
+            self._shape = (max(shape[0], int(users.max()) + 1), max(shape[1], int(items.max()) + 1))
+            in_place = False
+
+        if in_place:
+            memo = {}
+            for key, value in self._memo.items():
+                # arrays attached from another process are read only, they are recreated instead
+                if key in ('nan', 'zero') and value.flags.writeable:
+                    value[users, items] = ratings
+                    memo[key] = value
+                elif key == 'stats' and value.user_count.flags.writeable:
+                    value.update(users, items, ratings, previous)
+                    memo[key] = value
+            self._memo = memo
+            self._memo_version = self._users.version
+
+        # the popularity of the items changes with their number of ratings
+        for extra, features in self._features.items():
+            features.update(self._items, self.get_shape()[1], self._get_item_count(extra))
+
+        changed_users, changed_items = np.unique(users), np.unique(items)
+        for listener in self._listeners:
+            listener(changed_users, changed_items)
 
     def get_mean_rating_of_user(self, a):
         """
+        :return: mean rating of the user, looked up in :py:meth:`get_stats`
+        :rtype:  float
         """
-        
-        return self._users[a].mean_rating()
+        return self.get_stats().get_user_mean(a)
@@ -2,37 +2,252 @@
 # -*- coding: utf-8 -*-
 
 import numpy as np
-from . import data_location, info
-from . import nusers, nitems
+from ..config import config
 
 class Matrix:
     """
+    Creates the user item rating matrices.
+
+    Every method accepts the ratings either as a dict of users (see :py:meth:`ratings_from_users`) or directly as
+    a tuple of contiguous *user ids*, *item ids* and *ratings* arrays, which is what :py:class:`mrs.datamodel.loaddata.Data` keeps.
+    The dense matrices are then filled with a single fancy-index assignment.
     """
-    def create_rating_matrix(self, users):
+    @staticmethod
+    def ratings_from_users(users):
         """
-        The first row and first column will be blank and should not be used as the user id and item id starts from 1
-        
-        :param users: contains user ids as keys and instance of :py:mod:`mrs.datamodel.user.User` as values
+        :param users: contains user ids as keys and instance of :py:mod:`mrs.datamodel.user.User` (or a row of a :py:class:`mrs.datamodel.tables.UserTable`) as values
         :type users:  dict
+        :return: user ids, item ids and ratings of all the ratings
+        :rtype:  tuple
         """
-        rating_matrix = np.full(([nusers + 1, nitems + 1]), fill_value = np.nan)
-        
+        user_ids, item_ids, ratings = [], [], []
         for user_id, user_profile in users.items():
             for movie, rating in user_profile.get_movie_rating().items():
-                rating_matrix[user_id, movie] = rating[0]
+                user_ids.append(user_id)
+                item_ids.append(movie)
+                ratings.append(rating[0])
+
+        return np.array(user_ids, dtype = np.int64), np.array(item_ids, dtype = np.int64), np.array(ratings, dtype = np.float64)
+
+    def _ratings(self, users):
+        if isinstance(users, tuple):
+            return users
+        return self.ratings_from_users(users)
+
+    @staticmethod
+    def _shape(shape):
+        if shape is None:
+            return config.get_nusers() + 1, config.get_nitems() + 1
+        return shape
+
+    def create_rating_matrix(self, users, fill_value = np.nan, shape = None):
+        """
+        The first row and first column will be blank and should not be used as the user id and item id starts from 1
+        
+        :param users: contains user ids as keys and instance of :py:mod:`mrs.datamodel.user.User` as values, or a tuple of user ids, item ids and ratings arrays
+        :type users:  dict
+        :param fill_value: value of the missing ratings
+        :type fill_value:  float
+        :param shape: number of rows and columns, by default one more than the number of users and items of the data set in :py:data:`mrs.config.config`
+        :type shape:  tuple
+        """
+        user_ids, item_ids, ratings = self._ratings(users)
+
+        rating_matrix = np.full(self._shape(shape), fill_value = fill_value)
+        rating_matrix[user_ids, item_ids] = ratings
 
         return rating_matrix
 
 
-    def create_rating_matrix_with_missing_as_zero(self, users):
+    def create_rating_matrix_with_missing_as_zero(self, users, shape = None):
         """
         Same as :py:meth:`create_rating_matrix` except the missing values are zeros instead of nan
         """
-        
-        rating_matrix = np.zeros(([nusers + 1, nitems + 1]))
+        return self.create_rating_matrix(users, fill_value = 0., shape = shape)
 
-        for user_id, user_profile in users.items():
-            for movie, rating in user_profile.get_movie_rating().items():
-                rating_matrix[user_id, movie] = rating[0]
 
-        return rating_matrix
+    def create_sparse_rating_matrix(self, users, dtype = np.float32, shape = None):
+        """
+        Same as :py:meth:`create_rating_matrix` except only the given ratings are stored, see :py:class:`SparseRatingMatrix`
+
+        :param dtype: type of the stored ratings, *int8* or *float32* are enough for ratings from 1 to 5
+        :type dtype:  numpy.dtype
+        """
+        user_ids, item_ids, ratings = self._ratings(users)
+
+        return SparseRatingMatrix(user_ids, item_ids, ratings, self._shape(shape), dtype)
+
+class SparseRatingMatrix:
+    """
+    User item rating matrix which only stores the given ratings.
+
+    The ratings are kept twice, once row wise (CSR) to access the ratings of a user and once column wise (CSC) to access the ratings of an item.
+    Like the dense matrices the first row and first column are never used as the user id and item id starts from 1.
+    Reading a single row or a block of rows gives a dense ndarray, so code written for the dense matrices can work on it one row at a time.
+
+    :param users:   user id of every rating
+    :type users:    array_like
+    :param items:   item id of every rating
+    :type items:    array_like
+    :param ratings: the ratings
+    :type ratings:  array_like
+    :param shape:   number of rows and columns of the equivalent dense matrix
+    :type shape:    tuple
+    :param dtype:   type of the stored ratings
+    :type dtype:    numpy.dtype
+    :param fill_value: value of the missing ratings when the matrix is read densely, by default *nan* for float types and 0 for integer types
+    :type fill_value:  float
+    """
+    def __init__(self, users, items, ratings, shape, dtype = np.float32, fill_value = None):
+        users   = np.asarray(users, dtype = np.int64)
+        items   = np.asarray(items, dtype = np.int64)
+        ratings = np.asarray(ratings)
+
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        if fill_value is None:
+            fill_value = np.nan if self.dtype.kind == 'f' else 0
+        self.fill_value = fill_value
+
+        # CSR, ratings ordered by user and then by item
+        order = np.lexsort((items, users))
+        self.indptr  = self._pointers(users[order], self.shape[0])
+        self.indices = items[order].astype(np.int32)
+        self.data    = ratings[order].astype(self.dtype)
+
+        # CSC, ratings ordered by item and then by user
+        order = np.lexsort((users, items))
+        self.col_indptr  = self._pointers(items[order], self.shape[1])
+        self.col_indices = users[order].astype(np.int32)
+        self.col_data    = ratings[order].astype(self.dtype)
+
+    @staticmethod
+    def _pointers(ids, n):
+        """
+        :return: offsets where the entries of every id start in the sorted *ids*, with a final entry for the end
+        :rtype:  ndarray
+        """
+        indptr = np.zeros(n + 1, dtype = np.int64)
+        np.cumsum(np.bincount(ids, minlength = n)[:n], out = indptr[1:])
+        return indptr
+
+    def nnz(self):
+        """
+        :return: number of stored ratings
+        :rtype:  int
+        """
+        return len(self.data)
+
+    def get_row(self, user_id):
+        """
+        :return: item ids and ratings given by the user, both are views into the matrix
+        :rtype:  tuple
+        """
+        start, stop = self.indptr[user_id], self.indptr[user_id + 1]
+        return self.indices[start:stop], self.data[start:stop]
+
+    def get_column(self, item_id):
+        """
+        :return: user ids and ratings given to the item, both are views into the matrix
+        :rtype:  tuple
+        """
+        start, stop = self.col_indptr[item_id], self.col_indptr[item_id + 1]
+        return self.col_indices[start:stop], self.col_data[start:stop]
+
+    def get_rows(self, user_ids):
+        """
+        :param user_ids: ids of the users, a slice of ids is also accepted
+        :type user_ids:  list
+        :return: dense block of the ratings of the users with missing ratings as :py:attr:`fill_value`
+        :rtype:  ndarray
+        """
+        if isinstance(user_ids, slice):
+            user_ids = range(*user_ids.indices(self.shape[0]))
+        user_ids = np.asarray(user_ids, dtype = np.int64)
+
+        block = np.full((len(user_ids), self.shape[1]), fill_value = self.fill_value, dtype = np.float64)
+        counts = self.indptr[user_ids + 1] - self.indptr[user_ids]
+        rows   = np.repeat(np.arange(len(user_ids)), counts)
+        offset = np.repeat(self.indptr[user_ids] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        block[rows, self.indices[offset]] = self.data[offset]
+        return block
+
+    def get_columns(self, item_ids):
+        """
+        :param item_ids: ids of the items, a slice of ids is also accepted
+        :type item_ids:  list
+        :return: dense block of the ratings given to the items, one column per item, with missing ratings as :py:attr:`fill_value`
+        :rtype:  ndarray
+        """
+        if isinstance(item_ids, slice):
+            item_ids = range(*item_ids.indices(self.shape[1]))
+        item_ids = np.asarray(item_ids, dtype = np.int64)
+
+        block = np.full((self.shape[0], len(item_ids)), fill_value = self.fill_value, dtype = np.float64)
+        counts = self.col_indptr[item_ids + 1] - self.col_indptr[item_ids]
+        cols   = np.repeat(np.arange(len(item_ids)), counts)
+        offset = np.repeat(self.col_indptr[item_ids] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        block[self.col_indices[offset], cols] = self.col_data[offset]
+        return block
+
+    def get_rating(self, user_id, item_id):
+        """
+        :return: the rating given by the user to the item or :py:attr:`fill_value` if it is not rated
+        :rtype:  float
+        """
+        items, ratings = self.get_row(user_id)
+        i = np.searchsorted(items, item_id)
+        if i < len(items) and items[i] == item_id:
+            return ratings[i]
+        return self.fill_value
+
+    def __getitem__(self, key):
+        """
+        *m[user_id, item_id]* gives a single rating like :py:meth:`get_rating`, *m[user_id]* gives a dense row and *m[start:stop]* a dense block of rows
+        """
+        if isinstance(key, tuple):
+            return self.get_rating(*key)
+        if isinstance(key, slice):
+            return self.get_rows(key)
+        return self.get_rows([key])[0]
+
+    def __len__(self):
+        return self.shape[0]
+
+    def row_nnz(self):
+        """
+        :return: number of ratings given by every user
+        :rtype:  ndarray
+        """
+        return np.diff(self.indptr)
+
+    def col_nnz(self):
+        """
+        :return: number of ratings given to every item
+        :rtype:  ndarray
+        """
+        return np.diff(self.col_indptr)
+
+    def row_means(self):
+        """
+        :return: mean rating of every user, *nan* for users without ratings
+        :rtype:  ndarray
+        """
+        counts = self.row_nnz()
+        sums   = np.bincount(np.repeat(np.arange(self.shape[0]), counts), weights = self.data, minlength = self.shape[0])
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            return np.where(counts > 0, sums / counts, np.nan)
+
+    def get_mean_rating_of_user(self, user_id):
+        """
+        :return: mean rating of the user
+        :rtype:  float
+        """
+        return float(self.get_row(user_id)[1].mean(dtype = np.float64))
+
+    def toarray(self):
+        """
+        :return: the equivalent dense matrix with missing ratings as :py:attr:`fill_value`
+        :rtype:  ndarray
+        """
+        return self.get_rows(slice(None))
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module: shared
+   :synopsis: named arrays published once and attached zero-copy by other processes
+
+A process publishes its arrays (e.g. the rating matrix, the statistics and a similarity matrix) into one block of
+:py:mod:`multiprocessing.shared_memory`, or into a memory-mapped file when a path is given. Every worker process attaches
+to that block with the small picklable handle returned by :py:meth:`SharedArrays.get_handle` and gets read only ndarrays
+which are views of the same pages, so N workers use one copy of the data instead of N.
+
+:Example:
+
+>>> shared = SharedArrays.publish({'rating_matrix': r})
+>>> handle = shared.get_handle()          # send this to the workers
+>>> view = SharedArrays.attach(handle)    # in a worker
+>>> view['rating_matrix'][196, 242]
+3.0
+"""
+
+# library packages
+import os
+import uuid
+import tempfile
+import multiprocessing
+
+# third party packages
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # python older than 3.8, only memory-mapped files can be used
+    shared_memory = None
+
+# every array starts at a multiple of this many bytes
+alignment = 64
+
+def _layout(arrays):
+    """
+    :return: offset, shape and dtype of every array in the block and the size of the block
+    :rtype:  tuple
+    """
+    layout, size = {}, 0
+    for name, array in arrays.items():
+        size = -(-size // alignment) * alignment
+        layout[name] = (size, array.shape, array.dtype.str)
+        size += array.nbytes
+    return layout, max(size, 1)
+
+class SharedArrays:
+    """
+    Named ndarrays in one shared block, create it with :py:meth:`publish` or :py:meth:`attach` rather than directly
+    """
+    def __init__(self, backend, name, layout, buffer, owner, handle_object = None):
+        self._backend = backend
+        self._name    = name
+        self._layout  = layout
+        self._buffer  = buffer
+        self._owner   = owner
+        self._object  = handle_object
+
+        self._arrays = {}
+        for key, (offset, shape, dtype) in layout.items():
+            array = np.ndarray(shape, dtype = np.dtype(dtype), buffer = buffer, offset = offset)
+            if not owner:
+                array.flags.writeable = False
+            self._arrays[key] = array
+
+    @classmethod
+    def publish(cls, arrays, path = None):
+        """
+        Copies the arrays into a new shared block
+
+        :param arrays: name to ndarray
+        :type arrays:  dict
+        :param path:   memory-mapped file to use instead of shared memory, it is also used if shared memory isn't available
+        :type path:    str
+        :return: the published arrays, the owner has to call :py:meth:`unlink` when the workers are done
+        :rtype:  :py:class:`SharedArrays`
+        """
+        arrays = {name: np.ascontiguousarray(array) for name, array in arrays.items()}
+        layout, size = _layout(arrays)
+
+        if path is None and shared_memory is not None:
+            shm = shared_memory.SharedMemory(name = 'mrs_' + uuid.uuid4().hex[:16], create = True, size = size)
+            shared = cls('shm', shm.name, layout, shm.buf, True, shm)
+        else:
+            if path is None:
+                path = os.path.join(tempfile.gettempdir(), 'mrs_shared_' + uuid.uuid4().hex[:16] + '.bin')
+            mm = np.memmap(path, dtype = np.uint8, mode = 'w+', shape = (size,))
+            shared = cls('file', path, layout, mm, True, mm)
+
+        for name, array in arrays.items():
+            shared._arrays[name][...] = array
+        return shared
+
+    @classmethod
+    def attach(cls, handle):
+        """
+        :param handle: handle returned by :py:meth:`get_handle` of the published arrays
+        :type handle:  tuple
+        :return: read only views of the published arrays
+        :rtype:  :py:class:`SharedArrays`
+        """
+        backend, name, layout = handle
+        if backend == 'shm':
+            try:
+                # python 3.13+, attaching must not make this process responsible for removing the block
+                shm = shared_memory.SharedMemory(name = name, track = False)
+            except TypeError:
+                shm = shared_memory.SharedMemory(name = name)
+                # child processes share the resource tracker of the publisher, only an unrelated process has its own one
+                # which would remove the block when this process exits
+                if multiprocessing.parent_process() is None:
+                    from multiprocessing import resource_tracker
+                    resource_tracker.unregister(shm._name, 'shared_memory')
+            return cls(backend, name, layout, shm.buf, False, shm)
+
+        mm = np.memmap(name, dtype = np.uint8, mode = 'r')
+        return cls(backend, name, layout, mm, False, mm)
+
+    def get_handle(self):
+        """
+        :return: small picklable description of the block to pass to the worker processes
+        :rtype:  tuple
+        """
+        return self._backend, self._name, self._layout
+
+    def __getitem__(self, name):
+        return self._arrays[name]
+
+    def __contains__(self, name):
+        return name in self._arrays
+
+    def keys(self):
+        return self._arrays.keys()
+
+    def close(self):
+        """
+        releases the views of this process, the arrays returned before must not be used any more
+        """
+        self._arrays = {}
+        self._buffer = None
+        self._release()
+
+    def unlink(self):
+        """
+        closes and removes the block, only the process which published it should call this after all the workers are done
+        """
+        self._arrays = {}
+        self._buffer = None
+        obj = self._object
+        self._release()
+        if self._backend == 'shm':
+            obj.unlink()
+        else:
+            os.remove(self._name)
+
+    def _release(self):
+        if self._backend == 'shm' and self._object is not None:
+            try:
+                self._object.close()
+            except BufferError:
+                # arrays handed out before are still alive, the block is unmapped when they are garbage collected
+                pass
+        self._object = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self._owner:
+            self.unlink()
+        else:
+            self.close()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module: stats
+   :synopsis: per user and per item rating statistics
+"""
+
+# third party packages
+import numpy as np
+
+class RatingStats:
+    """
+    Count, sum, mean and variance of the ratings of every user and every item and the mean of all the ratings.
+    Everything is computed once with vectorized reductions over the rating arrays, after that every lookup is a single array access.
+    Added ratings are folded in with :py:meth:`update` without going over all the ratings again.
+
+    The arrays are indexed by id, like the rows and columns of the rating matrices, users and items without ratings have a count
+    of zero and a mean and variance of nan.
+
+    :param users:   user id of every rating
+    :type users:    ndarray
+    :param items:   item id of every rating
+    :type items:    ndarray
+    :param ratings: the ratings
+    :type ratings:  ndarray
+    :param shape:   number of user ids and item ids, the shape of the rating matrices
+    :type shape:    tuple
+    """
+    def __init__(self, users, items, ratings, shape):
+        ratings = np.asarray(ratings, dtype = np.float64)
+
+        self.user_count, self.user_sum, self.user_square = self._reduce(users, ratings, shape[0])
+        self.item_count, self.item_sum, self.item_square = self._reduce(items, ratings, shape[1])
+        self.user_mean, self.user_var = self._moments(self.user_count, self.user_sum, self.user_square)
+        self.item_mean, self.item_var = self._moments(self.item_count, self.item_sum, self.item_square)
+
+        self._count, self._sum = len(ratings), ratings.sum()
+        self.global_mean = self._sum / self._count if self._count else np.nan
+
+    # names of the arrays returned by get_arrays
+    array_names = ('user_count', 'user_sum', 'user_square', 'user_mean', 'user_var',
+                   'item_count', 'item_sum', 'item_square', 'item_mean', 'item_var')
+
+    def get_arrays(self):
+        """
+        :return: every array of the statistics by name, the global count and sum as *totals*
+        :rtype:  dict
+        """
+        arrays = {name: getattr(self, name) for name in self.array_names}
+        arrays['totals'] = np.array([self._count, self._sum], dtype = np.float64)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """
+        :param arrays: the arrays returned by :py:meth:`get_arrays`, they are used as they are without copying
+        :type arrays:  dict
+        :return: the statistics over the arrays
+        :rtype:  :py:class:`RatingStats`
+        """
+        stats = cls.__new__(cls)
+        for name in cls.array_names:
+            setattr(stats, name, arrays[name])
+        stats._count, stats._sum = int(arrays['totals'][0]), float(arrays['totals'][1])
+        stats.global_mean = stats._sum / stats._count if stats._count else np.nan
+        return stats
+
+    @staticmethod
+    def _reduce(ids, ratings, n):
+        """
+        :return: count, sum and sum of squares of the ratings grouped by id
+        :rtype:  tuple
+        """
+        count = np.bincount(ids, minlength = n).astype(np.int64)
+        total = np.bincount(ids, weights = ratings, minlength = n)
+        square = np.bincount(ids, weights = ratings ** 2, minlength = n)
+        return count, total, square
+
+    @staticmethod
+    def _moments(count, total, square):
+        """
+        :return: mean and variance from the count, sum and sum of squares
+        :rtype:  tuple
+        """
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            mean = np.where(count > 0, total / count, np.nan)
+            var  = np.where(count > 0, np.maximum(square / count - mean ** 2, 0), np.nan)
+        return mean, var
+
+    def update(self, users, items, ratings, previous):
+        """
+        Updates the statistics in place for added or changed ratings, only the entries of the given users and items are recomputed
+
+        :param users:    user id of every rating
+        :type users:     ndarray
+        :param items:    item id of every rating
+        :type items:     ndarray
+        :param ratings:  the new ratings
+        :type ratings:   ndarray
+        :param previous: the ratings they replace, nan for new ratings
+        :type previous:  ndarray
+        """
+        ratings  = np.asarray(ratings, dtype = np.float64)
+        previous = np.asarray(previous, dtype = np.float64)
+        new  = np.isnan(previous)
+        prev = np.where(new, 0, previous)
+
+        for ids, count, total, square, mean, var in ((users, self.user_count, self.user_sum, self.user_square, self.user_mean, self.user_var),
+                                                     (items, self.item_count, self.item_sum, self.item_square, self.item_mean, self.item_var)):
+            np.add.at(count, ids, new)
+            np.add.at(total, ids, ratings - prev)
+            np.add.at(square, ids, ratings ** 2 - prev ** 2)
+            changed = np.unique(ids)
+            mean[changed], var[changed] = self._moments(count[changed], total[changed], square[changed])
+
+        self._count += int(new.sum())
+        self._sum   += (ratings - prev).sum()
+        self.global_mean = self._sum / self._count if self._count else np.nan
+
+    def get_user_mean(self, user_id):
+        """
+        :return: mean rating of the user
+        :rtype:  float
+        """
+        return self.user_mean[user_id]
+
+    def get_item_mean(self, item_id):
+        """
+        :return: mean rating of the item
+        :rtype:  float
+        """
+        return self.item_mean[item_id]
+
+    def get_global_mean(self):
+        """
+        :return: mean of all the ratings
+        :rtype:  float
+        """
+        return self.global_mean
@@ -0,0 +1,290 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module: stream
+   :synopsis: chunked loader for the large MovieLens data sets (ML-1M, ML-10M, ML-20M, ML-25M)
+
+The ratings file (*ratings.dat* with *::* separated fields or *ratings.csv* with a header line) is read in chunks of a bounded
+number of bytes through a generator, so only one chunk of text is in memory at any time. The raw user and movie ids of those
+data sets are sparse, they are remapped to dense ids starting from 1 by :py:class:`IdMap` and the ratings are written straight
+into preallocated arrays which become the :py:class:`mrs.datamodel.tables.UserTable` and :py:class:`mrs.datamodel.tables.ItemTable`
+used by :py:class:`mrs.datamodel.loaddata.Data`.
+
+:Example:
+
+>>> from mrs.datamodel import loaddata
+>>> d = loaddata.Data()
+>>> d.load_stream('ml-20m')
+"""
+
+# library packages
+import os
+import csv
+
+# third party packages
+import numpy as np
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, the peak memory is then not reported
+    resource = None
+
+from . import genre_names
+from .tables import UserTable, ItemTable
+
+# default number of bytes of the ratings file read at once
+chunk_bytes = 64 * 1024 * 1024
+
+# file name of every part of the data set, the separator of its fields and if it starts with a header line
+formats = {
+    '.dat': {'ratings': 'ratings.dat', 'movies': 'movies.dat', 'users': 'users.dat', 'separator': b'::', 'header': False, 'encoding': 'latin-1'},
+    '.csv': {'ratings': 'ratings.csv', 'movies': 'movies.csv', 'users': None,        'separator': b',',  'header': True,  'encoding': 'utf-8'},
+}
+
+# genre names of the large data sets which are spelled differently in :py:data:`mrs.datamodel.genre_names`
+genre_aliases = {'Children': "Children's", '(no genres listed)': 'unknown'}
+
+def peak_rss():
+    """
+    :return: peak resident set size of this process in MB, None if it can't be measured on this platform
+    :rtype:  float
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024 if os.uname().sysname == 'Darwin' else 1024)
+
+def detect_format(location):
+    """
+    :param location: directory of the data set
+    :type location:  str
+    :return: the entry of :py:data:`formats` of the ratings file found in *location*
+    :rtype:  dict
+    :raises FileNotFoundError: if there is neither *ratings.dat* nor *ratings.csv*
+    """
+    for fmt in formats.values():
+        if os.path.exists(os.path.join(location, fmt['ratings'])):
+            return fmt
+    raise FileNotFoundError("no ratings.dat or ratings.csv in %s" % location)
+
+def rating_chunks(path, separator, header, nbytes = chunk_bytes):
+    """
+    Generator over the ratings file, every chunk holds the ratings of roughly *nbytes* bytes of the file
+
+    :param path:      path of the ratings file
+    :type path:       str
+    :param separator: separator of the fields
+    :type separator:  bytes
+    :param header:    True if the first line is a header
+    :type header:     bool
+    :param nbytes:    number of bytes read at once
+    :type nbytes:     int
+    :return: raw user ids, raw item ids, ratings and timestamps of one chunk
+    :rtype:  tuple
+    """
+    with open(path, 'rb') as f:
+        if header:
+            f.readline()
+        while True:
+            lines = f.readlines(nbytes)
+            if not lines:
+                break
+            values = np.fromstring(b''.join(lines).replace(separator, b' '), dtype = np.float64, sep = ' ').reshape(-1, 4)
+            del lines
+            yield values[:, 0].astype(np.int64), values[:, 1].astype(np.int64), values[:, 2].astype(np.float32), values[:, 3].astype(np.int64)
+
+class IdMap:
+    """
+    Maps sparse raw ids to dense ids 1, 2, 3, ... in the order they are first seen.
+    The known raw ids are kept sorted so a whole chunk of ids is mapped with one :py:func:`numpy.searchsorted`.
+    """
+    def __init__(self):
+        self._raw   = np.zeros(0, dtype = np.int64)
+        self._dense = np.zeros(0, dtype = np.int32)
+
+    def __len__(self):
+        return len(self._raw)
+
+    def map(self, raw_ids):
+        """
+        :param raw_ids: raw ids, the ones not seen before get the next free dense ids
+        :type raw_ids:  ndarray
+        :return: the dense ids
+        :rtype:  ndarray
+        """
+        raw_ids = np.asarray(raw_ids, dtype = np.int64)
+
+        # new ids are numbered in the order of their first occurrence
+        unique, first = np.unique(raw_ids, return_index = True)
+        pos   = np.searchsorted(self._raw, unique)
+        known = (pos < len(self._raw)) & (self._raw[np.minimum(pos, len(self._raw) - 1)] == unique) if len(self._raw) else np.zeros(len(unique), dtype = bool)
+        new   = unique[~known][np.argsort(first[~known])]
+
+        if len(new):
+            raw   = np.concatenate([self._raw, new])
+            dense = np.concatenate([self._dense, np.arange(len(self._raw) + 1, len(raw) + 1, dtype = np.int32)])
+            order = np.argsort(raw)
+            self._raw, self._dense = raw[order], dense[order]
+
+        return self._dense[np.searchsorted(self._raw, raw_ids)]
+
+    def get_raw_ids(self):
+        """
+        :return: raw id of every dense id, the raw id of dense id *i* is at index *i - 1*
+        :rtype:  ndarray
+        """
+        raw = np.empty(len(self._raw), dtype = np.int64)
+        raw[self._dense - 1] = self._raw
+        return raw
+
+class StreamingLoader:
+    """
+    Loads a large MovieLens data set in bounded memory chunks.
+
+    :param location: directory of the data set
+    :type location:  str
+    :param nbytes:   number of bytes of the ratings file read at once
+    :type nbytes:    int
+    :param verbose:  print the number of ratings and the peak memory after every chunk
+    :type verbose:   bool
+    """
+    def __init__(self, location, nbytes = chunk_bytes, verbose = True):
+        self._location = location
+        self._nbytes   = nbytes
+        self._verbose  = verbose
+        self._format   = detect_format(location)
+
+        self.user_ids = IdMap()
+        self.item_ids = IdMap()
+
+        self._items = None
+        self._users = None
+        self._ratings = None
+
+    def _path(self, part):
+        name = self._format[part]
+        if name is None:
+            return None
+        path = os.path.join(self._location, name)
+        return path if os.path.exists(path) else None
+
+    def load(self):
+        """
+        reads the movies, the users if the data set has them and then the ratings chunk by chunk
+        """
+        self._load_movies()
+        self._load_users()
+        self._load_ratings()
+
+    def _load_movies(self):
+        """
+        reads *movies.dat* or *movies.csv*, every movie gets a dense id even if it has no ratings
+        """
+        path = self._path('movies')
+        if path is None:
+            return
+
+        with open(path, encoding = self._format['encoding'], newline = '') as f:
+            if self._format['header']:
+                rows = list(csv.reader(f))[1:]
+            else:
+                rows = [line.rstrip('\r\n').split('::') for line in f]
+
+        self.item_ids.map([int(row[0]) for row in rows])
+        genre_index = {name: i for i, name in enumerate(genre_names)}
+        genres = np.zeros((len(rows), len(genre_names)), dtype = np.uint8)
+        for i, row in enumerate(rows):
+            for genre in row[2].split('|'):
+                genre = genre_aliases.get(genre, genre)
+                if genre in genre_index:
+                    genres[i, genre_index[genre]] = 1
+        self._items = ([row[1] for row in rows], genres)
+
+    def _load_users(self):
+        """
+        reads *users.dat* of ML-1M, the only large data set which has information about its users
+        """
+        path = self._path('users')
+        if path is None:
+            return
+
+        with open(path, encoding = self._format['encoding']) as f:
+            rows = [line.rstrip('\r\n').split('::') for line in f]
+
+        # the fields are user id, gender, age, occupation and zip code
+        self.user_ids.map([int(row[0]) for row in rows])
+        self._users = ([int(row[2]) for row in rows], [row[1] for row in rows], [row[3] for row in rows], [row[4] for row in rows])
+
+    def _load_ratings(self):
+        """
+        reads the ratings chunk by chunk into arrays which are preallocated from the size of the file and grown if the estimate was too small
+        """
+        path = self._path('ratings')
+        size = os.path.getsize(path)
+
+        capacity, n = 0, 0
+        users = items = ratings = timestamps = None
+        for nchunk, (u, i, r, t) in enumerate(rating_chunks(path, self._format['separator'], self._format['header'], self._nbytes)):
+            if n + len(u) > capacity:
+                # estimate the number of ratings of the whole file from the bytes per rating read so far
+                read = min(size, self._nbytes * (nchunk + 1))
+                capacity = max(n + len(u), int((n + len(u)) * size / read * 1.05))
+                users      = self._grow(users, capacity, np.int32)
+                items      = self._grow(items, capacity, np.int32)
+                ratings    = self._grow(ratings, capacity, np.float32)
+                timestamps = self._grow(timestamps, capacity, np.int64)
+
+            users[n:n + len(u)]      = self.user_ids.map(u)
+            items[n:n + len(u)]      = self.item_ids.map(i)
+            ratings[n:n + len(u)]    = r
+            timestamps[n:n + len(u)] = t
+            n += len(u)
+
+            if self._verbose:
+                rss = peak_rss()
+                print('chunk %d: %d ratings, %d users, %d items, peak RSS %s' % (nchunk + 1, n, len(self.user_ids), len(self.item_ids),
+                                                                                     '%.1f MB' % rss if rss is not None else 'n/a'))
+
+        if users is None:
+            users, items, ratings, timestamps = (np.zeros(0, dtype = dtype) for dtype in (np.int32, np.int32, np.float32, np.int64))
+        self._ratings = (users[:n], items[:n], ratings[:n], timestamps[:n])
+
+    @staticmethod
+    def _grow(array, capacity, dtype):
+        grown = np.empty(capacity, dtype = dtype)
+        if array is not None:
+            grown[:len(array)] = array
+        return grown
+
+    def get_user_table(self):
+        """
+        :return: all the users with their ratings, the ids are the dense ids of :py:attr:`user_ids`
+        :rtype:  :py:class:`mrs.datamodel.tables.UserTable`
+        """
+        nusers = len(self.user_ids)
+        ages, genders, occupations, zip_codes = np.zeros(nusers, dtype = np.int16), [''] * nusers, [''] * nusers, [''] * nusers
+        if self._users is not None:
+            n = len(self._users[0])
+            ages[:n], genders[:n], occupations[:n], zip_codes[:n] = self._users
+
+        table = UserTable(np.arange(1, nusers + 1), ages, genders, occupations, zip_codes)
+        table.set_ratings(*self._ratings)
+        return table
+
+    def get_item_table(self):
+        """
+        :return: all the movies, the ids are the dense ids of :py:attr:`item_ids`
+        :rtype:  :py:class:`mrs.datamodel.tables.ItemTable`
+        """
+        nitems = len(self.item_ids)
+        titles, genres = [''] * nitems, np.zeros((nitems, len(genre_names)), dtype = np.uint8)
+        if self._items is not None:
+            n = len(self._items[0])
+            titles[:n], genres[:n] = self._items
+
+        # movies with ratings but missing from the movies file have no genre
+        genres[genres.sum(axis = 1) == 0, genre_names.index('unknown')] = 1
+        empty = [''] * nitems
+        return ItemTable(np.arange(1, nitems + 1), titles, empty, empty, empty, genres)
@@ -0,0 +1,496 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module: tables
+   :synopsis: array backed tables of all the users and all the items
+
+Instead of one :py:class:`mrs.datamodel.user.User` or :py:class:`mrs.datamodel.item.Item` object with its own dicts per
+user or movie, :py:class:`UserTable` and :py:class:`ItemTable` keep every field in one contiguous array. Indexing a table
+by id gives a small row object (:py:class:`UserRow`, :py:class:`ItemRow`) with the same *get_** accessors as
+:py:class:`User` and :py:class:`Item`, which only reads from the arrays of its table.
+"""
+
+# library imports
+from collections import OrderedDict
+
+# third party packages
+import numpy as np
+
+from . import genre_names
+
+def _encode(values):
+    """
+    :return: the distinct values and the code of every value as index into them
+    :rtype:  tuple
+    """
+    names, codes = np.unique(np.asarray(values), return_inverse = True)
+    return names.tolist(), codes.astype(np.int16)
+
+def _id_index(ids):
+    """
+    :return: array which maps an id to its position in *ids*, -1 for ids which are not present
+    :rtype:  ndarray
+    """
+    index = np.full(int(ids.max()) + 1 if len(ids) else 0, fill_value = -1, dtype = np.int64)
+    index[ids] = np.arange(len(ids))
+    return index
+
+class _Table:
+    """
+    Common mapping behaviour of the tables, they behave like the dicts of id to object which they replace
+    """
+    def _position(self, key):
+        if 0 <= key < len(self._index) and self._index[key] >= 0:
+            return self._index[key]
+        raise KeyError(key)
+
+    def __getitem__(self, key):
+        return self._row(self._position(key))
+
+    def __contains__(self, key):
+        return 0 <= key < len(self._index) and self._index[key] >= 0
+
+    def __iter__(self):
+        return iter(self.ids.tolist())
+
+    def __len__(self):
+        return len(self.ids)
+
+    def keys(self):
+        return self.ids.tolist()
+
+    def values(self):
+        return [self._row(i) for i in range(len(self.ids))]
+
+    def items(self):
+        return [(key, self._row(i)) for i, key in enumerate(self.ids.tolist())]
+
+    def get(self, key, default = None):
+        return self[key] if key in self else default
+
+class UserTable(_Table):
+    """
+    All the users with gender and occupation coded as integers and the ratings held in CSR form:
+    the ratings of the user at position *p* are *rating_items[rating_indptr[p]:rating_indptr[p + 1]]* and so on.
+
+    :param ids:         user ids
+    :type ids:          array_like
+    :param ages:        ages of the users
+    :type ages:         array_like
+    :param genders:     genders of the users
+    :type genders:      array_like
+    :param occupations: occupations of the users
+    :type occupations:  array_like
+    :param zip_codes:   zip codes of the users
+    :type zip_codes:    array_like
+    """
+    def __init__(self, ids = (), ages = (), genders = (), occupations = (), zip_codes = ()):
+        self.ids       = np.asarray(ids, dtype = np.int32)
+        self.ages      = np.asarray(ages, dtype = np.int16)
+        self.zip_codes = np.asarray(zip_codes, dtype = str)
+        self.gender_names, self.genders         = _encode(genders)
+        self.occupation_names, self.occupations = _encode(occupations)
+        self._index = _id_index(self.ids)
+
+        # incremented whenever the ratings change so that values derived from them know when to be recomputed
+        self.version = 0
+        self.set_ratings([], [], [], [])
+
+    def _row(self, position):
+        return UserRow(self, position)
+
+    def set_ratings(self, users, items, ratings, timestamps):
+        """
+        Replaces the ratings of all the users
+
+        :param users:      user id of every rating
+        :type users:       array_like
+        :param items:      item id of every rating
+        :type items:       array_like
+        :param ratings:    the ratings
+        :type ratings:     array_like
+        :param timestamps: time of every rating
+        :type timestamps:  array_like
+        """
+        positions = self._index[np.asarray(users, dtype = np.int64)] if len(users) else np.zeros(0, dtype = np.int64)
+        if np.any(positions < 0):
+            raise KeyError('ratings given by unknown users')
+
+        # whole star ratings are kept as int8, half star ratings of the large data sets as float32
+        ratings = np.asarray(ratings)
+        ratings = ratings.astype(np.float32 if ratings.dtype.kind == 'f' else np.int8, copy = False)
+        items, timestamps = np.asarray(items, dtype = np.int32), np.asarray(timestamps, dtype = np.int64)
+
+        # ratings already grouped by user (e.g. the large data sets) need no reordering
+        order = slice(None) if np.all(positions[1:] >= positions[:-1]) else np.argsort(positions, kind = 'stable')
+        self.rating_indptr = np.zeros(len(self.ids) + 1, dtype = np.int64)
+        np.cumsum(np.bincount(positions, minlength = len(self.ids)), out = self.rating_indptr[1:])
+        self.rating_items      = items[order]
+        self.rating_values     = ratings[order]
+        self.rating_timestamps = timestamps[order]
+        self.version += 1
+
+    def add_users(self, ids, ages = None, genders = None, occupations = None, zip_codes = None):
+        """
+        Adds new users without ratings, the information which isn't given is left blank
+
+        :param ids: ids of the new users
+        :type ids:  array_like
+        """
+        ids = np.asarray(ids, dtype = np.int32)
+        n = len(ids)
+        if n == 0:
+            return
+        if np.any(np.isin(ids, self.ids)):
+            raise KeyError('users already present')
+
+        self.ids       = np.concatenate([self.ids, ids])
+        self.ages      = np.concatenate([self.ages, np.asarray(ages if ages is not None else np.zeros(n), dtype = np.int16)])
+        self.zip_codes = np.concatenate([self.zip_codes, np.asarray(zip_codes if zip_codes is not None else [''] * n, dtype = str)])
+        self.gender_names, self.genders = _encode(np.concatenate([np.asarray(self.gender_names, dtype = str)[self.genders],
+                                                                  np.asarray(genders if genders is not None else [''] * n, dtype = str)]))
+        self.occupation_names, self.occupations = _encode(np.concatenate([np.asarray(self.occupation_names, dtype = str)[self.occupations],
+                                                                          np.asarray(occupations if occupations is not None else [''] * n, dtype = str)]))
+        self._index = _id_index(self.ids)
+        self.rating_indptr = np.concatenate([self.rating_indptr, np.repeat(self.rating_indptr[-1], n)])
+        self.version += 1
+
+    def add_ratings(self, users, items, ratings, timestamps):
+        """
+        Adds ratings to the ones already present. A rating for a movie the user has already rated replaces the old rating,
+        users which are not in the table yet are added with :py:meth:`add_users`. New ratings rebuild the CSR arrays so add
+        many ratings at once rather than one by one.
+
+        :return: user ids, item ids, ratings and timestamps which were added, with only the last one of a movie rated twice by a user in the batch,
+                 and the rating they replaced, nan for movies which weren't rated before by the user
+        :rtype:  tuple
+        """
+        users, items = np.asarray(users, dtype = np.int64), np.asarray(items, dtype = np.int64)
+        ratings, timestamps = np.asarray(ratings), np.asarray(timestamps, dtype = np.int64)
+
+        self.add_users(np.unique(users[~np.isin(users, self.ids)]))
+
+        # half star ratings turn the whole star ratings into float32
+        if self.rating_values.dtype.kind != 'f' and ratings.dtype.kind == 'f' and np.any(ratings != np.round(ratings)):
+            self.rating_values = self.rating_values.astype(np.float32)
+        ratings = ratings.astype(self.rating_values.dtype)
+
+        # a movie rated twice by a user in the same batch keeps the last rating
+        nkeys = int(max(items.max(initial = 0), self.rating_items.max(initial = 0))) + 1
+        keys  = users * nkeys + items
+        _, last = np.unique(keys[::-1], return_index = True)
+        keep = np.sort(len(keys) - 1 - last)
+        users, items, ratings, timestamps, keys = users[keep], items[keep], ratings[keep], timestamps[keep], keys[keep]
+
+        # replace the ratings of movies already rated by the user
+        current = np.repeat(self.ids.astype(np.int64), self.nratings()) * nkeys + self.rating_items
+        sorter  = np.argsort(current)
+        pos     = np.minimum(np.searchsorted(current, keys, sorter = sorter), max(len(current) - 1, 0))
+        found   = (current[sorter[pos]] == keys) if len(current) else np.zeros(len(keys), dtype = bool)
+        where   = sorter[pos[found]]
+
+        previous = np.full(len(keys), fill_value = np.nan)
+        previous[found] = self.rating_values[where]
+        if not (self.rating_values.flags.writeable and self.rating_timestamps.flags.writeable):
+            # the ratings may still be the read only memory-mapped columns of the cache
+            self.rating_values, self.rating_timestamps = self.rating_values.copy(), self.rating_timestamps.copy()
+        self.rating_values[where]     = ratings[found]
+        self.rating_timestamps[where] = timestamps[found]
+
+        new = ~found
+        if np.any(new):
+            self.set_ratings(np.concatenate([np.repeat(self.ids, self.nratings()), users[new]]),
+                             np.concatenate([self.rating_items, items[new]]),
+                             np.concatenate([self.rating_values, ratings[new]]),
+                             np.concatenate([self.rating_timestamps, timestamps[new]]))
+        else:
+            self.version += 1
+
+        return users, items, ratings, timestamps, previous
+
+    def get_arrays(self):
+        """
+        :return: every array of the table by name, e.g. to publish it with :py:class:`mrs.datamodel.shared.SharedArrays`
+        :rtype:  dict
+        """
+        return {'ids': self.ids, 'ages': self.ages, 'zip_codes': self.zip_codes,
+                'gender_names': np.asarray(self.gender_names, dtype = str), 'genders': self.genders,
+                'occupation_names': np.asarray(self.occupation_names, dtype = str), 'occupations': self.occupations,
+                'index': self._index, 'rating_indptr': self.rating_indptr, 'rating_items': self.rating_items,
+                'rating_values': self.rating_values, 'rating_timestamps': self.rating_timestamps}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """
+        :param arrays: the arrays returned by :py:meth:`get_arrays`, they are used as they are without copying
+        :type arrays:  dict
+        :return: the table over the arrays
+        :rtype:  :py:class:`UserTable`
+        """
+        table = cls.__new__(cls)
+        table.ids, table.ages, table.zip_codes = arrays['ids'], arrays['ages'], arrays['zip_codes']
+        table.gender_names, table.genders         = arrays['gender_names'].tolist(), arrays['genders']
+        table.occupation_names, table.occupations = arrays['occupation_names'].tolist(), arrays['occupations']
+        table._index = arrays['index']
+        table.rating_indptr, table.rating_items = arrays['rating_indptr'], arrays['rating_items']
+        table.rating_values, table.rating_timestamps = arrays['rating_values'], arrays['rating_timestamps']
+        table.version = 1
+        return table
+
+    def get_rating_arrays(self):
+        """
+        :return: user ids, item ids and ratings of all the ratings, one entry per rating
+        :rtype:  tuple
+        """
+        return np.repeat(self.ids, self.nratings()), self.rating_items, self.rating_values
+
+    def get_ratings(self, user_id):
+        """
+        :return: item ids and ratings of the user, both are views into the table
+        :rtype:  tuple
+        """
+        p = self._position(user_id)
+        start, stop = self.rating_indptr[p], self.rating_indptr[p + 1]
+        return self.rating_items[start:stop], self.rating_values[start:stop]
+
+    def nratings(self):
+        """
+        :return: number of ratings given by every user in the order of :py:attr:`ids`
+        :rtype:  ndarray
+        """
+        return np.diff(self.rating_indptr)
+
+    def mean_rating(self, user_id):
+        """
+        :return: mean rating of the user
+        :rtype:  float
+        """
+        return float(self.get_ratings(user_id)[1].mean(dtype = np.float64))
+
+class UserRow:
+    """
+    View of one user of a :py:class:`UserTable` with the accessors of :py:class:`mrs.datamodel.user.User`
+    """
+    __slots__ = ('_table', '_position')
+
+    def __init__(self, table, position):
+        self._table    = table
+        self._position = position
+
+    def get_id(self):
+        """
+        :return: the id of the user
+        :rtype:  int
+        """
+        return int(self._table.ids[self._position])
+
+    def get_age(self):
+        """
+        :return: the age of the user
+        :rtype:  int
+        """
+        return int(self._table.ages[self._position])
+
+    def get_gender(self):
+        """
+        :return: the gender of the user
+        :rtype:  str
+        """
+        return self._table.gender_names[self._table.genders[self._position]]
+
+    def get_occupation(self):
+        """
+        :return: the occupation of the user
+        :rtype:  str
+        """
+        return self._table.occupation_names[self._table.occupations[self._position]]
+
+    def get_zip_code(self):
+        """
+        :return: the zip code of the location where the user lives
+        :rtype:  str
+        """
+        return str(self._table.zip_codes[self._position])
+
+    def get_ratings(self):
+        """
+        :return: item ids and ratings of the user, both are views into the table
+        :rtype:  tuple
+        """
+        return self._table.get_ratings(self.get_id())
+
+    def get_movie_rating(self):
+        """
+        :return: the ratings for movies by this user as movie id to [rating, timestamp], built from the table on every call
+        :rtype:  dict
+        """
+        t = self._table
+        start, stop = t.rating_indptr[self._position], t.rating_indptr[self._position + 1]
+        return dict(zip(t.rating_items[start:stop].tolist(),
+                        map(list, zip(t.rating_values[start:stop].tolist(), t.rating_timestamps[start:stop].tolist()))))
+
+    def add_movie(self, data):
+        """
+        Adds the movie id, rating and timestamp in *data* to the ratings of this user, see :py:meth:`UserTable.add_ratings`
+        """
+        self._table.add_ratings([self.get_id()], [data[0]], [data[1]], [data[2] if len(data) > 2 else 0])
+
+    def mean_rating(self):
+        """
+        returns the mean rating of this user
+        """
+        return self._table.mean_rating(self.get_id())
+
+    def __str__(self):
+        """
+        pretty print of user information
+        """
+        return "id:         %d\nage:        %d\ngender:     %s\noccupation: %s\nzip code:   %s" % (self.get_id(), self.get_age(), self.get_gender(), self.get_occupation(), self.get_zip_code())
+
+class ItemTable(_Table):
+    """
+    All the movies with the genres held as a *uint8* matrix with one row per movie and one column per genre in :py:data:`mrs.datamodel.genre_names`
+
+    :param ids:                 movie ids
+    :type ids:                  array_like
+    :param titles:              titles of the movies
+    :type titles:               array_like
+    :param release_dates:       release dates of the movies
+    :type release_dates:        array_like
+    :param video_release_dates: video release dates of the movies
+    :type video_release_dates:  array_like
+    :param IMDb_URLs:           URLs of the movies in IMDb site
+    :type IMDb_URLs:            array_like
+    :param genres:              genre flags of the movies
+    :type genres:               array_like
+    """
+    def __init__(self, ids = (), titles = (), release_dates = (), video_release_dates = (), IMDb_URLs = (), genres = ()):
+        self.ids                 = np.asarray(ids, dtype = np.int32)
+        self.titles              = np.asarray(titles, dtype = str)
+        self.release_dates       = np.asarray(release_dates, dtype = str)
+        self.video_release_dates = np.asarray(video_release_dates, dtype = str)
+        self.IMDb_URLs           = np.asarray(IMDb_URLs, dtype = str)
+        self.genres              = np.asarray(genres, dtype = np.uint8).reshape(len(self.ids), len(genre_names))
+        self._index = _id_index(self.ids)
+
+    def _row(self, position):
+        return ItemRow(self, position)
+
+    def get_arrays(self):
+        """
+        :return: every array of the table by name, e.g. to publish it with :py:class:`mrs.datamodel.shared.SharedArrays`
+        :rtype:  dict
+        """
+        return {'ids': self.ids, 'titles': self.titles, 'release_dates': self.release_dates,
+                'video_release_dates': self.video_release_dates, 'IMDb_URLs': self.IMDb_URLs, 'genres': self.genres, 'index': self._index}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        """
+        :param arrays: the arrays returned by :py:meth:`get_arrays`, they are used as they are without copying
+        :type arrays:  dict
+        :return: the table over the arrays
+        :rtype:  :py:class:`ItemTable`
+        """
+        table = cls.__new__(cls)
+        table.ids, table.titles, table.genres = arrays['ids'], arrays['titles'], arrays['genres']
+        table.release_dates, table.video_release_dates, table.IMDb_URLs = arrays['release_dates'], arrays['video_release_dates'], arrays['IMDb_URLs']
+        table._index = arrays['index']
+        return table
+
+    def get_genre_matrix(self, item_ids = None):
+        """
+        :param item_ids: ids of the movies, all the movies in the order of :py:attr:`ids` if None
+        :type item_ids:  array_like
+        :return: one row of genre flags per movie
+        :rtype:  ndarray
+        """
+        if item_ids is None:
+            return self.genres
+        return self.genres[self._index[np.asarray(item_ids, dtype = np.int64)]]
+
+    def get_genre_flags(self, item_ids, genre):
+        """
+        :param item_ids: ids of the movies
+        :type item_ids:  array_like
+        :param genre:    name of a genre in :py:data:`mrs.datamodel.genre_names`
+        :type genre:     str
+        :return: whether every movie has the genre, False for ids which aren't in the table
+        :rtype:  ndarray
+        """
+        if genre not in genre_names:
+            raise ValueError("unknown genre %s, choose from %s" % (genre, ', '.join(genre_names)))
+        item_ids = np.asarray(item_ids, dtype = np.int64)
+        known = (item_ids >= 0) & (item_ids < len(self._index))
+        positions = self._index[np.where(known, item_ids, 0)]
+        known &= positions >= 0
+        return known & (self.genres[positions, genre_names.index(genre)] > 0)
+
+class ItemRow:
+    """
+    View of one movie of an :py:class:`ItemTable` with the accessors of :py:class:`mrs.datamodel.item.Item`
+    """
+    __slots__ = ('_table', '_position')
+
+    def __init__(self, table, position):
+        self._table    = table
+        self._position = position
+
+    def get_movie_id(self):
+        """
+        :return: id of the movie
+        :rtype:  int
+        """
+        return int(self._table.ids[self._position])
+
+    def get_movie_title(self):
+        """
+        :return: title of the movie
+        :rtype:  str
+        """
+        return str(self._table.titles[self._position])
+
+    def get_movie_release_date(self):
+        """
+        :return: release data of the movie
+        :rtype:  str
+        """
+        return str(self._table.release_dates[self._position])
+
+    def get_video_release_date(self):
+        """
+        :return: video release date of the item
+        :rtype:  str
+        """
+        return str(self._table.video_release_dates[self._position])
+
+    def get_IMDb_URL(self):
+        """
+        :return: URL of the movie in IMDb site
+        :rtype:  str
+        """
+        return str(self._table.IMDb_URLs[self._position])
+
+    def get_genre_vector(self):
+        """
+        :return: the genre flags of the movie, a view into the genre matrix of the table
+        :rtype:  ndarray
+        """
+        return self._table.genres[self._position]
+
+    def get_genres(self):
+        """
+        The value of the dict is 1 or 0 depending on if the genre is associated with the movie or not
+
+        :return: all the genres information of the movie
+        :rtype:  OrderedDict
+        """
+        return OrderedDict(zip(genre_names, self.get_genre_vector().tolist()))
+
+    def __str__(self):
+        """
+        pretty print of a movie information
+        """
+        genres = [name for name, flag in zip(genre_names, self.get_genre_vector()) if flag]
+        return "id:                 %s\nTitle:              %s\nRelease Date:       %s\nVideo release Date: %s\nIMDb URL:           %s\nGenres:             %s" % (self.get_movie_id(), self.get_movie_title(), self.get_movie_release_date(),
+                                                                                                                                                                   self.get_video_release_date(), self.get_IMDb_URL(), genres)
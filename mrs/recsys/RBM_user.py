@@ -9,7 +9,8 @@ import pickle
 import numpy as np
 
 # local files
-from ..datamodel import loaddata
+from ..config import config
+from . import hyperparam_filename
 
 class RBM_User:
     """
@@ -76,10 +77,10 @@ class Trainer:
         ntrain = int(self.rating_matrix.shape[0] * .8)
         ntest  = self.rating_matrix.shape[0] - ntrain
 
-        self.train_rating_matrix = self.rating_matrix[:ntrain, ]
-        self.test_rating_matrix  = self.rating_matrix[ntrain:, ]
+        self.train_rating_matrix = self.rating_matrix[:ntrain]
+        self.test_rating_matrix  = self.rating_matrix[ntrain:]
 
-    def train(self, epoch, cdk, learning_rate):
+    def train(self, epoch, cdk, learning_rate, save = True):
         """
         Train the model
 
@@ -89,6 +90,8 @@ class Trainer:
         :type cdk:    int
         :param learning_rate: learning rate of the model
         :type learning_rate:  float
+        :param save: save the hyperparameters after every epoch
+        :type save:  bool
 
         .. note:: The current state of the function doesn't consider the training and testing
                   instead it considers the whole matrix as training. It prints the amount of time
@@ -99,10 +102,10 @@ class Trainer:
 
         for _ in range(epoch):
             start = time()
-            np.random.shuffle(self.rating_matrix)
+            # visit the users in random order, the rows are read one at a time so it also works on a sparse rating matrix
             
-            for v in self.rating_matrix:
-                v_plus = np.array([v[1:]])
+            for user in np.random.permutation(len(self.rating_matrix)):
+                v_plus = np.array([self.rating_matrix[user][1:]])
                 # positive phase
                 h_plus = self.rbm.positive_phase(v_plus)
                 vh_plus = v_plus.T.dot(h_plus)
@@ -133,12 +136,13 @@ class Trainer:
                 self.rbm.bvisible += delta_v
                 self.rbm.bhidden  += delta_h
 
-            pickle.dump((self.rbm.bvisible, self.rbm.weights, self.rbm.bhidden), open('hyperparam.bin', 'wb'))
+            if save:
+                pickle.dump((self.rbm.bvisible, self.rbm.weights, self.rbm.bhidden), open(config.get_model_path(hyperparam_filename), 'wb'))
             print('time:', time() - start)
             error = 0
             n = 0
-            for v in self.rating_matrix:
-                v_plus = np.array([v[1:]])
+            for user in range(len(self.rating_matrix)):
+                v_plus = np.array([self.rating_matrix[user][1:]])
                 h_plus = self.rbm.positive_phase(v_plus)
 
                 v_minus, h_minus = self.rbm.negative_phase(h_plus)
@@ -1,7 +1,17 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import os
+# local files
+from ..config import config
 
-# location of the file where hyperparameters of RBM is stored
-hyperparam_loc = os.path.join(os.getcwd(), 'hyperparam.bin')
+# name of the file where hyperparameters of RBM is stored
+hyperparam_filename = 'hyperparam.bin'
+
+# name of the file where the network of mrs.recsys.predict.PredictGlobalNetwork is stored
+network_filename = 'global_network.bin'
+
+def __getattr__(name):
+    # location of the file where hyperparameters of RBM is stored, resolved by mrs.config.config on first use
+    if name == 'hyperparam_loc':
+        return config.get_model_path(hyperparam_filename)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
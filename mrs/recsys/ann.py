@@ -78,15 +78,20 @@ class Neural_Network:
             self.final_error = cur_error
             print('Error', cur_error)
             
-    def backpropagation(self, training_examples, epoch, eta):
+    def backpropagation(self, training_examples, epoch, eta, batch_size = None):
         """
         backpropagation using stochastic gradient descent
         
         :param movie_info: one row of this array contains 40 ratings given by similar users and genre information
         :type movie_info:  ndarray
+        :param batch_size: train on mini-batches of this many examples with :py:meth:`backpropagation_batch` instead of one example at a time
+        :type batch_size:  int
 
         :todo: the feature and y are not ndarrays, so convert those to ndarrays so that it will be easier to manipulate and watch the dimensions in your derivation.
         """
+        if batch_size:
+            return self.backpropagation_batch(*self.stack(training_examples), epoch = epoch, eta = eta, batch_size = batch_size)
+
         for times in range(epoch):
 
             # randomly shuffle the training examples in the training set
@@ -115,6 +120,165 @@ class Neural_Network:
         self.W = self.final_W
         self.delta = self.final_delta
 
+    def get_nweights(self):
+        """
+        :return: number of weights of the network, the length of :py:meth:`get_weights`
+        :rtype:  int
+        """
+        return sum(self.layerSize[l - 1] * self.layerSize[l] for l in range(2, self.nlayer + 1))
+
+    def get_weights(self):
+        """
+        :return: the weights of all the layers packed into one vector
+        :rtype:  ndarray
+        """
+        return np.concatenate([self.W[l].ravel() for l in range(2, self.nlayer + 1)])
+
+    def set_weights(self, weights):
+        """
+        :param weights: weights packed by :py:meth:`get_weights`, they are copied
+        :type weights:  ndarray
+        """
+        offset = 0
+        for l in range(2, self.nlayer + 1):
+            size = self.layerSize[l - 1] * self.layerSize[l]
+            self.W[l] = np.array(weights[offset:offset + size], dtype = np.float64).reshape(self.layerSize[l - 1], self.layerSize[l])
+            offset += size
+
+    @staticmethod
+    def stack(training_examples):
+        """
+        :param training_examples: tuples of a feature and the one-hot rating, see :py:meth:`backpropagation`
+        :type training_examples:  list
+        :return: the features as rows of a (n, 19) ndarray and the one-hot ratings as rows of a (n, 5) ndarray
+        :rtype:  tuple
+        """
+        features = np.array([feature for feature, _ in training_examples], dtype = np.float64).reshape(len(training_examples), -1)
+        targets  = np.array([np.ravel(y) for _, y in training_examples], dtype = np.float64).reshape(len(training_examples), -1)
+        return features, targets
+
+    def feedforward_batch(self, features):
+        """
+        :param features: one feature per row
+        :type features:  ndarray
+        :return: the output of the last layer for every row, the activations are not kept
+        :rtype:  ndarray
+        """
+        alpha = np.asarray(features, dtype = np.float64)
+        for l in range(2, self.nlayer + 1):
+            alpha = alpha.dot(self.W[l])
+            np.negative(alpha, out = alpha)
+            np.exp(alpha, out = alpha)
+            alpha += 1
+            np.reciprocal(alpha, out = alpha)
+        return alpha
+
+    def predict_items(self, features, decode = 'cap'):
+        """
+        predicts the rating of many items in one forward pass
+
+        :param features: genre features of the items, one row per item, e.g. the (nitems, 19) genre matrix
+        :type features:  ndarray
+        :param decode:   how the outputs become ratings, a name in :py:data:`mrs.recsys.convert.decoders`: 'cap' as
+                         :py:func:`mrs.recsys.convert.f_inverse_cap` does for :py:meth:`feedforward`, 'argmax' or 'expected'
+        :type decode:    str
+        :return: the predicted rating of every item
+        :rtype:  ndarray
+        """
+        if decode not in convert.decoders:
+            raise ValueError("unknown decoder %s, choose from %s" % (decode, ', '.join(sorted(convert.decoders))))
+        return convert.decoders[decode](self.feedforward_batch(features))
+
+    def calculate_error_batch(self, features, ratings):
+        """
+        the same as :py:meth:`calculate_error` in one pass over all the examples, the weights with the smallest error are copied
+
+        :param features: one feature per row
+        :type features:  ndarray
+        :param ratings:  rating of every row
+        :type ratings:   ndarray
+        :return: root mean squared error of the predicted ratings
+        :rtype:  float
+        """
+        cur_error = float(np.sqrt(np.mean((convert.f_inverse_cap_rows(self.feedforward_batch(features)) - ratings) ** 2)))
+        if cur_error < self.final_error:
+            self.final_W = [None if w is None else w.copy() for w in self.W]
+            self.final_error = cur_error
+        return cur_error
+
+    def backpropagation_batch(self, features, targets, epoch, eta, batch_size = 32):
+        """
+        backpropagation using mini-batch gradient descent. Every batch is fed forward and back as one matrix product per layer
+        into buffers allocated once, and the weights take the summed step of the examples of the batch, so an epoch moves
+        them as far as an epoch of :py:meth:`backpropagation` does.
+
+        :param features:   one feature per row, see :py:meth:`stack`
+        :type features:    ndarray
+        :param targets:    one-hot rating of every row
+        :type targets:     ndarray
+        :param epoch:      number of passes over the examples
+        :type epoch:       int
+        :param eta:        learning rate
+        :type eta:         float
+        :param batch_size: number of examples per batch
+        :type batch_size:  int
+        """
+        n = len(features)
+        if n == 0:
+            return
+        ratings    = targets.argmax(axis = 1) + 1
+        batch_size = min(batch_size, n)
+        step       = eta / n
+
+        # activations, errors and gradients of every layer
+        alpha = [None] + [np.empty((batch_size, self.layerSize[l])) for l in range(1, self.nlayer + 1)]
+        delta = [None, None] + [np.empty((batch_size, self.layerSize[l])) for l in range(2, self.nlayer + 1)]
+        grad  = [None, None] + [np.empty_like(self.W[l]) for l in range(2, self.nlayer + 1)]
+        prime = [None, None] + [np.empty((batch_size, self.layerSize[l])) for l in range(2, self.nlayer + 1)]
+        y     = np.empty((batch_size, self.layerSize[self.nlayer]))
+
+        for times in range(epoch):
+            order = np.random.permutation(n)
+            self.calculate_error_batch(features, ratings)
+
+            for start in range(0, n, batch_size):
+                rows = order[start:start + batch_size]
+                m = len(rows)
+                a = [None if x is None else x[:m] for x in alpha]
+                d = [None if x is None else x[:m] for x in delta]
+                p = [None if x is None else x[:m] for x in prime]
+                np.take(features, rows, axis = 0, out = a[1])
+                np.take(targets, rows, axis = 0, out = y[:m])
+
+                # feedforward
+                for l in range(2, self.nlayer + 1):
+                    np.dot(a[l - 1], self.W[l], out = a[l])
+                    np.negative(a[l], out = a[l])
+                    np.exp(a[l], out = a[l])
+                    a[l] += 1
+                    np.reciprocal(a[l], out = a[l])
+                    # derivative of the sigmoid from its value
+                    np.subtract(1, a[l], out = p[l])
+                    p[l] *= a[l]
+
+                # compute the error for the last level and backpropagate it
+                np.subtract(a[self.nlayer], y[:m], out = d[self.nlayer])
+                d[self.nlayer] *= p[self.nlayer]
+                for l in range(self.nlayer - 1, 1, -1):
+                    np.dot(d[l + 1], self.W[l + 1].T, out = d[l])
+                    d[l] *= p[l]
+
+                # update weights
+                for l in range(self.nlayer, 1, -1):
+                    np.dot(a[l - 1].T, d[l], out = grad[l])
+                    grad[l] *= step
+                    self.W[l] -= grad[l]
+
+        self.calculate_error_batch(features, ratings)
+
+        # load the optimal hyperparameters
+        self.W = self.final_W
+
         
     @staticmethod
     def sigmoid(beta):
@@ -125,3 +289,178 @@ class Neural_Network:
     def sigmoidPrime(beta):
         """derivative of sigmoid function w.r.t val"""
         return (1 * np.exp(-beta)) / ((1 + np.exp(-beta)) ** 2)
+
+class Rating_Network:
+    """
+    One network for the ratings of all the users. The input of a rating is the genre features of the item together with a
+    learned embedding of the user and of the item, one hidden sigmoid layer maps it to a softmax over the five ratings.
+
+    Scoring a user is one batched forward pass over the items, and a user who wasn't trained on gets an embedding from its
+    ratings with :py:meth:`fold_in`, the rest of the network stays as it is.
+
+    :param nusers:        number of rows of the user embeddings, the largest user id plus one
+    :type nusers:         int
+    :param item_features: genre features of every item id, one row per id
+    :type item_features:  ndarray
+    :param nfactors:      length of the user and item embeddings
+    :type nfactors:       int
+    :param nhidden:       number of hidden neurons
+    :type nhidden:        int
+    :param seed:          seed of the initial weights and of the order of the training examples
+    :type seed:           int
+    """
+    nratings = 5
+
+    def __init__(self, nusers, item_features, nfactors = 16, nhidden = 32, seed = 0):
+        self.rng = np.random.RandomState(seed)
+        self.item_features = np.asarray(item_features, dtype = np.float64)
+        self.nfactors = nfactors
+        nitems, nfeatures = self.item_features.shape
+        ninput = nfeatures + 2 * nfactors
+
+        self.P  = self.rng.randn(nusers, nfactors) * .1
+        self.Q  = self.rng.randn(nitems, nfactors) * .1
+        self.W1 = self.rng.randn(ninput, nhidden) / np.sqrt(ninput)
+        self.b1 = np.zeros(nhidden)
+        self.W2 = self.rng.randn(nhidden, self.nratings) / np.sqrt(nhidden)
+        self.b2 = np.zeros(self.nratings)
+
+    def resize(self, nusers, item_features = None):
+        """
+        grows the user embeddings to *nusers* rows and takes the features of new items, the new embeddings are zero
+        """
+        if nusers > len(self.P):
+            self.P = np.vstack([self.P, np.zeros((nusers - len(self.P), self.nfactors))])
+        if item_features is not None:
+            self.item_features = np.asarray(item_features, dtype = np.float64)
+            nitems = len(self.item_features)
+            if nitems > len(self.Q):
+                self.Q = np.vstack([self.Q, np.zeros((nitems - len(self.Q), self.nfactors))])
+
+    def _forward(self, user_embeddings, items):
+        """
+        :return: input, hidden activation and rating probabilities of every pair of a user embedding and an item
+        :rtype:  tuple
+        """
+        x = np.hstack([self.item_features[items], user_embeddings, self.Q[items]])
+        h = Neural_Network.sigmoid(x.dot(self.W1) + self.b1)
+        z = h.dot(self.W2) + self.b2
+        z -= z.max(axis = 1, keepdims = True)
+        np.exp(z, out = z)
+        z /= z.sum(axis = 1, keepdims = True)
+        return x, h, z
+
+    def _backward(self, x, h, p, ratings):
+        """
+        :return: gradients of the mean cross entropy w.r.t. the input, W1, b1, W2 and b2
+        :rtype:  tuple
+        """
+        dz = p.copy()
+        dz[np.arange(len(ratings)), ratings - 1] -= 1
+        dz /= len(ratings)
+        dh = dz.dot(self.W2.T) * h * (1 - h)
+        return dh.dot(self.W1.T), x.T.dot(dh), dh.sum(axis = 0), h.T.dot(dz), dz.sum(axis = 0)
+
+    def probabilities(self, users, items):
+        """
+        :param users: user id of every pair
+        :type users:  ndarray
+        :param items: item id of every pair
+        :type items:  ndarray
+        :return: probability of every rating from 1 to 5, one row per pair
+        :rtype:  ndarray
+        """
+        return self._forward(self.P[users], items)[2]
+
+    def predict(self, users, items):
+        """
+        :return: expected rating of every pair of *users* and *items*, see :py:meth:`probabilities`
+        :rtype:  ndarray
+        """
+        return self.probabilities(users, items).dot(np.arange(1, self.nratings + 1))
+
+    def predict_user(self, user_id, items = None):
+        """
+        :param user_id: id of the user
+        :type user_id:  int
+        :param items:   ids of the items, all the items if None
+        :type items:    ndarray
+        :return: expected rating of the user for every item, in one forward pass
+        :rtype:  ndarray
+        """
+        if items is None:
+            items = np.arange(len(self.Q))
+        return self._forward(np.broadcast_to(self.P[user_id], (len(items), self.nfactors)), items)[2].dot(np.arange(1, self.nratings + 1))
+
+    def train(self, users, items, ratings, epoch = 20, eta = .05, batch_size = 256, reg = 1e-4):
+        """
+        mini-batch gradient descent on the cross entropy of the ratings. The rows of the embeddings take the summed step of
+        their examples in a batch, the weights the mean step.
+
+        :param users:      user id of every rating
+        :type users:       ndarray
+        :param items:      item id of every rating
+        :type items:       ndarray
+        :param ratings:    the ratings, integers from 1 to 5
+        :type ratings:     ndarray
+        :param epoch:      number of passes over the ratings
+        :type epoch:       int
+        :param eta:        learning rate
+        :type eta:         float
+        :param batch_size: number of ratings per batch
+        :type batch_size:  int
+        :param reg:        L2 regularization of the embeddings
+        :type reg:         float
+        :return: mean cross entropy of every epoch
+        :rtype:  list
+        """
+        users, items = np.asarray(users, dtype = np.int64), np.asarray(items, dtype = np.int64)
+        ratings = np.rint(ratings).astype(np.int64)
+        nfeatures = self.item_features.shape[1]
+        losses = []
+        for times in range(epoch):
+            order, loss = self.rng.permutation(len(ratings)), 0.
+            for start in range(0, len(order), batch_size):
+                rows = order[start:start + batch_size]
+                u, i, r = users[rows], items[rows], ratings[rows]
+                x, h, p = self._forward(self.P[u], i)
+                loss -= np.log(p[np.arange(len(r)), r - 1] + 1e-12).sum()
+
+                dx, dW1, db1, dW2, db2 = self._backward(x, h, p, r)
+                self.W1 -= eta * dW1
+                self.b1 -= eta * db1
+                self.W2 -= eta * dW2
+                self.b2 -= eta * db2
+
+                # undo the mean over the batch for the embeddings, every row only sees its own examples
+                step = eta * len(r)
+                np.add.at(self.P, u, -step * (dx[:, nfeatures:nfeatures + self.nfactors] + reg * self.P[u]))
+                np.add.at(self.Q, i, -step * (dx[:, nfeatures + self.nfactors:] + reg * self.Q[i]))
+            losses.append(loss / max(len(ratings), 1))
+        return losses
+
+    def fold_in(self, items, ratings, embedding = None, epoch = 50, eta = .5, reg = 1e-4):
+        """
+        learns the embedding of a user from its ratings while the weights and the item embeddings stay fixed
+
+        :param items:     ids of the items the user rated
+        :type items:      ndarray
+        :param ratings:   the ratings, integers from 1 to 5
+        :type ratings:    ndarray
+        :param embedding: embedding to start from, e.g. the current one of a user who rated more items, zero if None
+        :type embedding:  ndarray
+        :return: the embedding of the user
+        :rtype:  ndarray
+        """
+        items = np.asarray(items, dtype = np.int64)
+        ratings = np.rint(ratings).astype(np.int64)
+        embedding = np.zeros(self.nfactors) if embedding is None else np.array(embedding, dtype = np.float64)
+        if len(items) == 0:
+            return embedding
+
+        nfeatures = self.item_features.shape[1]
+        for times in range(epoch):
+            x, h, p = self._forward(np.broadcast_to(embedding, (len(items), self.nfactors)), items)
+            dx = self._backward(x, h, p, ratings)[0]
+            embedding -= eta * (dx[:, nfeatures:nfeatures + self.nfactors].sum(axis = 0) + reg * embedding)
+        return embedding
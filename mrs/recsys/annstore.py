@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module: annstore
+   :synopsis: the per-user networks of PredictNeuralNetwork trained in a process pool and kept in one packed store
+
+Every user has its own :py:class:`mrs.recsys.ann.Neural_Network`. A :py:class:`NetworkStore` keeps the weights of all of
+them as the rows of one memory-mapped *.npy* matrix indexed by user id, next to the flags of the users which are trained.
+:py:func:`train_all` trains the users which are left in shards which run in a process pool, every worker writes its rows
+straight into the matrix and a shard is flagged only after its rows are flushed, so a run which was interrupted continues
+with the users which are left.
+
+    mrs-train-ann --workers 8
+
+There is one store per data set and training parameters in the model location, so
+:py:meth:`mrs.recsys.predict.PredictNeuralNetwork.get_network` loads the stored network of a user instead of training it again.
+The fingerprint of the ratings of every user is stored with its network, after ratings are added only the users whose
+ratings changed are trained again.
+"""
+from __future__ import division, print_function, absolute_import
+
+# library packages
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# third party packages
+import numpy as np
+
+# local files
+from ..config import config
+from ..datamodel import loaddata
+from . import ann
+
+_logger = logging.getLogger(__name__)
+
+# version of the on-disk layout, bump it whenever the arrays or the header change
+STORE_VERSION = 2
+
+# name of the directory in the model location where the stores are kept
+store_dirname = 'networks'
+
+header_filename = 'header.json'
+
+# the data and the predictor of a worker process, created by the first shard which needs them
+_worker = {'data': None, 'predictor': None}
+
+class NetworkStore:
+    """
+    The packed weights of the networks of every user id, the flags of the users which are trained and the fingerprint of
+    the ratings every network was trained on (see :py:meth:`mrs.datamodel.loaddata.Data.get_user_fingerprints`). The
+    network of a user whose ratings changed since is stale and trained again, the other networks are kept.
+
+    :param path: directory of the store
+    :type path:  str
+    """
+    def __init__(self, path):
+        self._path = path
+        self.weights = None
+        self.trained = None
+        self.fingerprints = None
+        # the fingerprints of the current ratings
+        self.current = None
+
+    def get_path(self):
+        """
+        :return: the directory of the store
+        :rtype:  str
+        """
+        return self._path
+
+    def get_paths(self):
+        """
+        :return: path of the header, of the weights, of the flags and of the fingerprints
+        :rtype:  tuple
+        """
+        return tuple(os.path.join(self._path, name) for name in (header_filename, 'weights.npy', 'trained.npy', 'fingerprints.npy'))
+
+    def open(self, fingerprints, header, mode = 'r+', resume = True):
+        """
+        Memory-maps the weights, the flags and the fingerprints. The store is created empty if it is missing, was written
+        with another header or *resume* is False, and grown for new users.
+
+        :param fingerprints: fingerprint of the current ratings of every user id
+        :type fingerprints:  ndarray
+        :param header:       what the networks are trained with, it is compared to the header of the store
+        :type header:        dict
+        :param mode:         mode of the memory map of an existing store, 'r' to only load networks
+        :type mode:          str
+        :param resume:       keep the networks of an existing store
+        :type resume:        bool
+        :return: self
+        :rtype:  :py:class:`NetworkStore`
+        """
+        header_path, weights_path, trained_path, fingerprints_path = self.get_paths()
+        nusers, nweights = len(fingerprints), ann.Neural_Network().get_nweights()
+        self.current = fingerprints
+        arrays = None
+        if resume:
+            try:
+                with open(header_path) as f:
+                    saved = json.load(f)
+                if saved.get('version') == STORE_VERSION and saved.get('header') == header:
+                    arrays = [np.lib.format.open_memmap(path, mode = mode) for path in (weights_path, trained_path, fingerprints_path)]
+            except (OSError, ValueError):
+                arrays = None
+        if arrays is not None and arrays[0].shape[1:] == (nweights,) and (len(arrays[0]) >= nusers or mode == 'r'):
+            self.weights, self.trained, self.fingerprints = arrays
+            return self
+
+        os.makedirs(self._path, exist_ok = True)
+        if os.path.exists(header_path):
+            os.remove(header_path)
+        # a store with fewer users is grown, the networks it has are kept. The new arrays are written under temporary names
+        # and replace the old files, which stay valid for the readers which have them mapped and are copied from
+        old = arrays if arrays is not None and arrays[0].shape[1:] == (nweights,) else None
+        paths = (weights_path, trained_path, fingerprints_path)
+        for path, dtype, shape, saved in zip(paths, (np.float64, np.uint8, np.uint64), ((nusers, nweights), (nusers,), (nusers,)),
+                                             old or (None, None, None)):
+            array = np.lib.format.open_memmap(path + '.tmp', mode = 'w+', dtype = dtype, shape = shape)
+            if saved is not None:
+                array[:len(saved)] = saved
+            array.flush()
+            del array
+            os.replace(path + '.tmp', path)
+        del arrays, old
+        self.weights, self.trained, self.fingerprints = [np.lib.format.open_memmap(path, mode = 'r+') for path in paths]
+        with open(header_path + '.tmp', 'w') as f:
+            json.dump({'version': STORE_VERSION, 'header': header}, f)
+        os.replace(header_path + '.tmp', header_path)
+        return self
+
+    def flush(self):
+        self.weights.flush()
+        self.trained.flush()
+        self.fingerprints.flush()
+
+    def get_valid(self, user_ids):
+        """
+        :return: whether the network of every user is trained on the current ratings of the user
+        :rtype:  ndarray
+        """
+        user_ids = np.asarray(user_ids, dtype = np.int64)
+        valid = user_ids < len(self.trained)
+        ids = user_ids[valid]
+        valid[valid] = (self.trained[ids] != 0) & (self.fingerprints[ids] == self.current[ids])
+        return valid
+
+    def get_network(self, user_id):
+        """
+        :return: the network of the user, None if it isn't trained or is stale
+        :rtype:  :py:class:`mrs.recsys.ann.Neural_Network`
+        """
+        if not self.get_valid([user_id])[0]:
+            return None
+        NN = ann.Neural_Network()
+        NN.set_weights(self.weights[user_id])
+        return NN
+
+    def set_trained(self, user_ids):
+        """
+        flags the networks of the users, whose weights were written, as trained on the current ratings
+        """
+        self.fingerprints[user_ids] = self.current[user_ids]
+        self.fingerprints.flush()
+        self.trained[user_ids] = 1
+        self.trained.flush()
+
+    def put_network(self, user_id, NN):
+        """
+        writes the weights of the network of the user and flags it as trained
+        """
+        self.weights[user_id] = NN.get_weights()
+        self.weights.flush()
+        self.set_trained([user_id])
+
+def get_header(data, epoch, eta, batch_size):
+    """
+    :return: what the networks of a store are trained with, the source of the data set and the training parameters
+    :rtype:  dict
+    """
+    return {'source': data.get_source(), 'epoch': epoch, 'eta': eta, 'batch_size': batch_size}
+
+def get_store_path(header):
+    """
+    :return: the directory of the store in the model location, one per data set and training parameters
+    :rtype:  str
+    """
+    digest = hashlib.sha1(json.dumps(header, sort_keys = True).encode()).hexdigest()[:12]
+    return config.get_model_path(os.path.join(store_dirname, digest))
+
+def open_store(data, epoch = 700, eta = .05, batch_size = 32, mode = 'r+', resume = True, path = None):
+    """
+    :return: the store of the networks trained on *data* with the parameters, see :py:meth:`NetworkStore.open`
+    :rtype:  :py:class:`NetworkStore`
+    """
+    header = get_header(data, epoch, eta, batch_size)
+    return NetworkStore(path or get_store_path(header)).open(data.get_user_fingerprints(), header, mode, resume)
+
+def train_shard(user_ids, data_location, model_location, path, epoch, eta, batch_size):
+    """
+    trains the networks of the users of one shard and writes their weights to the store, it runs in a worker process
+
+    :return: the user ids of the shard
+    :rtype:  list
+    """
+    config.set_data_location(data_location)
+    config.set_model_location(model_location)
+    if _worker['data'] is None:
+        from .predict import PredictNeuralNetwork
+        _worker['data'] = loaddata.Data()
+        _worker['data'].load_data()
+        # the correlations are computed on first use only, training never uses them
+        _worker['predictor'] = PredictNeuralNetwork(_worker['data'])
+    data, predictor = _worker['data'], _worker['predictor']
+
+    weights = np.lib.format.open_memmap(os.path.join(path, 'weights.npy'), mode = 'r+')
+    for user_id in user_ids:
+        ratings = list(data.get_user_by_id(user_id).get_movie_rating().items())
+        weights[user_id] = predictor.train_for_an_user(ratings, epoch, eta, batch_size).get_weights()
+    weights.flush()
+    return user_ids
+
+def train_all(user_ids = None, workers = None, shard_size = 16, epoch = 700, eta = .05, batch_size = 32, resume = True):
+    """
+    :param user_ids:   ids of the users to train, all the users if None
+    :type user_ids:    list
+    :param workers:    number of worker processes, by default the number of cores
+    :type workers:     int
+    :param shard_size: number of users trained by a worker at once
+    :type shard_size:  int
+    :param epoch:      see :py:meth:`mrs.recsys.predict.PredictNeuralNetwork.train_for_an_user`
+    :type epoch:       int
+    :param eta:        learning rate
+    :type eta:         float
+    :param batch_size: number of ratings per mini-batch
+    :type batch_size:  int
+    :param resume:     continue a run which was interrupted instead of starting again
+    :type resume:      bool
+    :return: the store of the networks
+    :rtype:  :py:class:`NetworkStore`
+    """
+    data = loaddata.Data()
+    data.load_data()
+    store = open_store(data, epoch, eta, batch_size, resume = resume)
+    if user_ids is None:
+        user_ids = data.get_users().keys()
+    user_ids = np.asarray(user_ids, dtype = np.int64)
+    todo = user_ids[~store.get_valid(user_ids)].tolist()
+    _logger.info("%d of %d users left", len(todo), len(user_ids))
+
+    shards = [todo[i:i + shard_size] for i in range(0, len(todo), shard_size)]
+    start, ndone = time.time(), 0
+    with ProcessPoolExecutor(max_workers = workers) as pool:
+        futures = [pool.submit(train_shard, shard, config.get_data_location(), config.get_model_location(), store.get_path(), epoch, eta, batch_size)
+                   for shard in shards]
+        for future in as_completed(futures):
+            shard = future.result()
+            store.set_trained(shard)
+
+            ndone += len(shard)
+            elapsed = time.time() - start
+            _logger.info("%d/%d users trained, %.0fs elapsed, %.0fs left", ndone, len(todo), elapsed, elapsed / ndone * (len(todo) - ndone))
+    return store
+
+def parse_args(args):
+    """
+    Parse command line parameters
+
+    :param args: command line parameters as list of strings
+    :return: command line parameters as :obj:`argparse.Namespace`
+    """
+    parser = argparse.ArgumentParser(description = "Train the network of every user and store the weights in the model location")
+    parser.add_argument('--users', type = int, nargs = '+', default = None, help = "ids of the users, all the users if not given")
+    parser.add_argument('--workers', type = int, default = None, help = "number of worker processes, by default the number of cores")
+    parser.add_argument('--shard-size', type = int, default = 16, help = "number of users a worker trains at once: %(default)s")
+    parser.add_argument('--epochs', type = int, default = 700, help = "training epochs: %(default)s")
+    parser.add_argument('--eta', type = float, default = .05, help = "learning rate: %(default)s")
+    parser.add_argument('--batch-size', type = int, default = 32, help = "ratings per mini-batch: %(default)s")
+    parser.add_argument('--data', default = None, help = "directory of the data set")
+    parser.add_argument('--model', default = None, help = "directory the store is written to")
+    parser.add_argument('--restart', action = 'store_true', help = "start again instead of resuming an interrupted run")
+    return parser.parse_args(args)
+
+def main(args):
+    args = parse_args(args)
+    if args.data:
+        config.set_data_location(args.data)
+    if args.model:
+        config.set_model_location(args.model)
+    store = train_all(args.users, args.workers, args.shard_size, args.epochs, args.eta, args.batch_size, not args.restart)
+    _logger.info("%s written", store.get_path())
+
+def run():
+    logging.basicConfig(level = logging.INFO, stream = sys.stderr)
+    main(sys.argv[1:])
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module: approximate
+   :synopsis: approximate search of the most similar users for data sets with too many users for an exact correlation matrix
+
+The exact neighbors need the correlation of every pair of users, which is quadratic in the number of users.
+:py:class:`IVFIndex` avoids it with an inverted file index:
+
+1. the ratings of every user minus the mean rating of the user are projected on their *dim* main directions, found by a
+   randomized singular value decomposition of the sparse rating matrix, and divided by the length of the whole centered
+   rating vector, so the dot product of two projected users approximates the cosine of their centered ratings
+2. spherical k-means partitions the directions of the projected users into *nlist* lists
+3. the candidates of a user are the members of the *nprobe* lists whose centroids are closest to the user, the *refine*
+   times *size* candidates with the largest approximate cosine are kept and their exact pearson correlation with the user
+   is computed with :py:meth:`mrs.recsys.cf.Correlation.pearson_candidates`
+
+More probed lists and more refined candidates find more of the exact neighbors at the cost of a slower search,
+*neighbor_bench.py* reports the recall of the exact neighbors together with the build and query times.
+
+:Example:
+
+>>> index = IVFIndex(d.get_sparse_rating_matrix(), d.get_stats().user_mean)
+>>> knn = KNN(d, sparse = True, approximate = index)
+"""
+
+# third party packages
+import numpy as np
+
+# local files
+from .cf import Correlation
+from .neighbors import NeighborIndex
+
+class IVFIndex:
+    """
+    :param rating_matrix: the ratings of the users
+    :type rating_matrix:  :py:class:`mrs.datamodel.matrix.SparseRatingMatrix`
+    :param user_means:    mean rating of every user id
+    :type user_means:     ndarray
+    :param dim:           number of directions the users are projected on
+    :type dim:            int
+    :param nlist:         number of lists, by default the square root of the number of users
+    :type nlist:          int
+    :param niter:         iterations of k-means
+    :type niter:          int
+    :param power:         power iterations of the randomized singular value decomposition
+    :type power:          int
+    :param seed:          seed of the randomized singular value decomposition and of the initial centroids
+    :type seed:           int
+    :param nprobe:        number of lists searched by :py:meth:`query`, more lists find more of the exact neighbors
+    :type nprobe:         int
+    :param refine:        :py:meth:`query` computes the exact correlation of *refine* times *size* candidates
+    :type refine:         int
+    """
+    def __init__(self, rating_matrix, user_means, dim = 64, nlist = None, niter = 10, power = 2, seed = 0, nprobe = 8, refine = 4):
+        self.rating_matrix = rating_matrix
+        self.settings = {'dim': dim, 'nlist': nlist, 'niter': niter, 'power': power, 'seed': seed, 'nprobe': nprobe, 'refine': refine}
+        self.nprobe, self.refine = nprobe, refine
+        nusers = rating_matrix.shape[0]
+        nlist  = nlist or max(1, int(np.sqrt(nusers)))
+        rng    = np.random.RandomState(seed)
+
+        self.embeddings = self._project(rating_matrix, user_means, dim, power, rng)
+
+        # the lists partition the directions of the users, the length of an embedding only says how well the projection keeps the user
+        norms = np.linalg.norm(self.embeddings, axis = 1)
+        self.directions = self.embeddings / np.where(norms > 0, norms, 1)[:, None]
+        self.centroids  = self._kmeans(self.directions, min(nlist, nusers), niter, rng)
+
+        # members of every list, the members of list l are members[offsets[l]:offsets[l + 1]]
+        assign = self._assign(self.directions, self.centroids)
+        self.members = np.argsort(assign, kind = 'stable').astype(np.int32)
+        self.offsets = np.zeros(len(self.centroids) + 1, dtype = np.int64)
+        np.cumsum(np.bincount(assign, minlength = len(self.centroids)), out = self.offsets[1:])
+
+    def rebuild(self, rating_matrix, user_means):
+        """
+        :return: a new index with the same settings over other ratings, e.g. after users were added
+        :rtype:  :py:class:`IVFIndex`
+        """
+        return IVFIndex(rating_matrix, user_means, **self.settings)
+
+    @staticmethod
+    def _multiply(rows, columns, values, dense, n):
+        """
+        :return: product of the sparse matrix given by *rows*, *columns* and *values* with *n* rows and the dense matrix,
+                 one :py:func:`numpy.bincount` per column of the dense matrix
+        :rtype:  ndarray
+        """
+        product = np.empty((n, dense.shape[1]))
+        dense_t = np.ascontiguousarray(dense.T)
+        for j in range(dense.shape[1]):
+            product[:, j] = np.bincount(rows, weights = values * dense_t[j, columns], minlength = n)
+        return product
+
+    def _project(self, rating_matrix, user_means, dim, power, rng, oversample = 8):
+        """
+        :return: the centered ratings of every user projected on the *dim* main directions of the centered rating matrix and
+                 divided by the length of the centered ratings, zero for users without ratings
+        :rtype:  ndarray
+        """
+        nusers, nitems = rating_matrix.shape
+        users = np.repeat(np.arange(nusers), rating_matrix.row_nnz())
+        centered = rating_matrix.data.astype(np.float64) - user_means[users]
+
+        def dot(dense):
+            return self._multiply(users, rating_matrix.indices, centered, dense, nusers)
+
+        def dot_t(dense):
+            return self._multiply(rating_matrix.indices, users, centered, dense, nitems)
+
+        # randomized range finder with power iterations, then the singular value decomposition of the small projected matrix
+        y = dot(rng.standard_normal((nitems, min(dim + oversample, nitems))))
+        for _ in range(power):
+            y = dot(np.linalg.qr(dot_t(np.linalg.qr(y)[0]))[0])
+        q = np.linalg.qr(y)[0]
+        _, sigma, vt = np.linalg.svd(dot_t(q), full_matrices = False)
+        embeddings = q.dot(vt.T[:, :dim] * sigma[:dim])
+
+        lengths = np.sqrt(np.bincount(users, weights = centered ** 2, minlength = nusers))
+        return (embeddings / np.where(lengths > 0, lengths, 1)[:, None]).astype(np.float32)
+
+    @staticmethod
+    def _assign(embeddings, centroids, block_size = 65536):
+        """
+        :return: index of the closest centroid of every embedding
+        :rtype:  ndarray
+        """
+        assign = np.empty(len(embeddings), dtype = np.int64)
+        for start in range(0, len(embeddings), block_size):
+            assign[start:start + block_size] = embeddings[start:start + block_size].dot(centroids.T).argmax(axis = 1)
+        return assign
+
+    def _kmeans(self, embeddings, nlist, niter, rng):
+        """
+        :return: centroids of spherical k-means, every centroid has unit length
+        :rtype:  ndarray
+        """
+        centroids = embeddings[rng.choice(len(embeddings), nlist, replace = False)].copy()
+        for _ in range(niter):
+            assign = self._assign(embeddings, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, embeddings)
+            norms = np.linalg.norm(sums, axis = 1)
+            # a list which lost all its members keeps its centroid
+            centroids[norms > 0] = sums[norms > 0] / norms[norms > 0, None]
+        return centroids
+
+    def candidates(self, user_id, nprobe = None):
+        """
+        :return: ids of the members of the *nprobe* lists closest to the user, without the user
+        :rtype:  ndarray
+        """
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        closeness = self.centroids.dot(self.directions[user_id])
+        probe = np.argpartition(-closeness, nprobe - 1)[:nprobe]
+        ids = np.concatenate([self.members[self.offsets[l]:self.offsets[l + 1]] for l in probe])
+        return ids[ids != user_id]
+
+    def query(self, user_id, size = 300, nprobe = None, refine = None, min_overlap = 1, shrinkage = 0, rating_matrix = None):
+        """
+        :param user_id:       id of the user
+        :type user_id:        int
+        :param size:          number of neighbors
+        :type size:           int
+        :param nprobe:        number of lists searched, :py:attr:`nprobe` if None
+        :type nprobe:         int
+        :param refine:        *refine* times *size* candidates closest in the projection get their exact correlation computed, :py:attr:`refine` if None
+        :type refine:         int
+        :param min_overlap:   see :py:meth:`mrs.recsys.cf.Correlation.pearson`
+        :type min_overlap:    int
+        :param shrinkage:     see :py:meth:`mrs.recsys.cf.Correlation.pearson`
+        :type shrinkage:      float
+        :param rating_matrix: ratings to compute the correlations from instead of the ones the index was built from, e.g. after ratings were added
+        :type rating_matrix:  :py:class:`mrs.datamodel.matrix.SparseRatingMatrix`
+        :return: ids and exact correlations of the candidates, the neighbors are the *size* most correlated ones
+        :rtype:  tuple
+        """
+        ids = self.candidates(user_id, nprobe)
+        refine = refine or self.refine
+        if len(ids) > refine * size:
+            closeness = self.embeddings[ids].dot(self.embeddings[user_id])
+            ids = ids[np.argpartition(-closeness, refine * size - 1)[:refine * size]]
+        rating_matrix = rating_matrix if rating_matrix is not None else self.rating_matrix
+        return ids, Correlation().pearson_candidates(rating_matrix, user_id, ids, min_overlap, shrinkage)
+
+    def get_neighbor_index(self, size = 300, nprobe = None, refine = None, min_overlap = 1, shrinkage = 0):
+        """
+        :return: the approximate neighbors of every user, see :py:meth:`query` for the parameters
+        :rtype:  :py:class:`mrs.recsys.neighbors.NeighborIndex`
+        """
+        index = NeighborIndex.empty(self.rating_matrix.shape[0], size)
+        for user_id in range(self.rating_matrix.shape[0]):
+            index.set_neighbors(user_id, *self.query(user_id, size, nprobe, refine, min_overlap, shrinkage))
+        return index
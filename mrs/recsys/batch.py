@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Predicts the rating of every user for every item with the engines of :py:mod:`mrs.recsys.evaluate` and writes the
+*predicted_rating_<engine>.bin* files read by *cmdpredict.py* to the model location.
+
+The users are split into shards which run in a process pool, the shards of all the engines share the pool so it stays busy
+until the last engine is done. Every worker writes its rows straight into a memory-mapped *.npy* matrix and a shard is
+marked as done only after its rows are flushed, so a run which was interrupted continues with the users which are left.
+
+    mrs-predict --engines knn ann rbm --workers 8
+
+The RBM and the global network are trained once before the workers start unless they were saved from the same ratings
+already, every worker loads them. A partial matrix predicted from other ratings is started again.
+The similarities of knn are saved to a :py:class:`mrs.recsys.store.SimilarityStore` first, every worker memory-maps them.
+The networks of ann are trained by :py:func:`mrs.recsys.annstore.train_all` first, every worker loads them from its store.
+"""
+from __future__ import division, print_function, absolute_import
+
+# library packages
+import os
+import sys
+import time
+import json
+import pickle
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# third party packages
+import numpy as np
+
+# local files
+from ..config import config
+from ..datamodel import loaddata
+from . import hyperparam_filename
+
+_logger = logging.getLogger(__name__)
+
+# name of the file of the predictions of an engine in the model location
+artifact = 'predicted_rating_%s.bin'
+
+# the data and the engines of a worker process, created by the first shard which needs them
+_worker = {'data': None, 'engines': {}}
+
+def get_paths(engine_name):
+    """
+    :return: path of the predictions, of the partial matrix, of the flags of the users which are done and of the header
+             of the ratings they were predicted from
+    :rtype:  tuple
+    """
+    path = config.get_model_path(artifact % engine_name)
+    return path, path + '.part.npy', path + '.done.npy', path + '.header.json'
+
+def read_header(path):
+    """
+    :return: the header written by :py:func:`write_header`, None if it is missing or can't be read
+    :rtype:  dict
+    """
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_header(path, header):
+    """
+    writes what the files next to *path* were computed from, under a temporary name first so a reader never sees half of it
+    """
+    with open(path + '.tmp', 'w') as f:
+        json.dump(header, f)
+    os.replace(path + '.tmp', path)
+
+def predict_shard(engine_name, user_ids, data_location, model_location, options):
+    """
+    predicts all the items for the users of one shard and writes them to the partial matrix of the engine, it runs in a worker process
+
+    :return: the user ids of the shard
+    :rtype:  list
+    """
+    config.set_data_location(data_location)
+    config.set_model_location(model_location)
+    if _worker['data'] is None:
+        _worker['data'] = loaddata.Data()
+        _worker['data'].load_data()
+    if engine_name not in _worker['engines']:
+        from .evaluate import engines
+        _worker['engines'][engine_name] = engines[engine_name](_worker['data'], options)
+    engine = _worker['engines'][engine_name]
+
+    predicted = np.lib.format.open_memmap(get_paths(engine_name)[1], mode = 'r+')
+    for user_id in user_ids:
+        predicted[user_id, 1:] = engine.predict_user(user_id)
+    predicted.flush()
+    return user_ids
+
+def open_partial(engine_name, data, resume = True):
+    """
+    :return: the partial matrix of the predictions and the flags of the users which are done, new ones if there are
+             none, they were predicted from other ratings than the ones of *data* or *resume* is False
+    :rtype:  tuple
+    """
+    _, part, done, header_path = get_paths(engine_name)
+    shape, header = data.get_shape(), {'fingerprint': data.get_fingerprint()}
+    if resume and os.path.exists(part) and os.path.exists(done) and read_header(header_path) == header:
+        predicted, finished = np.lib.format.open_memmap(part, mode = 'r+'), np.lib.format.open_memmap(done, mode = 'r+')
+        if predicted.shape == shape and finished.shape == shape[:1]:
+            return predicted, finished
+        del predicted, finished
+    if os.path.exists(header_path):
+        os.remove(header_path)
+    predicted = np.lib.format.open_memmap(part, mode = 'w+', dtype = np.float64, shape = shape)
+    finished  = np.lib.format.open_memmap(done, mode = 'w+', dtype = np.uint8, shape = shape[:1])
+    write_header(header_path, header)
+    return predicted, finished
+
+def prepare_rbm(data, options):
+    """
+    trains the RBM once and saves its hyperparameters unless the saved ones were trained from the same ratings and
+    parameters, so every worker loads the same model
+
+    :return: the options of the rbm engine
+    :rtype:  dict
+    """
+    path = config.get_model_path(hyperparam_filename)
+    epochs, eta = options.get('epochs', 10), options.get('eta', .05)
+    header = {'fingerprint': data.get_fingerprint(), 'epochs': epochs, 'eta': eta}
+    if not os.path.exists(path) or read_header(path + '.header.json') != header:
+        from .predict import PredictRBM
+        from .RBM_user import Trainer
+        if os.path.exists(path + '.header.json'):
+            os.remove(path + '.header.json')
+        predictor = PredictRBM(data)
+        Trainer(data, predictor.rating_matrix, predictor.rbm).train(epochs, 1, eta, save = True)
+        write_header(path + '.header.json', header)
+    return dict(options, load = True)
+
+def prepare_global(data, options):
+    """
+    trains the global network once and saves it unless the saved one was trained from the same ratings and parameters,
+    so every worker loads the same model
+
+    :return: the options of the global engine
+    :rtype:  dict
+    """
+    from .predict import PredictGlobalNetwork
+    predictor = PredictGlobalNetwork(data)
+    epoch, eta = options.get('epochs', 20), options.get('eta', .05)
+    if not predictor.load(epoch, eta):
+        predictor.train(epoch, eta)
+        predictor.save()
+    return dict(options, load = True)
+
+def prepare_ann(data, options, workers = None):
+    """
+    trains the networks of the users which aren't in the :py:class:`mrs.recsys.annstore.NetworkStore` yet in the pool of
+    :py:func:`mrs.recsys.annstore.train_all`, so every worker loads them
+
+    :return: the options of the ann engine
+    :rtype:  dict
+    """
+    from .annstore import train_all
+    train_all(workers = workers, epoch = options.get('epochs', 700), eta = options.get('eta', .05))
+    return dict(options, store = True)
+
+def prepare_knn(data, options):
+    """
+    builds the store of the similarities once, so every worker memory-maps the same pages instead of computing them
+
+    :return: the options of the knn engine
+    :rtype:  dict
+    """
+    from .store import open_similarity
+    open_similarity(data, options.get('similarity', 'pearson'))
+    return dict(options, store = True)
+
+def predict_all(engine_names, workers = None, shard_size = 16, options = None, resume = True):
+    """
+    :param engine_names: names of the engines in :py:data:`mrs.recsys.evaluate.engines`
+    :type engine_names:  list
+    :param workers:      number of worker processes, by default the number of cores
+    :type workers:       int
+    :param shard_size:   number of users predicted by a worker at once
+    :type shard_size:    int
+    :param options:      options of the engines
+    :type options:       dict
+    :param resume:       continue the runs which were interrupted instead of starting them again
+    :type resume:        bool
+    """
+    options = options or {}
+    data = loaddata.Data()
+    data.load_data()
+    user_ids = np.array(data.get_users().keys(), dtype = np.int64)
+
+    partial, jobs = {}, []
+    for engine_name in engine_names:
+        predicted, finished = open_partial(engine_name, data, resume)
+        partial[engine_name] = (predicted, finished)
+        todo = user_ids[finished[user_ids] == 0].tolist()
+        engine_options = options
+        if engine_name == 'rbm' and todo:
+            engine_options = prepare_rbm(data, options)
+        elif engine_name == 'knn' and todo:
+            engine_options = prepare_knn(data, options)
+        elif engine_name == 'ann' and todo:
+            engine_options = prepare_ann(data, options, workers)
+        elif engine_name == 'global' and todo:
+            engine_options = prepare_global(data, options)
+        jobs += [(engine_name, todo[i:i + shard_size], engine_options) for i in range(0, len(todo), shard_size)]
+        _logger.info("%s: %d of %d users left", engine_name, len(todo), len(user_ids))
+
+    start, ndone, ntotal = time.time(), 0, sum(len(shard) for _, shard, _ in jobs)
+    with ProcessPoolExecutor(max_workers = workers) as pool:
+        futures = {pool.submit(predict_shard, engine_name, shard, config.get_data_location(), config.get_model_location(), engine_options): engine_name
+                   for engine_name, shard, engine_options in jobs}
+        for future in as_completed(futures):
+            engine_name, shard = futures[future], future.result()
+            finished = partial[engine_name][1]
+            finished[shard] = 1
+            finished.flush()
+
+            ndone += len(shard)
+            elapsed = time.time() - start
+            _logger.info("%s: %d/%d users done, %.0fs elapsed, %.0fs left", engine_name, ndone, ntotal, elapsed, elapsed / ndone * (ntotal - ndone))
+
+    for engine_name in engine_names:
+        predicted, finished = partial.pop(engine_name)
+        path, part, done, header_path = get_paths(engine_name)
+        # written under a temporary name first, so cmdpredict.py never reads half of the predictions
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(np.array(predicted), f)
+        os.replace(path + '.tmp', path)
+        del predicted, finished
+        os.remove(part)
+        os.remove(done)
+        os.remove(header_path)
+        _logger.info("%s written", path)
+
+def parse_args(args):
+    """
+    Parse command line parameters
+
+    :param args: command line parameters as list of strings
+    :return: command line parameters as :obj:`argparse.Namespace`
+    """
+    parser = argparse.ArgumentParser(description = "Predict the rating of every user for every item and write predicted_rating_<engine>.bin")
+    parser.add_argument('--engines', nargs = '+', default = ['knn', 'ann', 'rbm'], help = "engines to predict with: %(default)s")
+    parser.add_argument('--workers', type = int, default = None, help = "number of worker processes, by default the number of cores")
+    parser.add_argument('--shard-size', type = int, default = 16, help = "number of users a worker predicts at once: %(default)s")
+    parser.add_argument('--epochs', type = int, default = None, help = "training epochs of ann and rbm")
+    parser.add_argument('--data', default = None, help = "directory of the data set")
+    parser.add_argument('--model', default = None, help = "directory the predictions are written to")
+    parser.add_argument('--restart', action = 'store_true', help = "start again instead of resuming an interrupted run")
+    return parser.parse_args(args)
+
+def main(args):
+    from .evaluate import engines
+    args = parse_args(args)
+    for name in args.engines:
+        if name not in engines:
+            raise SystemExit("unknown engine %s, choose from %s" % (name, ', '.join(sorted(engines))))
+    if args.data:
+        config.set_data_location(args.data)
+    if args.model:
+        config.set_model_location(args.model)
+    options = {} if args.epochs is None else {'epochs': args.epochs}
+
+    predict_all(args.engines, args.workers, args.shard_size, options, not args.restart)
+
+def run():
+    logging.basicConfig(level = logging.INFO, stream = sys.stderr)
+    main(sys.argv[1:])
+
+if __name__ == "__main__":
+    run()
@@ -4,10 +4,621 @@
 # create a class for correlation matrix and other class to find out similar users who have rated a particular movie w.r.t. a particular user based on correlation
 
 import numpy as np
-import pandas as pd
+
+from ..datamodel.matrix import SparseRatingMatrix
 
 class Correlation:
     """
+    Pearson correlation between users computed over the items both users have rated, and the other similarities of
+    :py:data:`kernels`.
+
+    The similarities are computed in blocks of users by :py:meth:`similarity`: for two blocks the number of co-rated items and
+    the sums of the ratings, of their squares and of their products over the co-rated items are matrix products of the ratings
+    (missing ratings as zero) and the masks of rated items. Only the two blocks are dense at a time, so the memory besides the
+    result doesn't grow with the number of users and the products stay in the cache. The products are float32, which sums
+    ratings in steps of a half exactly.
+    """
+    def similarity(self, rating_matrix, kernel = None, dtype = np.float32, block_size = 256):
+        """
+        :param rating_matrix: user item matrix with missing ratings as nan, or a :py:class:`mrs.datamodel.matrix.SparseRatingMatrix`
+        :param kernel:        the similarity, a :py:class:`Kernel` or the name of one in :py:data:`kernels`, pearson if None
+        :type kernel:         :py:class:`Kernel`
+        :param dtype:         type of the returned matrix
+        :type dtype:          numpy.dtype
+        :param block_size:    number of users in one block
+        :type block_size:     int
+        :return: similarity between every pair of users
+        :rtype:  ndarray
+        """
+        kernel = get_kernel(kernel)
+        kernel.prepare(rating_matrix)
+        nusers = rating_matrix.shape[0]
+        sim    = np.empty((nusers, nusers), dtype = dtype)
+
+        for a_start in range(0, nusers, block_size):
+            a = kernel.rows(rating_matrix, slice(a_start, a_start + block_size))
+            a_stop = a_start + len(a[0])
+            for b_start in range(a_start, nusers, block_size):
+                b = a if b_start == a_start else kernel.rows(rating_matrix, slice(b_start, b_start + block_size))
+                c = kernel.block(a, b)
+
+                b_stop = b_start + len(b[0])
+                sim[a_start:a_stop, b_start:b_stop] = c
+                sim[b_start:b_stop, a_start:a_stop] = c.T
+
+        return sim
+
+    def pearson(self, rating_matrix, min_overlap = 1, shrinkage = 0, dtype = np.float32, block_size = 256):
+        """
+        :param rating_matrix: user item matrix with missing ratings as nan, or a :py:class:`mrs.datamodel.matrix.SparseRatingMatrix`
+        :param min_overlap:   correlations of users with fewer co-rated items than this are nan
+        :type min_overlap:    int
+        :param shrinkage:     a correlation over *n* co-rated items is multiplied by *n / (n + shrinkage)*, so correlations
+                              supported by few items are pulled towards zero, 0 keeps them as they are
+        :type shrinkage:      float
+        :param dtype:         type of the returned matrix
+        :type dtype:          numpy.dtype
+        :param block_size:    number of users in one block
+        :type block_size:     int
+        :return: pearson correlation between every pair of users over the items both of them have rated
+        :rtype:  ndarray
+        """
+        return self.similarity(rating_matrix, PearsonKernel(min_overlap, shrinkage), dtype, block_size)
+
+    @staticmethod
+    def _masked_rows(rating_matrix, rows):
+        """
+        :return: the ratings of the users in *rows* with missing ratings as zero and the mask of the rated items
+        :rtype:  tuple
+        """
+        if isinstance(rating_matrix, SparseRatingMatrix):
+            r = rating_matrix.get_rows(rows)
+            m = ~np.isnan(r) if rating_matrix.dtype.kind == 'f' else r != 0
+        else:
+            r = rating_matrix[rows]
+            m = ~np.isnan(r)
+        return np.where(m, r, 0).astype(np.float32), m.astype(np.float32)
+
+    @staticmethod
+    def _pearson_block(r_a, m_a, r_b, m_b, min_overlap = 1, shrinkage = 0):
+        """
+        :return: pearson correlation between the users of block *a* and block *b* over their co-rated items,
+                 the sums over the co-rated items are matrix products of the ratings and the masks of the two blocks
+        :rtype:  ndarray
+        """
+        return Correlation._pearson_sums(*Correlation._block_sums(r_a, m_a, r_b, m_b), min_overlap = min_overlap, shrinkage = shrinkage)
+
+    @staticmethod
+    def _block_sums(r_a, m_a, r_b, m_b):
+        """
+        :return: number of co-rated items of every user of block *a* with every user of block *b*, and over them the sums of the
+                 ratings of *a*, of the ratings of *b*, of their squares and of their products
+        :rtype:  tuple
+        """
+        return m_a.dot(m_b.T), r_a.dot(m_b.T), m_a.dot(r_b.T), (r_a ** 2).dot(m_b.T), m_a.dot((r_b ** 2).T), r_a.dot(r_b.T)
+
+    @staticmethod
+    def _pearson_sums(n, sx, sy, sxx, syy, sxy, min_overlap = 1, shrinkage = 0):
+        """
+        :return: pearson correlation from the number of co-rated items and the sums of the ratings, their squares and their products over them
+        :rtype:  ndarray
+        """
+        # the sums are exact, the differences of their products are not in float32
+        n, sx, sy, sxx, syy, sxy = (np.asarray(v, dtype = np.float64) for v in (n, sx, sy, sxx, syy, sxy))
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            c = (n * sxy - sx * sy) / np.sqrt((n * sxx - sx ** 2) * (n * syy - sy ** 2))
+        return Correlation._finish(c, n, min_overlap, shrinkage)
+
+    @staticmethod
+    def _finish(c, n, min_overlap = 1, shrinkage = 0):
+        """
+        :return: the similarities *c* over *n* co-rated items shrunk by *n / (n + shrinkage)*, clipped to [-1, 1] and nan where
+                 fewer than *min_overlap* items are co-rated
+        :rtype:  ndarray
+        """
+        if shrinkage:
+            c *= n / (n + shrinkage)
+        # rounding can push the similarity of users with proportional ratings slightly beyond one
+        np.clip(c, -1, 1, out = c)
+        c[n < max(min_overlap, 1)] = np.nan
+        return c
+
+    def pearson_candidates(self, rating_matrix, user_id, candidates, min_overlap = 1, shrinkage = 0):
+        """
+        Pearson correlation of one user with a list of candidate users only, e.g. the candidates of an approximate neighbor search.
+        For a :py:class:`mrs.datamodel.matrix.SparseRatingMatrix` only the ratings of the candidates are read, none is densified,
+        so the cost is proportional to the number of ratings of the candidates and not to the number of users.
+
+        :param user_id:    id of the user
+        :type user_id:     int
+        :param candidates: ids of the candidate users
+        :type candidates:  ndarray
+        :return: correlation of the user with every candidate
+        :rtype:  ndarray
+        """
+        candidates = np.asarray(candidates, dtype = np.int64)
+        if not isinstance(rating_matrix, SparseRatingMatrix):
+            r_a, m_a = self._masked_rows(rating_matrix, [user_id])
+            r_b, m_b = self._masked_rows(rating_matrix, candidates)
+            return self._pearson_block(r_a, m_a, r_b, m_b, min_overlap, shrinkage)[0]
+
+        items, ratings = rating_matrix.get_row(user_id)
+        x = np.full(rating_matrix.shape[1], fill_value = np.nan)
+        x[items] = ratings
+
+        # every rating of the candidates with the rating of the user for the same item, only the co-rated ones are summed
+        starts = rating_matrix.indptr[candidates]
+        counts = rating_matrix.indptr[candidates + 1] - starts
+        pos    = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        owner  = np.repeat(np.arange(len(candidates)), counts)
+        xa, y  = x[rating_matrix.indices[pos]], rating_matrix.data[pos].astype(np.float64)
+        co     = ~np.isnan(xa)
+        owner, xa, y = owner[co], xa[co], y[co]
+
+        def total(weights = None):
+            return np.bincount(owner, weights = weights, minlength = len(candidates))
+        return self._pearson_sums(total().astype(np.float64), total(xa), total(y), total(xa ** 2), total(y ** 2), total(xa * y),
+                                  min_overlap, shrinkage)
+
+    def update_pearson(self, correlation_matrix, rating_matrix, users, block_size = 256, min_overlap = 1, shrinkage = 0):
+        """
+        Recomputes in place the rows and columns of *correlation_matrix* of the users whose ratings changed,
+        the correlations between two other users stay the same
+
+        :param correlation_matrix: correlation matrix returned by :py:meth:`pearson` before the ratings changed
+        :type correlation_matrix:  ndarray
+        :param rating_matrix:      the rating matrix with the changed ratings
+        :param users:              ids of the users whose ratings changed
+        :type users:               ndarray
+        :param min_overlap:        see :py:meth:`pearson`, it has to be the one the matrix was computed with
+        :type min_overlap:         int
+        :param shrinkage:          see :py:meth:`pearson`, it has to be the one the matrix was computed with
+        :type shrinkage:           float
+        """
+        self.update_similarity(correlation_matrix, rating_matrix, users, PearsonKernel(min_overlap, shrinkage), block_size)
+
+    def update_similarity(self, similarity_matrix, rating_matrix, users, kernel = None, block_size = 256):
+        """
+        Recomputes the rows and columns of *similarity_matrix* of the users whose ratings changed, the similarities between two
+        other users stay the same. The matrix is grown with nan for new users and copied if it is read only. A kernel which
+        isn't :py:attr:`Kernel.incremental` computes the whole matrix again instead.
+
+        :param similarity_matrix: matrix returned by :py:meth:`similarity` before the ratings changed
+        :type similarity_matrix:  ndarray
+        :param rating_matrix:     the rating matrix with the changed ratings
+        :param users:             ids of the users whose ratings changed
+        :type users:              ndarray
+        :param kernel:            the kernel the matrix was computed with, see :py:meth:`similarity`
+        :type kernel:             :py:class:`Kernel`
+        :return: the updated matrix, *similarity_matrix* itself unless it had to be grown, copied or computed again
+        :rtype:  ndarray
+        """
+        kernel = get_kernel(kernel)
+        if not kernel.incremental:
+            return self.similarity(rating_matrix, kernel, similarity_matrix.dtype, block_size)
+        kernel.prepare(rating_matrix)
+        users = np.asarray(users, dtype = np.int64)
+        similarity_matrix = self._writeable(similarity_matrix, rating_matrix.shape[0])
+        a = kernel.rows(rating_matrix, users)
+
+        for start in range(0, rating_matrix.shape[0], block_size):
+            b = kernel.rows(rating_matrix, slice(start, start + block_size))
+            c = kernel.block(a, b)
+            similarity_matrix[users, start:start + len(b[0])] = c
+            similarity_matrix[start:start + len(b[0]), users] = c.T
+        return similarity_matrix
+
+    @staticmethod
+    def _writeable(similarity_matrix, nusers):
+        """
+        :return: *similarity_matrix* grown to *nusers* rows and columns with nan, or copied if it is read only
+        :rtype:  ndarray
+        """
+        if similarity_matrix.shape[0] != nusers:
+            grown = np.full((nusers, nusers), fill_value = np.nan, dtype = similarity_matrix.dtype)
+            grown[:similarity_matrix.shape[0], :similarity_matrix.shape[1]] = similarity_matrix
+            return grown
+        if not similarity_matrix.flags.writeable:
+            return similarity_matrix.copy()
+        return similarity_matrix
+
+    @staticmethod
+    def _centered_columns(rating_matrix, columns, user_means):
+        """
+        :return: the ratings given to the items in *columns* minus the mean rating of each user with missing ratings as zero and the mask of the given ratings
+        :rtype:  tuple
+        """
+        if isinstance(rating_matrix, SparseRatingMatrix):
+            r = rating_matrix.get_columns(columns)
+            m = ~np.isnan(r) if rating_matrix.dtype.kind == 'f' else r != 0
+        else:
+            r = rating_matrix[:, columns]
+            m = ~np.isnan(r)
+        means = np.where(np.isnan(user_means), 0, user_means)[:, None]
+        return np.where(m, r - means, 0).astype(np.float64), m.astype(np.float64)
+
+    @staticmethod
+    def _cosine_block(x_a, m_a, x_b, m_b, min_overlap = 1, shrinkage = 0):
+        """
+        :return: cosine between the columns of block *a* and block *b* over the users who rated both items
+        :rtype:  ndarray
+        """
+        n   = m_a.T.dot(m_b)
+        sxy = x_a.T.dot(x_b)
+        sxx = (x_a ** 2).T.dot(m_b)
+        syy = m_a.T.dot(x_b ** 2)
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            c = sxy / np.sqrt(sxx * syy)
+        return Correlation._finish(c, n, min_overlap, shrinkage)
+
+    def adjusted_cosine(self, rating_matrix, user_means, items = None, min_overlap = 1, shrinkage = 0, dtype = np.float32, block_size = 256):
+        """
+        Adjusted cosine similarity between items: the cosine of the ratings of two items, each rating minus the mean rating of
+        the user who gave it, over the users who rated both items. The similarities are computed in blocks of items like :py:meth:`pearson`.
+
+        :param rating_matrix: user item matrix with missing ratings as nan, or a :py:class:`mrs.datamodel.matrix.SparseRatingMatrix`
+        :param user_means:    mean rating of every user id
+        :type user_means:     ndarray
+        :param items:         ids of the items to compute the similarities of, all the items if None
+        :type items:          ndarray
+        :param min_overlap:   see :py:meth:`pearson`
+        :type min_overlap:    int
+        :param shrinkage:     see :py:meth:`pearson`
+        :type shrinkage:      float
+        :return: similarity of every item in *items* to every item, one row per item in *items*
+        :rtype:  ndarray
+        """
+        nitems = rating_matrix.shape[1]
+        items  = np.arange(nitems) if items is None else np.asarray(items, dtype = np.int64)
+        sim    = np.empty((len(items), nitems), dtype = dtype)
+
+        x_a, m_a = self._centered_columns(rating_matrix, items, user_means)
+        for start in range(0, nitems, block_size):
+            x_b, m_b = self._centered_columns(rating_matrix, slice(start, start + block_size), user_means)
+            sim[:, start:start + x_b.shape[1]] = self._cosine_block(x_a, m_a, x_b, m_b, min_overlap, shrinkage)
+        return sim
+
+class Kernel:
+    """
+    A similarity of users computed block by block by :py:meth:`Correlation.similarity`: :py:meth:`rows` reads the ratings of
+    a block of users and :py:meth:`block` computes the similarities between the users of two blocks. Subclasses override
+    both, the first array returned by :py:meth:`rows` has one row per user.
+
+    :param min_overlap: similarities of users with fewer co-rated items than this are nan
+    :type min_overlap:  int
+    :param shrinkage:   a similarity over *n* co-rated items is multiplied by *n / (n + shrinkage)*, 0 keeps it as it is
+    :type shrinkage:    float
+    """
+    # the similarity of two users depends on their ratings only, so :py:meth:`Correlation.update_similarity` recomputes
+    # only the users whose ratings changed. False for a kernel whose :py:meth:`prepare` computes something over all the users.
+    incremental = True
+
+    def __init__(self, min_overlap = 1, shrinkage = 0):
+        self.min_overlap = min_overlap
+        self.shrinkage   = shrinkage
+
+    def get_parameters(self):
+        """
+        :return: name of the kernel and its parameters, e.g. to find out if a saved similarity matrix was computed with them
+        :rtype:  dict
+        """
+        return {'kernel': type(self).__name__, 'min_overlap': self.min_overlap, 'shrinkage': self.shrinkage}
+
+    def prepare(self, rating_matrix):
+        """
+        called with the whole rating matrix before the blocks are computed, e.g. to compute means over all the users
+        """
+        pass
+
+    def rows(self, rating_matrix, rows):
+        """
+        :return: the ratings of the users in *rows* with missing ratings as zero and the mask of the rated items
+        :rtype:  tuple
+        """
+        return Correlation._masked_rows(rating_matrix, rows)
+
+    def block(self, a, b):
+        """
+        :param a: :py:meth:`rows` of the users of block *a*
+        :type a:  tuple
+        :param b: :py:meth:`rows` of the users of block *b*
+        :type b:  tuple
+        :return: similarity of every user of block *a* to every user of block *b*
+        :rtype:  ndarray
+        """
+        raise NotImplementedError
+
+class PearsonKernel(Kernel):
+    """
+    pearson correlation over the co-rated items, see :py:meth:`Correlation.pearson`
+    """
+    def block(self, a, b):
+        return Correlation._pearson_block(a[0], a[1], b[0], b[1], self.min_overlap, self.shrinkage)
+
+class ShrunkPearsonKernel(PearsonKernel):
+    """
+    pearson correlation pulled towards zero when few items are co-rated, with a shrinkage of 100 by default
+    """
+    def __init__(self, min_overlap = 1, shrinkage = 100):
+        PearsonKernel.__init__(self, min_overlap, shrinkage)
+
+class CosineKernel(Kernel):
+    """
+    cosine of the rating vectors of two users, missing ratings count as zero so the lengths are over all the rated items
     """
-    def pearson(self, rating_matrix):
-        return pd.DataFrame(rating_matrix.T).corr().as_matrix()
+    def rows(self, rating_matrix, rows):
+        r, m = Correlation._masked_rows(rating_matrix, rows)
+        return r, m, np.sqrt((r.astype(np.float64) ** 2).sum(axis = 1))
+
+    def block(self, a, b):
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            c = a[0].dot(b[0].T) / np.outer(a[2], b[2])
+        return Correlation._finish(c, a[1].dot(b[1].T), self.min_overlap, self.shrinkage)
+
+class AdjustedCosineKernel(Kernel):
+    """
+    cosine over the co-rated items of the ratings minus the mean rating of the item, so popular items which everyone rates
+    highly don't make users similar. The item means change with the ratings of any user, so every similarity can change.
+    """
+    incremental = False
+
+    def prepare(self, rating_matrix):
+        if isinstance(rating_matrix, SparseRatingMatrix):
+            items = np.repeat(np.arange(rating_matrix.shape[1]), rating_matrix.col_nnz())
+            rated = ~np.isnan(rating_matrix.col_data) if rating_matrix.dtype.kind == 'f' else rating_matrix.col_data != 0
+            count = np.bincount(items[rated], minlength = rating_matrix.shape[1])
+            total = np.bincount(items[rated], weights = rating_matrix.col_data[rated], minlength = rating_matrix.shape[1])
+        else:
+            rated = ~np.isnan(rating_matrix)
+            count, total = rated.sum(axis = 0), np.where(rated, rating_matrix, 0).sum(axis = 0)
+        self.item_means = np.where(count > 0, total / np.maximum(count, 1), 0).astype(np.float32)
+
+    def rows(self, rating_matrix, rows):
+        r, m = Correlation._masked_rows(rating_matrix, rows)
+        return (r - self.item_means) * m, m
+
+    def block(self, a, b):
+        # the item based adjusted cosine of the transposed blocks
+        return Correlation._cosine_block(a[0].T, a[1].T, b[0].T, b[1].T, self.min_overlap, self.shrinkage)
+
+class JaccardKernel(Kernel):
+    """
+    number of co-rated items divided by the number of items rated by either user, the ratings themselves are ignored
+    """
+    def rows(self, rating_matrix, rows):
+        _, m = Correlation._masked_rows(rating_matrix, rows)
+        return m, m.sum(axis = 1, dtype = np.float64)
+
+    def block(self, a, b):
+        n = a[0].dot(b[0].T).astype(np.float64)
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            c = n / (a[1][:, None] + b[1][None, :] - n)
+        return Correlation._finish(c, n, self.min_overlap, self.shrinkage)
+
+# name of the kernel to its class
+kernels = {'pearson': PearsonKernel, 'shrunk_pearson': ShrunkPearsonKernel, 'cosine': CosineKernel,
+           'adjusted_cosine': AdjustedCosineKernel, 'jaccard': JaccardKernel}
+
+def register_kernel(name, kernel):
+    """
+    :param name:   name of the kernel, e.g. for the *similarity* of :py:class:`mrs.recsys.knn.KNN`
+    :type name:    str
+    :param kernel: subclass of :py:class:`Kernel`, it is created without arguments when it is given by name
+    :type kernel:  type
+    """
+    kernels[name] = kernel
+
+def get_kernel(kernel):
+    """
+    :param kernel: a :py:class:`Kernel`, the name of one in :py:data:`kernels` or None for pearson
+    :return: the kernel
+    :rtype:  :py:class:`Kernel`
+    """
+    if kernel is None:
+        return PearsonKernel()
+    if isinstance(kernel, str):
+        if kernel not in kernels:
+            raise ValueError("unknown similarity %s, choose from %s" % (kernel, ', '.join(sorted(kernels))))
+        return kernels[kernel]()
+    return kernel
+
+class PearsonStatistics:
+    """
+    Sufficient statistics of the pearson correlation of every pair of users: the number of co-rated items and, over them, the
+    sum of the ratings of each user, of their squares and of the products of the two ratings. A changed rating of a user for
+    an item only changes the statistics of the pairs of that user with the users who rated the item, so :py:meth:`update`
+    costs a few products over the changed items instead of a whole :py:meth:`Correlation.pearson`, and
+    :py:meth:`update_correlations` recomputes the rows and columns of the changed users from the statistics alone.
+
+    The statistics are kept as four *(nusers, nusers)* float32 matrices, 16 bytes per pair of users or four times the
+    correlation matrix they update. Ratings in steps of a half are summed exactly in float32, so the statistics don't drift
+    however many updates are applied. For data sets with too many users for that the neighbors are found by
+    :py:class:`mrs.recsys.approximate.IVFIndex` instead, which needs neither the correlations nor the statistics.
+
+    The ratings the statistics were computed from are kept to find what changed, only the given ones in CSR arrays like a
+    :py:class:`mrs.datamodel.matrix.SparseRatingMatrix`, not a dense copy of the rating matrix.
+
+    :param rating_matrix: user item matrix with missing ratings as nan, or a :py:class:`mrs.datamodel.matrix.SparseRatingMatrix`
+    :param block_size:    number of users in one block, see :py:meth:`Correlation.pearson`
+    :type block_size:     int
+
+    :Example:
+
+    >>> statistics = PearsonStatistics(d.get_rating_matrix_with_nan())
+    >>> d.add_ratings(([196], [1], [4]))
+    >>> corr = statistics.update_correlations(corr, d.get_rating_matrix_with_nan(), [196])
+    """
+    def __init__(self, rating_matrix, block_size = 256):
+        nusers = rating_matrix.shape[0]
+        # count and products are symmetric, sums[a, b] and squares[a, b] are over the ratings of a
+        self.count    = np.empty((nusers, nusers), dtype = np.float32)
+        self.sums     = np.empty((nusers, nusers), dtype = np.float32)
+        self.squares  = np.empty((nusers, nusers), dtype = np.float32)
+        self.products = np.empty((nusers, nusers), dtype = np.float32)
+
+        # the given ratings ordered by user and then by item
+        users, items, ratings = [], [], []
+
+        for a_start in range(0, nusers, block_size):
+            r_a, m_a = Correlation._masked_rows(rating_matrix, slice(a_start, a_start + block_size))
+            a = slice(a_start, a_start + len(r_a))
+            row, item = np.nonzero(m_a)
+            users.append(row + a_start)
+            items.append(item.astype(np.int32))
+            ratings.append(r_a[row, item])
+            for b_start in range(a_start, nusers, block_size):
+                r_b, m_b = (r_a, m_a) if b_start == a_start else Correlation._masked_rows(rating_matrix, slice(b_start, b_start + block_size))
+                b = slice(b_start, b_start + len(r_b))
+                n, sx, sy, sxx, syy, sxy = Correlation._block_sums(r_a, m_a, r_b, m_b)
+                self.count[a, b], self.count[b, a]       = n, n.T
+                self.sums[a, b], self.sums[b, a]         = sx, sy.T
+                self.squares[a, b], self.squares[b, a]   = sxx, syy.T
+                self.products[a, b], self.products[b, a] = sxy, sxy.T
+
+        self.indptr = np.zeros(nusers + 1, dtype = np.int64)
+        np.cumsum(np.bincount(np.concatenate(users), minlength = nusers), out = self.indptr[1:])
+        self.indices = np.concatenate(items)
+        self.ratings = np.concatenate(ratings).astype(np.float32)
+
+    def resize(self, nusers):
+        """
+        grows the statistics for new user ids, the new users have no co-rated items with anyone yet
+        """
+        old_users = len(self.count)
+        if nusers <= old_users:
+            return
+        for name in ('count', 'sums', 'squares', 'products'):
+            grown = np.zeros((nusers, nusers), dtype = np.float32)
+            grown[:old_users, :old_users] = getattr(self, name)
+            setattr(self, name, grown)
+        self.indptr = np.concatenate((self.indptr, np.full(nusers - old_users, fill_value = self.indptr[-1], dtype = np.int64)))
+
+    def _get_rows(self, users, nitems):
+        """
+        :return: the kept ratings of *users*, one row of *nitems* per user with nan where they aren't rated
+        :rtype:  ndarray
+        """
+        rows = np.full((len(users), nitems), fill_value = np.nan, dtype = np.float32)
+        counts = self.indptr[users + 1] - self.indptr[users]
+        row    = np.repeat(np.arange(len(users)), counts)
+        offset = np.repeat(self.indptr[users] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        rows[row, self.indices[offset]] = self.ratings[offset]
+        return rows
+
+    def _set_rows(self, users, rows):
+        """
+        replaces the kept ratings of the sorted *users* by their *rows*, nan where they aren't rated. The other rows are
+        moved to their new offsets in one pass, nothing is sorted.
+        """
+        row, items = np.nonzero(~np.isnan(rows))
+        counts = np.diff(self.indptr)
+        old_counts = counts.copy()
+        counts[users] = np.bincount(row, minlength = len(users))
+        indptr = np.zeros(len(counts) + 1, dtype = np.int64)
+        np.cumsum(counts, out = indptr[1:])
+
+        indices = np.empty(indptr[-1], dtype = np.int32)
+        ratings = np.empty(indptr[-1], dtype = np.float32)
+        kept = np.ones(len(counts), dtype = bool)
+        kept[users] = False
+        owner = np.repeat(np.arange(len(counts)), old_counts)
+        keep  = kept[owner]
+        position = indptr[owner[keep]] + np.arange(len(owner))[keep] - self.indptr[owner[keep]]
+        indices[position], ratings[position] = self.indices[keep], self.ratings[keep]
+        position = indptr[users[row]] + np.arange(len(row)) - np.repeat(np.cumsum(counts[users]) - counts[users], counts[users])
+        indices[position], ratings[position] = items, rows[row, items]
+        self.indptr, self.indices, self.ratings = indptr, indices, ratings
+
+    @staticmethod
+    def _masked(ratings):
+        """
+        :return: the ratings with missing ratings as zero and the mask of the given ratings
+        :rtype:  tuple
+        """
+        m = ~np.isnan(ratings)
+        return np.where(m, ratings, 0).astype(np.float32), m.astype(np.float32)
+
+    def update(self, rating_matrix, users):
+        """
+        Applies the changed ratings of *users* to the statistics. Only the items whose ratings changed are read: the statistics
+        of a changed user with every user are corrected by the sums over those items with the new ratings minus the sums with the
+        old ones, which also covers two changed users who rated the same item.
+
+        :param rating_matrix: the rating matrix with the changed ratings
+        :param users:         ids of the users whose ratings changed
+        :type users:          ndarray
+        """
+        users = np.unique(np.asarray(users, dtype = np.int64))
+        nusers, nitems = rating_matrix.shape
+        self.resize(nusers)
+        r_new, m_new = Correlation._masked_rows(rating_matrix, users)
+        new = np.where(m_new > 0, r_new, np.nan).astype(np.float32)
+        old = self._get_rows(users, nitems)
+
+        changed = ((new != old) & ~(np.isnan(new) & np.isnan(old))).any(axis = 0)
+        items = np.where(changed)[0]
+        if len(items) == 0:
+            return
+
+        # the ratings of every user for the changed items, before and after the change, only the rows of *users* differ
+        if isinstance(rating_matrix, SparseRatingMatrix):
+            new_columns = rating_matrix.get_columns(items).astype(np.float32)
+            if rating_matrix.dtype.kind != 'f':
+                new_columns[new_columns == 0] = np.nan
+        else:
+            new_columns = np.asarray(rating_matrix[:, items], dtype = np.float32)
+        old_columns = new_columns.copy()
+        old_columns[users] = old[:, items]
+        self._set_rows(users, new)
+
+        delta = [n - o for n, o in zip(Correlation._block_sums(*(self._masked(new_columns[users]) + self._masked(new_columns))),
+                                       Correlation._block_sums(*(self._masked(old_columns[users]) + self._masked(old_columns))))]
+        dn, dsx, dsy, dsxx, dsyy, dsxy = delta
+
+        # the rows of the changed users, then the columns of the other users, so the pairs of two changed users are updated once
+        others = np.ones(len(self.count), dtype = bool)
+        others[users] = False
+        for matrix, row, column in ((self.count, dn, dn), (self.sums, dsx, dsy), (self.squares, dsxx, dsyy), (self.products, dsxy, dsxy)):
+            matrix[users] += row
+            matrix[np.ix_(others, users)] += column.T[others]
+
+    def correlations(self, users, min_overlap = 1, shrinkage = 0):
+        """
+        :param users:       ids of the users
+        :type users:        ndarray
+        :param min_overlap: see :py:meth:`Correlation.pearson`
+        :type min_overlap:  int
+        :param shrinkage:   see :py:meth:`Correlation.pearson`
+        :type shrinkage:    float
+        :return: correlation of every user in *users* with every user, one row per user in *users*
+        :rtype:  ndarray
+        """
+        users = np.asarray(users, dtype = np.int64)
+        def rows(matrix):
+            return matrix[users].astype(np.float64)
+        def columns(matrix):
+            return matrix[:, users].T.astype(np.float64)
+        return Correlation._pearson_sums(rows(self.count), rows(self.sums), columns(self.sums), rows(self.squares), columns(self.squares),
+                                         rows(self.products), min_overlap, shrinkage)
+
+    def update_correlations(self, correlation_matrix, rating_matrix, users, min_overlap = 1, shrinkage = 0):
+        """
+        Applies the changed ratings of *users* with :py:meth:`update` and sets the rows and columns of those users in the
+        correlation matrix, which is grown with nan for new users and copied if it is read only.
+
+        :param correlation_matrix: correlation matrix computed from the ratings before the change
+        :type correlation_matrix:  ndarray
+        :param rating_matrix:      the rating matrix with the changed ratings
+        :param users:              ids of the users whose ratings changed
+        :type users:               ndarray
+        :return: the updated correlation matrix
+        :rtype:  ndarray
+        """
+        users = np.asarray(users, dtype = np.int64)
+        self.update(rating_matrix, users)
+        correlation_matrix = Correlation._writeable(correlation_matrix, len(self.count))
+
+        c = self.correlations(users, min_overlap, shrinkage)
+        correlation_matrix[users] = c
+        correlation_matrix[:, users] = c.T
+        return correlation_matrix
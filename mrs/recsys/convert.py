@@ -1,6 +1,9 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+# third party packages
+import numpy as np
+
 def f_inverse_cap(l):
     no, val = 1, l[0]
     for i, x in enumerate(l):
@@ -12,3 +15,19 @@ def f_inverse_cap(l):
 
 def f_inverse(l):
     return l.index(1) + 1
+
+def f_inverse_cap_rows(outputs):
+    # f_inverse_cap of every row of a 2-d ndarray
+    larger = outputs > outputs[:, :1]
+    return np.where(larger.any(axis = 1), larger.argmax(axis = 1) + 1, 1)
+
+def f_argmax_rows(outputs):
+    # rating of the largest output neuron of every row
+    return outputs.argmax(axis = 1) + 1
+
+def f_expected_rows(outputs):
+    # mean rating of every row with the output neurons as weights
+    return outputs.dot(np.arange(1, outputs.shape[1] + 1)) / outputs.sum(axis = 1)
+
+# name of a decoder to the function which turns the outputs of the network into ratings, one row per item
+decoders = {'cap': f_inverse_cap_rows, 'argmax': f_argmax_rows, 'expected': f_expected_rows}
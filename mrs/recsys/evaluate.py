@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Evaluates the predictors on the folds shipped with the data set (*u1.base*/*u1.test* ... *u5.base*/*u5.test*, *ua* and *ub*).
+
+Every pair of engine and fold is an independent job: the engine is trained on the *.base* ratings and predicts the ratings of
+the *.test* file. The jobs run in a process pool and the RMSE, MAE and wall time of every job are reported as a table, which
+can also be written as CSV or JSON.
+
+    mrs-evaluate --engines knn rbm --folds u1 u2 u3 u4 u5 --workers 4 --output results.csv
+
+New engines are added to :py:data:`engines` with :py:func:`register_engine`.
+"""
+from __future__ import division, print_function, absolute_import
+
+# library packages
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+# third party packages
+import numpy as np
+
+# local files
+from ..config import config
+from ..datamodel import loaddata
+
+_logger = logging.getLogger(__name__)
+
+# the folds of ml-100k
+folds = ['u1', 'u2', 'u3', 'u4', 'u5', 'ua', 'ub']
+
+# columns of the result table
+columns = ['engine', 'fold', 'ntest', 'rmse', 'mae', 'train_time', 'predict_time', 'wall_time']
+
+class Engine:
+    """
+    Adapter between the evaluation and a predictor, it is trained on the data of a fold in :py:meth:`__init__`
+
+    :param data:    the data with the training ratings of the fold
+    :type data:     :py:class:`mrs.datamodel.loaddata.Data`
+    :param options: options of the engine given on the command line
+    :type options:  dict
+    """
+    def __init__(self, data, options):
+        self.data = data
+        self.options = options
+
+    def predict(self, users, items):
+        """
+        :param users: user id of every rating to predict
+        :type users:  ndarray
+        :param items: item id of every rating to predict
+        :type items:  ndarray
+        :return: the predicted ratings
+        :rtype:  ndarray
+        """
+        raise NotImplementedError
+
+    def predict_user(self, user_id):
+        """
+        :param user_id: id of the user
+        :type user_id:  int
+        :return: the predicted rating of every item, the rating of the item with id *i* is at index *i - 1*
+        :rtype:  ndarray
+        """
+        items = np.arange(1, self.data.get_shape()[1], dtype = np.int64)
+        return self.predict(np.full(len(items), user_id, dtype = np.int64), items)
+
+class KNNEngine(Engine):
+    def __init__(self, data, options):
+        Engine.__init__(self, data, options)
+        from .knn import KNN
+        if self.options.get('store'):
+            self.knn = KNN.open(data, similarity = self.options.get('similarity', 'pearson'))
+        else:
+            self.knn = KNN(data, similarity = self.options.get('similarity', 'pearson'))
+
+    def predict(self, users, items):
+        return np.array([self.knn.score(u, i) for u, i in zip(users.tolist(), items.tolist())])
+
+    def predict_user(self, user_id):
+        return self.knn.score_user(user_id)[1:]
+
+class ItemKNNEngine(Engine):
+    def __init__(self, data, options):
+        Engine.__init__(self, data, options)
+        from .itemknn import ItemKNN
+        self.knn = ItemKNN(data)
+
+    def predict(self, users, items):
+        predicted = np.zeros(len(users))
+        for user_id in np.unique(users).tolist():
+            rows = np.where(users == user_id)[0]
+            predicted[rows] = self.knn.score_user(user_id)[items[rows]]
+        return predicted
+
+    def predict_user(self, user_id):
+        return self.knn.score_user(user_id)[1:]
+
+class ANNEngine(Engine):
+    """
+    trains one network per user of the test ratings on all the training ratings of that user, with the option *store* the
+    networks are loaded from the :py:class:`mrs.recsys.annstore.NetworkStore` of the data instead if they were trained already
+    """
+    def __init__(self, data, options):
+        Engine.__init__(self, data, options)
+        from .predict import PredictNeuralNetwork
+        self.predictor = PredictNeuralNetwork(data)
+
+    def predict(self, users, items):
+        predicted = np.zeros(len(users))
+        for user_id in np.unique(users).tolist():
+            rows = np.where(users == user_id)[0]
+            if self.options.get('store'):
+                NN = self.predictor.get_network(user_id, self.options.get('epochs', 700), self.options.get('eta', .05))
+            else:
+                NN = self.predictor.train_for_an_user(list(self.data.get_user_by_id(user_id).get_movie_rating().items()),
+                                                      self.options.get('epochs', 700), self.options.get('eta', .05))
+            predicted[rows] = self.predictor.predict_items(NN, items[rows], self.options.get('decode', 'cap'))
+        return predicted
+
+class GlobalANNEngine(Engine):
+    """
+    trains one network on the ratings of all the users, or loads the saved one with the option *load* if it was trained
+    from the same ratings and parameters
+    """
+    def __init__(self, data, options):
+        Engine.__init__(self, data, options)
+        from .predict import PredictGlobalNetwork
+        self.predictor = PredictGlobalNetwork(data)
+        epoch, eta = self.options.get('epochs', 20), self.options.get('eta', .05)
+        if not (self.options.get('load') and self.predictor.load(epoch, eta)):
+            self.predictor.train(epoch, eta)
+
+    def predict(self, users, items):
+        return self.predictor.network.predict(users, items)
+
+    def predict_user(self, user_id):
+        return self.predictor.predict(user_id)[1:]
+
+class RBMEngine(Engine):
+    """
+    trains the RBM on the data, or loads the saved hyperparameters with the option *load*
+    """
+    def __init__(self, data, options):
+        Engine.__init__(self, data, options)
+        from .predict import PredictRBM
+        from .RBM_user import Trainer
+        self.predictor = PredictRBM(data)
+        if self.options.get('load'):
+            self.predictor.load_hyperparameters()
+        else:
+            Trainer(data, self.predictor.rating_matrix, self.predictor.rbm).train(self.options.get('epochs', 10), 1, self.options.get('eta', .05), save = False)
+
+    def predict(self, users, items):
+        predicted = np.zeros(len(users))
+        for user_id in np.unique(users).tolist():
+            rows = np.where(users == user_id)[0]
+            # the visible layer starts from the item with id 1
+            predicted[rows] = self.predictor.predict(user_id)[items[rows] - 1]
+        return np.clip(predicted, 1, 5)
+
+# name of the engine to its adapter
+engines = {'knn': KNNEngine, 'item': ItemKNNEngine, 'ann': ANNEngine, 'global': GlobalANNEngine, 'rbm': RBMEngine}
+
+def register_engine(name, engine):
+    """
+    :param name:   name of the engine used on the command line
+    :type name:    str
+    :param engine: subclass of :py:class:`Engine`, it has to be importable by the worker processes
+    :type engine:  type
+    """
+    engines[name] = engine
+
+def evaluate(engine_name, fold, data_location, options):
+    """
+    trains the engine on *fold.base* and predicts *fold.test*, it runs in a worker process
+
+    :return: one row of the result table
+    :rtype:  dict
+    """
+    start = time.time()
+    config.set_data_location(data_location)
+
+    data = loaddata.Data()
+    data.load_data('/%s.base' % fold)
+    users, items, ratings, _ = loaddata.read_ratings(os.path.join(data_location, fold + '.test'))
+
+    engine = engines[engine_name](data, options)
+    trained = time.time()
+    predicted = engine.predict(users.astype(np.int64), items.astype(np.int64))
+    done = time.time()
+
+    error = predicted - ratings
+    return {'engine': engine_name, 'fold': fold, 'ntest': len(ratings),
+            'rmse': float(np.sqrt(np.mean(error ** 2))), 'mae': float(np.mean(np.abs(error))),
+            'train_time': trained - start, 'predict_time': done - trained, 'wall_time': done - start}
+
+def evaluate_all(engine_names, fold_names, workers = None, options = None):
+    """
+    :return: one row of the result table per engine and fold, in the order of *engine_names* and *fold_names*
+    :rtype:  list
+    """
+    jobs = [(engine_name, fold) for engine_name in engine_names for fold in fold_names]
+    with ProcessPoolExecutor(max_workers = workers) as pool:
+        futures = [pool.submit(evaluate, engine_name, fold, config.get_data_location(), options or {}) for engine_name, fold in jobs]
+        results = []
+        for (engine_name, fold), future in zip(jobs, futures):
+            results.append(future.result())
+            _logger.info("%s on %s done", engine_name, fold)
+    return results
+
+def write_results(results, f, fmt):
+    """
+    :param results: rows returned by :py:func:`evaluate_all`
+    :type results:  list
+    :param f:       file to write to
+    :param fmt:     *table*, *csv* or *json*
+    :type fmt:      str
+    """
+    if fmt == 'json':
+        json.dump(results, f, indent = 2)
+        f.write('\n')
+    elif fmt == 'csv':
+        writer = csv.DictWriter(f, fieldnames = columns)
+        writer.writeheader()
+        writer.writerows(results)
+    else:
+        f.write('%-8s %-5s %7s %8s %8s %11s %13s %10s\n' % tuple(columns))
+        for row in results:
+            f.write('%(engine)-8s %(fold)-5s %(ntest)7d %(rmse)8.4f %(mae)8.4f %(train_time)11.2f %(predict_time)13.2f %(wall_time)10.2f\n' % row)
+
+def parse_args(args):
+    """
+    Parse command line parameters
+
+    :param args: command line parameters as list of strings
+    :return: command line parameters as :obj:`argparse.Namespace`
+    """
+    parser = argparse.ArgumentParser(description = "Evaluate the predictors on the folds of the data set")
+    parser.add_argument('--engines', nargs = '+', default = ['knn', 'ann', 'rbm'], help = "engines to evaluate: %(default)s")
+    parser.add_argument('--folds', nargs = '+', default = folds, help = "folds to evaluate on: %(default)s")
+    parser.add_argument('--workers', type = int, default = None, help = "number of worker processes, by default the number of cores")
+    parser.add_argument('--epochs', type = int, default = None, help = "training epochs of ann and rbm")
+    parser.add_argument('--similarity', default = None, help = "similarity of the users of knn, see mrs.recsys.cf.kernels")
+    parser.add_argument('--data', default = None, help = "directory of the data set")
+    parser.add_argument('--format', choices = ['table', 'csv', 'json'], default = None, help = "output format, by default csv for --output and table otherwise")
+    parser.add_argument('--output', default = None, help = "file to write the results to")
+    return parser.parse_args(args)
+
+def main(args):
+    args = parse_args(args)
+    for name in args.engines:
+        if name not in engines:
+            raise SystemExit("unknown engine %s, choose from %s" % (name, ', '.join(sorted(engines))))
+    if args.data:
+        config.set_data_location(args.data)
+    options = {} if args.epochs is None else {'epochs': args.epochs}
+    if args.similarity:
+        options['similarity'] = args.similarity
+
+    results = evaluate_all(args.engines, args.folds, args.workers, options)
+
+    fmt = args.format or ('csv' if args.output else 'table')
+    if args.output:
+        with open(args.output, 'w', newline = '') as f:
+            write_results(results, f, fmt)
+    else:
+        write_results(results, sys.stdout, fmt)
+
+def run():
+    logging.basicConfig(level = logging.INFO, stream = sys.stderr)
+    main(sys.argv[1:])
+
+if __name__ == "__main__":
+    run()
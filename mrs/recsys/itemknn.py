@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# third party packages
+import numpy as np
+
+# local packages
+from mrs.recsys.cf import Correlation
+from mrs.recsys.neighbors import NeighborIndex
+from mrs.recsys.recommend import recommend
+
+class ItemKNN:
+    '''
+    Item based collaborative filtering: the rating of a user for a movie is predicted from the ratings the user gave to the movies
+    most similar to it. The adjusted cosine similarities between the movies are computed once and only the most similar movies of
+    every movie are kept in a :py:class:`mrs.recsys.neighbors.NeighborIndex`, which is saved and loaded with :py:meth:`save` and
+    :py:meth:`load`. A prediction only reads the ratings of the user, so ratings of new users are used as soon as they are added
+    to the data and nothing has to be recomputed.
+    '''
+    def __init__(self, data, neighbors = 300, min_overlap = 1, shrinkage = 100, neighbor_index = None, block_size = 256):
+        """
+        :param data:           the loaded data set
+        :type data:            :py:class:`mrs.datamodel.loaddata.Data`
+        :param neighbors:      number of most similar movies kept per movie
+        :type neighbors:       int
+        :param min_overlap:    movies rated by fewer common users than this are not similar, see :py:meth:`mrs.recsys.cf.Correlation.adjusted_cosine`
+        :type min_overlap:     int
+        :param shrinkage:      see :py:meth:`mrs.recsys.cf.Correlation.adjusted_cosine`
+        :type shrinkage:       float
+        :param neighbor_index: index already built, e.g. loaded with :py:meth:`load`, it is built from *data* if None
+        :type neighbor_index:  :py:class:`mrs.recsys.neighbors.NeighborIndex`
+        :param block_size:     number of movies whose similarities are computed at once
+        :type block_size:      int
+        """
+        self.data = data
+        if neighbor_index is None:
+            neighbor_index = self.build(neighbors, min_overlap, shrinkage, block_size)
+        self.neighbor_index = neighbor_index
+
+    def build(self, neighbors, min_overlap, shrinkage, block_size):
+        """
+        computes the similarities of a block of movies to all the movies at a time and keeps the most similar ones,
+        so the whole item item matrix never has to fit in memory
+
+        :return: the most similar movies of every movie
+        :rtype:  :py:class:`mrs.recsys.neighbors.NeighborIndex`
+        """
+        rating_matrix = self.data.get_sparse_rating_matrix()
+        user_means = self.data.get_stats().user_mean
+        nitems = rating_matrix.shape[1]
+
+        index = NeighborIndex.empty(nitems, neighbors)
+        for start in range(0, nitems, block_size):
+            items = np.arange(start, min(start + block_size, nitems))
+            index.set_rows(Correlation().adjusted_cosine(rating_matrix, user_means, items, min_overlap, shrinkage, block_size = block_size), items)
+        return index
+
+    def save(self, path):
+        """
+        :param path: *.npz* file to write the similar movies to
+        :type path:  str
+        """
+        self.neighbor_index.save(path)
+
+    @classmethod
+    def load(cls, data, path):
+        """
+        :param data: the loaded data set
+        :type data:  :py:class:`mrs.datamodel.loaddata.Data`
+        :param path: file written by :py:meth:`save`
+        :type path:  str
+        :return: the predictor with the saved similarities
+        :rtype:  :py:class:`ItemKNN`
+        """
+        return cls(data, neighbor_index = NeighborIndex.load(path))
+
+    def score_ratings(self, items, ratings, movie_ids = None):
+        r'''
+        Predicts the ratings of a user from the ratings the user gave, the user doesn't have to be in the data
+        $P_{a, i} = \overline{r_a} + \frac{\sum_{j \in N(i)} (r_{a, j} - \overline{r_a}) * s_{i, j}}{\sum_{j \in N(i)} |s_{i, j}|}$
+        where $N(i)$ are the movies most similar to $i$ which user $a$ rated and $s_{i, j}$ their similarity.
+        Without such movies the prediction is the mean rating of the user.
+
+        :param items:     ids of the movies rated by the user
+        :type items:      array_like
+        :param ratings:   the ratings the user gave them
+        :type ratings:    array_like
+        :param movie_ids: ids of the movies to predict, all the movie ids if None
+        :type movie_ids:  array_like
+        :return: the predicted ratings, indexed by movie id if *movie_ids* is None
+        :rtype:  ndarray
+        '''
+        nitems = len(self.neighbor_index.ids)
+        items, ratings = np.asarray(items, dtype = np.int64), np.asarray(ratings, dtype = np.float64)
+        movie_ids = np.arange(nitems) if movie_ids is None else np.asarray(movie_ids, dtype = np.int64)
+        if len(ratings) == 0:
+            return np.full(len(movie_ids), fill_value = np.clip(self.data.get_stats().get_global_mean(), 1, 5))
+
+        # centered ratings of the user by movie id, nan for the movies the user didn't rate or which are unknown to the index
+        mean_r_a = ratings.mean()
+        known = items < nitems
+        r = np.full(nitems + 1, fill_value = np.nan)
+        r[items[known]] = ratings[known] - mean_r_a
+
+        ids = self.neighbor_index.ids[np.minimum(movie_ids, nitems - 1)]
+        weights = self.neighbor_index.weights[np.minimum(movie_ids, nitems - 1)].astype(np.float64)
+        ids[movie_ids >= nitems] = -1
+
+        # the padding id -1 reads the nan at the end of r
+        rated = ~np.isnan(r[ids])
+        s = np.where(rated, r[ids] * weights, 0).sum(axis = 1)
+        w = np.where(rated, np.abs(weights), 0).sum(axis = 1)
+
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            res = mean_r_a + np.where(w > 0, s / w, 0)
+        return np.clip(res, 1, 5)
+
+    def score_user(self, user_id):
+        '''
+        :param user_id: id of the user
+        :type user_id:  int
+        :return: predicted rating of every movie id from the ratings of the user in the data
+        :rtype:  ndarray
+        '''
+        items, ratings = self.data.get_users().get_ratings(user_id) if user_id in self.data.get_users() else ((), ())
+        return self.score_ratings(items, ratings)
+
+    def score(self, user_id, movie_id):
+        '''
+        :return: predicted rating of the user for the movie
+        :rtype:  float
+        '''
+        items, ratings = self.data.get_users().get_ratings(user_id) if user_id in self.data.get_users() else ((), ())
+        return float(self.score_ratings(items, ratings, [movie_id])[0])
+
+    def recommend(self, user_id, n = 10, exclude_rated = True, genre = None, batch_size = 4096):
+        '''
+        :return: ids and predicted ratings of the *n* movies with the highest predicted rating, see :py:func:`mrs.recsys.recommend.recommend`
+        :rtype:  tuple
+        '''
+        items, ratings = self.data.get_users().get_ratings(user_id) if user_id in self.data.get_users() else ((), ())
+        return recommend(lambda movie_ids: self.score_ratings(items, ratings, movie_ids), self.data, user_id, n, exclude_rated, genre, batch_size)
@@ -1,22 +1,129 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+# third party packages
+import numpy as np
+
 # local packages
-from mrs.recsys.cf import Correlation
+from mrs.recsys.cf import Correlation, PearsonKernel, PearsonStatistics, get_kernel
+from mrs.recsys.neighbors import NeighborIndex
+from mrs.recsys.recommend import recommend
+from mrs.recsys.store import open_similarity
+
+# number of the most similar users who rated a movie its prediction is made from
+neighbor_count = 40
+
+# number of the most similar users kept per user by default, None keeps all the other users
+default_neighbors = 300
 
 class KNN:
     '''
     It finds out the most similar n(=40) users for a particular user who also has rated that specific movie.
     Based on those users rating it predicts rating for the movie by that user.
     '''
-    def __init__(self, data):
+    def __init__(self, data, sparse = False, correlation_matrix = None, neighbors = default_neighbors, neighbor_index = None, approximate = None,
+                 similarity = 'pearson'):
+        """
+        :param data:               the loaded data set
+        :type data:                :py:class:`mrs.datamodel.loaddata.Data`
+        :param sparse:             work on a :py:class:`mrs.datamodel.matrix.SparseRatingMatrix` instead of the dense rating matrix
+        :type sparse:              bool
+        :param correlation_matrix: correlations already computed for *data*, e.g. attached from shared memory, computed if None
+        :type correlation_matrix:  ndarray
+        :param neighbors:          number of most similar users kept per user in :py:attr:`neighbor_index`, the
+                                   :py:data:`neighbor_count` neighbors used by :py:meth:`score` are taken from them. The
+                                   :py:data:`default_neighbors` bound the memory and the time of a prediction for large data sets,
+                                   None keeps all the other users, which gives the same predictions as going over the whole
+                                   correlation row
+        :type neighbors:           int
+        :param neighbor_index:     index already built for the correlations, e.g. loaded with :py:meth:`mrs.recsys.neighbors.NeighborIndex.load`
+        :type neighbor_index:      :py:class:`mrs.recsys.neighbors.NeighborIndex`
+        :param approximate:        find the neighbors with this approximate index instead of the whole correlation matrix, which
+                                   is then never computed, for data sets with too many users for it. None is taken as :py:data:`default_neighbors`.
+        :type approximate:         :py:class:`mrs.recsys.approximate.IVFIndex`
+        :param similarity:         similarity of the users, a :py:class:`mrs.recsys.cf.Kernel` or the name of one in
+                                   :py:data:`mrs.recsys.cf.kernels`, e.g. *cosine* or *jaccard* which are faster and less
+                                   accurate than pearson. The approximate search always uses pearson.
+        :type similarity:          str
+        """
         self.data = data
-        self.rating_matrix = data.get_rating_matrix_with_nan()
-        self.correlation_matrix = Correlation().pearson(self.rating_matrix)
+        self.sparse = sparse
+        self.neighbors = neighbors
+        self.approximate = approximate
+        self.kernel = get_kernel(similarity)
+        self.rating_matrix = self.get_rating_matrix()
+        if approximate is not None:
+            self.correlation_matrix = correlation_matrix
+            self.neighbor_index = neighbor_index if neighbor_index is not None else approximate.get_neighbor_index(neighbors or default_neighbors)
+        else:
+            self.correlation_matrix = correlation_matrix if correlation_matrix is not None else Correlation().similarity(self.rating_matrix, self.kernel)
+            self.neighbor_index = neighbor_index if neighbor_index is not None else NeighborIndex.build(self.correlation_matrix, neighbors)
+        # sufficient statistics of the pearson correlations, computed when the ratings change for the first time
+        self.statistics = None
+
+        # keep the rating and correlation matrices up to date when ratings are added to the data
+        data.add_listener(self.ratings_changed)
+
+    @classmethod
+    def open(cls, data, sparse = False, neighbors = default_neighbors, similarity = 'pearson', path = None):
+        """
+        :param path: directory of the store, see :py:func:`mrs.recsys.store.open_similarity`
+        :type path:  str
+        :return: the predictor with the similarities and neighbors memory-mapped from the store in the model location, they
+                 are computed and saved first if the store is missing or was built from other ratings or parameters,
+                 see :py:meth:`__init__` for the other parameters
+        :rtype:  :py:class:`KNN`
+        """
+        kernel = get_kernel(similarity)
+        correlation_matrix, neighbor_index = open_similarity(data, kernel, neighbors, sparse, path)
+        return cls(data, sparse, correlation_matrix, neighbors, neighbor_index, similarity = kernel)
 
-    def sort(self, user_id, user_vector):
-        nan_eliminated = filter(lambda x: -1 <= x[1] <= 1, enumerate(self.user_vector))
-        self.user_vector = sorted(nan_eliminated, key = lambda x: x[1], reverse = True)
+    def get_rating_matrix(self):
+        if self.sparse:
+            return self.data.get_sparse_rating_matrix()
+        return self.data.get_rating_matrix_with_nan()
+
+    def ratings_changed(self, users, items):
+        """
+        Called by :py:meth:`mrs.datamodel.loaddata.Data.add_ratings`, only the correlations of the users whose ratings changed
+        are recomputed. Pearson correlations are recomputed from the statistics in :py:attr:`statistics`, which are updated
+        with the changed ratings only, the other similarities from the ratings of the changed users.
+
+        :param users: ids of the users whose ratings changed
+        :type users:  ndarray
+        :param items: ids of the items whose ratings changed
+        :type items:  ndarray
+        """
+        self.rating_matrix = self.get_rating_matrix()
+        if self.approximate is not None:
+            self._approximate_changed(users)
+            return
+        if isinstance(self.kernel, PearsonKernel):
+            if self.statistics is None:
+                self.statistics = PearsonStatistics(self.rating_matrix)
+            self.correlation_matrix = self.statistics.update_correlations(self.correlation_matrix, self.rating_matrix, users,
+                                                                          self.kernel.min_overlap, self.kernel.shrinkage)
+        else:
+            self.correlation_matrix = Correlation().update_similarity(self.correlation_matrix, self.rating_matrix, users, self.kernel)
+            if not self.kernel.incremental:
+                # the whole matrix was computed again
+                users = np.arange(self.correlation_matrix.shape[0])
+        self.neighbor_index.resize(self.correlation_matrix.shape[0], self.neighbors)
+        self.neighbor_index.update(self.correlation_matrix, users)
+
+    def _approximate_changed(self, users):
+        """
+        searches the neighbors of the users whose ratings changed again, the neighbors of the other users are kept.
+        Users beyond the approximate index rebuild it for the new number of users.
+        """
+        size = self.neighbor_index.ids.shape[1]
+        rating_matrix = self.data.get_sparse_rating_matrix()
+        if self.approximate.rating_matrix.shape[0] != rating_matrix.shape[0]:
+            self.approximate = self.approximate.rebuild(rating_matrix, self.data.get_stats().user_mean)
+            self.neighbor_index = self.approximate.get_neighbor_index(size)
+            return
+        for user_id in users.tolist():
+            self.neighbor_index.set_neighbors(user_id, *self.approximate.query(user_id, size, rating_matrix = rating_matrix))
 
     def score(self, user_id, movie_id):
         '''
@@ -28,33 +135,127 @@ class KNN:
               $w_{a, u}$ is the weight between user $a$ and $u$ which makes some rating higher weight than others
               based on how similar the user $a$ is to user $u$
         '''
-        #print(self.rating_matrix[user_id][movie_id])
         mean_r_a = self.data.get_mean_rating_of_user(user_id)
-        count, s, w = 40, 0, 0
-
-        
-        self.user_vector = self.correlation_matrix[user_id]
-        self.sort(user_id, self.user_vector)
-
-        for _user_id, w_a_u in self.user_vector:
-            if count <= 0:
-                break
-            if _user_id == user_id:
-                continue
-            elif 1 <= self.rating_matrix[_user_id][movie_id] <= 5:
-                mean_r_u = self.data.get_mean_rating_of_user(_user_id)
-                s += (self.rating_matrix[_user_id][movie_id] - mean_r_u) * w_a_u
-                w += w_a_u
-                count -= 1
-        
-        try:
-            res = mean_r_a + s / w
-        except ZeroDivisionError:
-            res = 1
 
+        # the neighbors are scanned from the most similar one, the first ones who rated the movie are used
+        ids, weights = self.neighbor_index.get_neighbors(user_id)
+        if self.sparse:
+            r = self.rating_matrix.get_columns([movie_id])[ids, 0]
+        else:
+            r = self.rating_matrix[ids, movie_id]
+        with np.errstate(invalid = 'ignore'):
+            rated = np.where((r >= 1) & (r <= 5))[0][:neighbor_count]
+
+        if len(rated) == 0:
+            return 1
+        mean_r_u = self.data.get_stats().user_mean[ids[rated]]
+        s = ((r[rated] - mean_r_u) * weights[rated]).sum(dtype = np.float64)
+        w = weights[rated].sum(dtype = np.float64)
+
+        res = mean_r_a + s / w if w != 0 else 1
 
         if 1 <= res <= 5:
             return res
         elif res < 1:
             return 1
         elif res > 5: return 5
+
+    def _rated_columns(self, item_ids = None):
+        '''
+        :param item_ids: ids of the items, all the items if None
+        :type item_ids:  ndarray
+        :return: user id, item and rating of every rating ordered by item, taken from the columns of the sparse rating matrix.
+                 The item is the item id, or the index in *item_ids* if they are given.
+        :rtype:  tuple
+        '''
+        m = self.rating_matrix if self.sparse else self.data.get_sparse_rating_matrix()
+        if item_ids is None:
+            items = np.repeat(np.arange(m.shape[1]), m.col_nnz())
+            users, ratings = m.col_indices, m.col_data
+        else:
+            item_ids = np.asarray(item_ids, dtype = np.int64)
+            starts = m.col_indptr[np.minimum(item_ids, m.shape[1] - 1)]
+            counts = np.where(item_ids < m.shape[1], m.col_indptr[np.minimum(item_ids + 1, m.shape[1])] - starts, 0)
+            pos    = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            items  = np.repeat(np.arange(len(item_ids)), counts)
+            users, ratings = m.col_indices[pos], m.col_data[pos]
+        rated = (ratings >= 1) & (ratings <= 5)
+        return users[rated], items[rated], ratings[rated].astype(np.float64)
+
+    def score_user(self, user_id, columns = None):
+        '''
+        Same prediction as :py:meth:`score` for every item at once. Every rating given by a neighbor of the user gets the rank of
+        that neighbor in :py:attr:`neighbor_index`, sorting them by item and rank gives the :py:data:`neighbor_count` most similar
+        neighbors who rated each item and the weighted sums of all the items are two :py:func:`numpy.bincount`.
+
+        :param user_id: id of the user
+        :type user_id:  int
+        :param columns: the ratings ordered by item as returned by :py:meth:`_rated_columns`, to reuse them for many users
+        :type columns:  tuple
+        :return: predicted rating of every item id, the index is the item id like the columns of the rating matrix
+        :rtype:  ndarray
+        '''
+        return self._score_columns(user_id, columns if columns is not None else self._rated_columns(), self.rating_matrix.shape[1])
+
+    def score_items(self, user_id, item_ids):
+        '''
+        Same prediction as :py:meth:`score_user` for some items only, the work is proportional to the number of ratings of
+        those items
+
+        :param user_id:  id of the user
+        :type user_id:   int
+        :param item_ids: ids of the items
+        :type item_ids:  ndarray
+        :return: predicted rating of every item in *item_ids*
+        :rtype:  ndarray
+        '''
+        return self._score_columns(user_id, self._rated_columns(item_ids), len(item_ids))
+
+    def _score_columns(self, user_id, columns, nitems):
+        '''
+        :return: predicted rating of the *nitems* items of *columns*, see :py:meth:`score_user`
+        :rtype:  ndarray
+        '''
+        users, items, ratings = columns
+        ids, weights = self.neighbor_index.get_neighbors(user_id)
+        n = len(ids)
+
+        # rank of every rating's user among the neighbors, n for users who aren't neighbors
+        rank = np.full(self.rating_matrix.shape[0], fill_value = n, dtype = np.int64)
+        rank[ids] = np.arange(n)
+        rank = rank[users]
+        neighbor = rank < n
+
+        key   = items[neighbor] * n + rank[neighbor]
+        order = np.argsort(key)
+        item, rank = key[order] // n, key[order] % n
+        per_item = np.bincount(item, minlength = nitems)
+        used = np.arange(len(key)) - np.repeat(np.cumsum(per_item) - per_item, per_item) < neighbor_count
+        item, rank, r = item[used], rank[used], ratings[neighbor][order][used]
+
+        mean_r_u = self.data.get_stats().user_mean[ids[rank]]
+        w_a_u = weights[rank].astype(np.float64)
+        s = np.bincount(item, weights = (r - mean_r_u) * w_a_u, minlength = nitems)
+        w = np.bincount(item, weights = w_a_u, minlength = nitems)
+
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            res = self.data.get_mean_rating_of_user(user_id) + s / w
+        res[(w == 0) | (np.bincount(item, minlength = nitems) == 0)] = 1
+        return np.clip(res, 1, 5)
+
+    def recommend(self, user_id, n = 10, exclude_rated = True, genre = None, batch_size = 4096):
+        '''
+        :return: ids and predicted ratings of the *n* items with the highest predicted rating, see :py:func:`mrs.recsys.recommend.recommend`
+        :rtype:  tuple
+        '''
+        return recommend(lambda item_ids: self.score_items(user_id, item_ids), self.data, user_id, n, exclude_rated, genre, batch_size)
+
+    def score_users(self, user_ids):
+        '''
+        :param user_ids: ids of the users
+        :type user_ids:  list
+        :return: predicted rating of every item id for every user, one row per user in the order of *user_ids*
+        :rtype:  ndarray
+        '''
+        columns = self._rated_columns()
+        return np.array([self.score_user(user_id, columns) for user_id in user_ids]).reshape(-1, self.rating_matrix.shape[1])
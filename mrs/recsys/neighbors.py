@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module: neighbors
+   :synopsis: precomputed most similar users of every user
+
+:py:class:`NeighborIndex` keeps for every user the ids and weights of its *size* most similar users, ordered from the most
+similar one, in two contiguous *(nusers, size)* arrays. The same index holds the most similar items of every item. It is built once from a correlation matrix with
+:py:func:`numpy.argpartition`, so a prediction only scans the row of the user instead of sorting a whole row of the
+correlation matrix. Rows with fewer valid neighbors are padded with the id -1 and the weight nan.
+
+:Example:
+
+>>> index = NeighborIndex.build(knn.correlation_matrix, 300)
+>>> ids, weights = index.get_neighbors(196)
+>>> index.save('neighbors.npz')
+"""
+
+# third party packages
+import numpy as np
+
+class NeighborIndex:
+    """
+    :param ids:     neighbor ids, one row per user
+    :type ids:      ndarray
+    :param weights: weight of every neighbor, one row per user
+    :type weights:  ndarray
+    """
+    def __init__(self, ids, weights):
+        self.ids     = ids
+        self.weights = weights
+
+    @classmethod
+    def build(cls, correlation_matrix, size = None, block_size = 1024):
+        """
+        :param correlation_matrix: similarity between every pair of users, nan where it isn't defined
+        :type correlation_matrix:  ndarray
+        :param size:               number of neighbors kept per user, all the other users if None
+        :type size:                int
+        :param block_size:         number of rows selected at once
+        :type block_size:          int
+        :return: the index of the most similar users of every user
+        :rtype:  :py:class:`NeighborIndex`
+        """
+        nusers = correlation_matrix.shape[0]
+        index  = cls.empty(nusers, size)
+        for start in range(0, nusers, block_size):
+            users = np.arange(start, min(start + block_size, nusers))
+            index.set_rows(correlation_matrix[users], users)
+        return index
+
+    @classmethod
+    def empty(cls, n, size = None):
+        """
+        :param n:    number of rows, the ids go from 0 to *n - 1*
+        :type n:     int
+        :param size: number of neighbors kept per row, all the other ids if None
+        :type size:  int
+        :return: index without neighbors, to be filled block by block with :py:meth:`set_rows` when the whole similarity matrix is too large
+        :rtype:  :py:class:`NeighborIndex`
+        """
+        size = max(n - 1, 1) if size is None else min(size, max(n - 1, 1))
+        return cls(np.full((n, size), fill_value = -1, dtype = np.int32), np.full((n, size), fill_value = np.nan, dtype = np.float32))
+
+    def _writeable(self):
+        """
+        copies the arrays if they are read only, e.g. memory-mapped from a :py:class:`mrs.recsys.store.SimilarityStore`
+        """
+        if not self.ids.flags.writeable or not self.weights.flags.writeable:
+            self.ids, self.weights = np.array(self.ids), np.array(self.weights)
+
+    def set_rows(self, similarities, users):
+        """
+        selects the neighbors of *users* from their rows of the similarity matrix, a user is never its own neighbor
+
+        :param similarities: similarity of every user in *users* to every id, one row per user
+        :type similarities:  ndarray
+        :param users:        ids of the rows
+        :type users:         ndarray
+        """
+        self._writeable()
+        size = self.ids.shape[1]
+        c = np.array(similarities, dtype = np.float32)
+        c[np.isnan(c)] = -np.inf
+        c[np.arange(len(users)), users] = -np.inf
+
+        top = np.argpartition(-c, size - 1, axis = 1)[:, :size] if size < c.shape[1] else np.tile(np.arange(c.shape[1]), (len(users), 1))
+        # neighbors with the same weight are ordered by id
+        top = np.sort(top, axis = 1)
+        w = np.take_along_axis(c, top, axis = 1)
+        order = np.argsort(-w, axis = 1, kind = 'stable')
+        top, w = np.take_along_axis(top, order, axis = 1), np.take_along_axis(w, order, axis = 1)
+
+        valid = np.isfinite(w)
+        self.ids[users]     = np.where(valid, top, -1)
+        self.weights[users] = np.where(valid, w, np.nan)
+
+    def set_neighbors(self, user_id, ids, weights):
+        """
+        sets the neighbors of one user from a list of candidates, e.g. found by an approximate search, the candidates with a weight
+        of nan are dropped and the most similar ones are kept
+
+        :param user_id: id of the user
+        :type user_id:  int
+        :param ids:     ids of the candidates
+        :type ids:      ndarray
+        :param weights: weight of every candidate
+        :type weights:  ndarray
+        """
+        self._writeable()
+        ids, weights = np.asarray(ids), np.asarray(weights, dtype = np.float32)
+        valid = ~np.isnan(weights) & (ids != user_id)
+        ids, weights = ids[valid], weights[valid]
+        order = np.lexsort((ids, -weights))[:self.ids.shape[1]]
+
+        self.ids[user_id], self.weights[user_id] = -1, np.nan
+        self.ids[user_id, :len(order)], self.weights[user_id, :len(order)] = ids[order], weights[order]
+
+    def resize(self, n, limit = None):
+        """
+        adds rows without neighbors for new ids up to *n - 1*, an index which keeps all the other ids as neighbors also gets
+        room for the new ids in every row, they are filled by :py:meth:`update` or :py:meth:`set_rows`
+
+        :param n:     number of rows
+        :type n:      int
+        :param limit: number of neighbors the index was built for, see :py:meth:`build`, an index which keeps all the other
+                      ids because there were fewer of them grows up to it only
+        :type limit:  int
+        """
+        old_n, size = self.ids.shape
+        if n <= old_n:
+            return
+        if size == max(old_n - 1, 1):
+            size = max(n - 1, 1) if limit is None else max(size, min(limit, max(n - 1, 1)))
+        grown = self.empty(n, size)
+        grown.ids[:old_n, :self.ids.shape[1]], grown.weights[:old_n, :self.ids.shape[1]] = self.ids, self.weights
+        self.ids, self.weights = grown.ids, grown.weights
+
+    def update(self, correlation_matrix, users):
+        """
+        Updates the rows which can change after the correlations of *users* were recomputed: the rows of those users and of
+        every user which had one of them as neighbor or whose new correlation with one of them beats its weakest neighbor.
+
+        The rows of *users* are selected again from the correlation matrix. In the other rows the changed users are taken out
+        and put back at the place of their new weight, the rest of the row is already ordered, so only the changed users are
+        compared with it. A full row which kept a changed user with a weight no better than its weakest neighbor is selected
+        again instead, users which weren't in the row may come before it now.
+
+        :param correlation_matrix: the correlation matrix with the recomputed rows and columns of *users*
+        :type correlation_matrix:  ndarray
+        :param users:              ids of the users whose correlations changed
+        :type users:               ndarray
+        """
+        self._writeable()
+        users = np.unique(np.asarray(users, dtype = np.int64))
+        nrows = len(self.ids)
+        c = np.array(correlation_matrix[:, users], dtype = np.float32)
+        c[np.isnan(c)] = -np.inf
+        c[users, np.arange(len(users))] = -np.inf
+
+        # new weight of every changed user ranks before the weakest neighbor of the row, ties are ordered by id
+        weakest_w = np.where(np.isnan(self.weights[:, -1]), -np.inf, self.weights[:, -1])[:, None]
+        weakest_id = np.where(self.ids[:, -1] < 0, np.iinfo(np.int64).max, self.ids[:, -1])[:, None]
+        beats = np.isfinite(c) & ((c > weakest_w) | ((c == weakest_w) & (users[None, :] < weakest_id)))
+
+        in_row = np.isin(self.ids, users)
+        rows, columns = np.nonzero(in_row)
+        falls = ~beats[rows, np.searchsorted(users, self.ids[rows, columns])] & np.isfinite(weakest_w[rows, 0])
+
+        rebuild = np.zeros(nrows, dtype = bool)
+        rebuild[users] = True
+        rebuild[rows[falls]] = True
+        merge = np.where((in_row.any(axis = 1) | beats.any(axis = 1)) & ~rebuild)[0]
+        rebuild = np.where(rebuild)[0]
+
+        if len(rebuild):
+            self.set_rows(correlation_matrix[rebuild], rebuild)
+        if len(merge):
+            self._merge(merge, users, c[merge], in_row[merge])
+
+    def _merge(self, rows, users, weights, in_row):
+        """
+        puts the changed users back into *rows* at the place of their new *weights*, one column of *weights* per user of *users*
+        """
+        size = self.ids.shape[1]
+        ids, w = self.ids[rows], self.weights[rows]
+        kept = ~in_row & (ids >= 0)
+        valid = np.isfinite(weights)
+        # place of every changed user among the changed ones
+        order = np.argsort(-weights, axis = 1, kind = 'stable')
+        new_pos = np.empty_like(order)
+        np.put_along_axis(new_pos, order, np.arange(len(users))[None, :].repeat(len(rows), axis = 0), axis = 1)
+
+        # every kept neighbor moves forward by the changed users taken out before it and back by the ones put back before it
+        kept_pos = np.broadcast_to(np.arange(size), ids.shape) - np.cumsum(in_row, axis = 1, dtype = np.int32) + in_row
+        for j, user_id in enumerate(users.tolist()):
+            w_j = weights[:, j:j + 1]
+            before = w_j > w
+            ties = w_j == w
+            if ties.any():
+                before |= ties & (user_id < ids)
+            before &= valid[:, j:j + 1]
+            kept_pos += before
+            new_pos[:, j] += np.count_nonzero(kept & ~before, axis = 1)
+
+        # everything which doesn't make it into the row goes to an extra column which is dropped
+        kept_pos = np.where(kept & (kept_pos < size), kept_pos, size)
+        new_pos = np.where(valid & (new_pos < size), new_pos, size)
+        offsets = np.arange(len(rows))[:, None] * (size + 1)
+        kept_pos, new_pos = (kept_pos + offsets).ravel(), (new_pos + offsets).ravel()
+        out_ids = np.full((len(rows), size + 1), fill_value = -1, dtype = self.ids.dtype)
+        out_w = np.full((len(rows), size + 1), fill_value = np.nan, dtype = self.weights.dtype)
+        out_ids.ravel()[kept_pos], out_w.ravel()[kept_pos] = ids.ravel(), w.ravel()
+        out_ids.ravel()[new_pos], out_w.ravel()[new_pos] = np.tile(users, len(rows)), weights.ravel()
+        self.ids[rows], self.weights[rows] = out_ids[:, :size], out_w[:, :size]
+
+    def get_neighbors(self, user_id):
+        """
+        :return: ids and weights of the neighbors of the user ordered from the most similar one, without the padding
+        :rtype:  tuple
+        """
+        ids = self.ids[user_id]
+        n = int(np.count_nonzero(ids >= 0))
+        return ids[:n], self.weights[user_id, :n]
+
+    def save(self, path):
+        """
+        :param path: *.npz* file to write the index to
+        :type path:  str
+        """
+        np.savez(path, ids = self.ids, weights = self.weights)
+
+    @classmethod
+    def load(cls, path):
+        """
+        :param path: file written by :py:meth:`save`
+        :type path:  str
+        :return: the saved index
+        :rtype:  :py:class:`NeighborIndex`
+        """
+        with np.load(path) as f:
+            return cls(f['ids'], f['weights'])
@@ -11,10 +11,14 @@ import pickle
 import numpy as np
 
 # local files
-from ..datamodel import loaddata, nitems, nusers
-from . import cf, ann, convert
-from . import hyperparam_loc
+from ..config import config
+from ..datamodel import loaddata
+from . import cf, ann
+from . import hyperparam_filename, network_filename
 from . import RBM_user
+from .recommend import recommend
+from . import store
+from . import annstore
 
 class Predict:
     """
@@ -22,9 +26,28 @@ class Predict:
 
     Not matter what technique you use you will load the data first so it makes sense to load the data in __init__ method. Different techniques use different algorithms to calculate the prediction, so each method have its own separate implementation.
     """
-    def __init__(self):
-        self.data = loaddata.Data()
-        self.data.load_data()
+    def __init__(self, data = None):
+        """
+        :param data: already loaded data set to share with other predictors, if None the data set is loaded
+        :type data:  :py:class:`mrs.datamodel.loaddata.Data`
+        """
+        if data is None:
+            data = loaddata.Data()
+            data.load_data()
+        self.data = data
+        self.data.add_listener(self.ratings_changed)
+
+    def ratings_changed(self, users, items):
+        """
+        Called by :py:meth:`mrs.datamodel.loaddata.Data.add_ratings` with the ids of the users and items whose ratings changed.
+        Predictors which keep something derived from the ratings override it to bring it up to date.
+
+        :param users: ids of the users whose ratings changed
+        :type users:  ndarray
+        :param items: ids of the items whose ratings changed
+        :type items:  ndarray
+        """
+        pass
 
     @staticmethod
     def scale(l):
@@ -49,10 +72,74 @@ class Predict:
         return l
 
 class PredictNeuralNetwork(Predict):
-    def __init__(self):
-        Predict.__init__(self)
-        self.rating_matrix      = self.data.get_rating_matrix_with_nan()
-        self.correlation_matrix = cf.Correlation().pearson(self.rating_matrix)
+    def __init__(self, data = None, correlation_matrix = None):
+        """
+        :param data:               see :py:class:`Predict`
+        :type data:                :py:class:`mrs.datamodel.loaddata.Data`
+        :param correlation_matrix: correlations already computed for the data, e.g. attached from shared memory, computed on
+                                   first use if None, the networks of the users don't need them
+        :type correlation_matrix:  ndarray
+        """
+        Predict.__init__(self, data)
+        self.rating_matrix       = self.data.get_rating_matrix_with_nan()
+        self._correlation_matrix = correlation_matrix
+        self.statistics          = None
+        self.networks            = None
+
+    @property
+    def correlation_matrix(self):
+        """
+        the pearson correlations of the users, computed the first time they are asked for
+        """
+        if self._correlation_matrix is None:
+            self._correlation_matrix = cf.Correlation().pearson(self.rating_matrix)
+        return self._correlation_matrix
+
+    @correlation_matrix.setter
+    def correlation_matrix(self, correlation_matrix):
+        self._correlation_matrix = correlation_matrix
+
+    @classmethod
+    def open(cls, data = None, path = None):
+        """
+        :param data: see :py:class:`Predict`
+        :type data:  :py:class:`mrs.datamodel.loaddata.Data`
+        :param path: directory of the store, see :py:func:`mrs.recsys.store.open_similarity`
+        :type path:  str
+        :return: the predictor with the correlations memory-mapped from the store in the model location, computed and
+                 saved first if the store is missing or stale
+        :rtype:  :py:class:`PredictNeuralNetwork`
+        """
+        if data is None:
+            data = loaddata.Data()
+            data.load_data()
+        return cls(data, store.open_similarity(data, path = path)[0])
+
+    def ratings_changed(self, users, items):
+        """
+        recomputes the correlations of the users whose ratings changed from :py:class:`mrs.recsys.cf.PearsonStatistics`,
+        if they were computed already, see :py:meth:`Predict.ratings_changed`
+        """
+        self.rating_matrix = self.data.get_rating_matrix_with_nan()
+        if self._correlation_matrix is not None:
+            if self.statistics is None:
+                self.statistics = cf.PearsonStatistics(self.rating_matrix)
+            self.correlation_matrix = self.statistics.update_correlations(self.correlation_matrix, self.rating_matrix, users)
+        # the store is opened again with the new fingerprints, the networks of the users whose ratings changed are stale
+        self.networks = None
+
+    def create_training_matrices(self, ratings):
+        """
+        :param ratings: list of tuples with item_id at 0th index and rating at 1th index
+        :type ratings:  list
+        :return: the features of the items as rows of a (n, 19) ndarray and the one-hot ratings as rows of a (n, 5) ndarray,
+                 gathered from :py:meth:`mrs.datamodel.loaddata.Data.get_item_features`
+        :rtype:  tuple
+        """
+        item_ids = np.array([item_id for item_id, rating in ratings], dtype = np.int64)
+        targets  = np.zeros((len(ratings), 5))
+        targets[np.arange(len(ratings)), np.array([rating[0] for item_id, rating in ratings], dtype = np.int64) - 1] = 1
+        return self.data.get_item_features().gather(item_ids), targets
 
     def create_training_examples_with_item(self, ratings):
         """
@@ -61,11 +148,7 @@ class PredictNeuralNetwork(Predict):
         :return: list of tuples of training examples and each training example contains item feature and rating given to that item
         :rtype:  list
         """
-        feature = []
-        for item_id, rating in ratings:
-            feature.append((np.array(list(self.data.get_item_by_id(item_id).get_genres().values())), np.array(self.f(rating[0]))))
-
-        return feature
+        return list(zip(*self.create_training_matrices(ratings)))
 
     def create_training_examples_with_item_and_user_rating(self):
         """
@@ -98,23 +181,83 @@ class PredictNeuralNetwork(Predict):
         ratings_for_test  = ratings_by_user_id[nratings_for_train:]
 
         # create ndarray both from 80% and 20% of the information separately
-        train = self.create_training_examples_with_item(ratings_for_train)
         test  = self.create_training_examples_with_item(ratings_for_test)
 
         # train it
-        NN = ann.Neural_Network()
-        NN.backpropagation(train, 700, .05)
+        NN = self.train_for_an_user(ratings_for_train)
 
         #for feature, y in test:
             #print(convert.f_inverse_cap(list(NN.feedforward(feature)[0])), convert.f_inverse(list(y)))
 
         # test it
-        whole = self.create_training_examples_with_item(list(map(lambda x: (x, [1, None]), range(1, nitems + 1))))
-        ans = []
-        for feature, y in whole:
-            ans.append(convert.f_inverse_cap(list(NN.feedforward(feature)[0])))
+        return self.predict_items(NN, range(1, self.data.get_shape()[1]))
 
-        return ans
+    def train_for_an_user(self, ratings, epoch = 700, eta = .05, batch_size = 32):
+        """
+        :param ratings:    list of tuples with item_id at 0th index and rating at 1th index, see :py:meth:`create_training_examples_with_item`
+        :type ratings:     list
+        :param epoch:      number of iterations of backpropagation
+        :type epoch:       int
+        :param eta:        learning rate
+        :type eta:         float
+        :param batch_size: number of ratings per mini-batch, None trains on one rating at a time
+        :type batch_size:  int
+        :return: the network trained on the ratings
+        :rtype:  :py:class:`mrs.recsys.ann.Neural_Network`
+        """
+        NN = ann.Neural_Network()
+        if batch_size:
+            NN.backpropagation_batch(*self.create_training_matrices(ratings), epoch = epoch, eta = eta, batch_size = batch_size)
+        else:
+            NN.backpropagation(self.create_training_examples_with_item(ratings), epoch, eta)
+        return NN
+
+    def get_network(self, user_id, epoch = 700, eta = .05, batch_size = 32):
+        """
+        :param user_id: id of the user
+        :type user_id:  int
+        :return: the network of the user loaded from the :py:class:`mrs.recsys.annstore.NetworkStore` of the data and the
+                 parameters, it is trained on all the ratings of the user and stored first if it isn't in the store or is stale
+        :rtype:  :py:class:`mrs.recsys.ann.Neural_Network`
+        """
+        header = annstore.get_header(self.data, epoch, eta, batch_size)
+        if self.networks is None or self.networks[0] != header:
+            try:
+                self.networks = header, annstore.open_store(self.data, epoch, eta, batch_size)
+            except OSError:
+                self.networks = header, None
+        networks = self.networks[1]
+
+        NN = networks.get_network(user_id) if networks is not None else None
+        if NN is None:
+            NN = self.train_for_an_user(list(self.data.get_user_by_id(user_id).get_movie_rating().items()), epoch, eta, batch_size)
+            if networks is not None:
+                networks.put_network(user_id, NN)
+        return NN
+
+    def predict_items(self, NN, item_ids, decode = 'cap'):
+        """
+        :param NN:       a network trained by :py:meth:`train_for_an_user`
+        :type NN:        :py:class:`mrs.recsys.ann.Neural_Network`
+        :param item_ids: ids of the items to predict
+        :type item_ids:  array_like
+        :param decode:   see :py:meth:`mrs.recsys.ann.Neural_Network.predict_items`
+        :type decode:    str
+        :return: the predicted rating of every item, from one forward pass over their genre matrix
+        :rtype:  ndarray
+        """
+        return NN.predict_items(self.data.get_item_features().gather(item_ids), decode)
+
+    def recommend(self, user_id, n = 10, exclude_rated = True, genre = None, batch_size = 4096, epoch = 700, eta = .05):
+        """
+        recommends the items the network of the user predicts the highest ratings for, see :py:meth:`get_network`
+
+        :return: ids and predicted ratings of the *n* best items, see :py:func:`mrs.recsys.recommend.recommend`
+        :rtype:  tuple
+        """
+        NN = self.get_network(user_id, epoch, eta)
+        return recommend(lambda item_ids: self.predict_items(NN, item_ids).astype(np.float64), self.data,
+                         user_id, n, exclude_rated, genre, batch_size)
 
     def training_and_test_for_an_user_with_item_and_user_rating(self, user_id):
         """
@@ -132,19 +275,142 @@ class PredictNeuralNetwork(Predict):
         """
         raise NotImplementedError
 
+class PredictGlobalNetwork(Predict):
+    """
+    Predicts with one :py:class:`mrs.recsys.ann.Rating_Network` trained once on the ratings of all the users, instead of a
+    network per user as :py:class:`PredictNeuralNetwork` does. Users whose ratings change get their embedding folded in.
+    """
+    def __init__(self, data = None, nfactors = 16, nhidden = 32, seed = 0, extra = ()):
+        """
+        :param data:     see :py:class:`Predict`
+        :type data:      :py:class:`mrs.datamodel.loaddata.Data`
+        :param nfactors: length of the user and item embeddings
+        :type nfactors:  int
+        :param nhidden:  number of hidden neurons
+        :type nhidden:   int
+        :param seed:     seed of the initial weights
+        :type seed:      int
+        :param extra:    item features used besides the genres, see :py:data:`mrs.datamodel.features.extra_columns`
+        :type extra:     tuple
+        """
+        Predict.__init__(self, data)
+        self.extra      = tuple(extra)
+        self.parameters = {'nfactors': nfactors, 'nhidden': nhidden, 'seed': seed, 'extra': list(self.extra)}
+        self.network    = ann.Rating_Network(self.data.get_shape()[0], self.get_item_features(), nfactors, nhidden, seed)
+        # what the network was trained from, see get_header
+        self.header     = None
+
+    def get_item_features(self):
+        """
+        :return: features of every item id, zero for ids which aren't in the item table
+        :rtype:  ndarray
+        """
+        return self.data.get_item_features(self.extra).matrix
+
+    def get_header(self, epoch = 20, eta = .05, batch_size = 256):
+        """
+        :return: what a network trained now with the training parameters is trained from: the fingerprint of the ratings,
+                 the parameters of the network and of the training
+        :rtype:  dict
+        """
+        return {'fingerprint': self.data.get_fingerprint(), 'parameters': self.parameters,
+                'training': {'epoch': epoch, 'eta': eta, 'batch_size': batch_size}}
+
+    def train(self, epoch = 20, eta = .05, batch_size = 256):
+        """
+        trains the network on all the ratings, see :py:meth:`mrs.recsys.ann.Rating_Network.train`
+
+        :return: mean cross entropy of every epoch
+        :rtype:  list
+        """
+        self.header = self.get_header(epoch, eta, batch_size)
+        return self.network.train(*self.data.get_ratings(), epoch = epoch, eta = eta, batch_size = batch_size)
+
+    def ratings_changed(self, users, items):
+        """
+        folds in the embeddings of the users whose ratings changed, starting from their current ones, the weights are not
+        trained again, see :py:meth:`Predict.ratings_changed`
+        """
+        self.network.resize(self.data.get_shape()[0], self.get_item_features())
+        rating_matrix = self.data.get_sparse_rating_matrix()
+        for user_id in np.unique(users).tolist():
+            self.network.P[user_id] = self.network.fold_in(*rating_matrix.get_row(user_id), embedding = self.network.P[user_id])
+
+    def save(self):
+        """
+        saves the network to the model location together with the header of :py:meth:`train`
+        """
+        with open(config.get_model_path(network_filename), 'wb') as f:
+            pickle.dump({'header': self.header, 'network': self.network}, f)
+
+    def load(self, epoch = 20, eta = .05, batch_size = 256):
+        """
+        loads the network saved by :py:meth:`save`, grown to the shape of the data, if it was trained from the current
+        ratings with the same parameters of the network and of the training
+
+        :return: True if the network was loaded, False if it is missing or stale and has to be trained
+        :rtype:  bool
+        """
+        try:
+            with open(config.get_model_path(network_filename), 'rb') as f:
+                saved = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False
+        header = self.get_header(epoch, eta, batch_size)
+        if not isinstance(saved, dict) or saved.get('header') != header:
+            return False
+
+        self.network, self.header = saved['network'], header
+        self.network.resize(self.data.get_shape()[0], self.get_item_features())
+        return True
+
+    def predict(self, user_id, item_ids = None):
+        """
+        :param user_id:  id of the user
+        :type user_id:   int
+        :param item_ids: ids of the items, all the items from id 0 if None
+        :type item_ids:  ndarray
+        :return: the expected rating of the user for every item
+        :rtype:  ndarray
+        """
+        return self.network.predict_user(user_id, None if item_ids is None else np.asarray(item_ids, dtype = np.int64))
+
+    def recommend(self, user_id, n = 10, exclude_rated = True, genre = None, batch_size = 4096):
+        """
+        :return: ids and expected ratings of the *n* best items, see :py:func:`mrs.recsys.recommend.recommend`
+        :rtype:  tuple
+        """
+        return recommend(lambda item_ids: self.predict(user_id, item_ids), self.data, user_id, n, exclude_rated, genre, batch_size)
+
 class PredictRBM(Predict):
-    def __init__(self):
-        Predict.__init__(self)
-        self.rating_matrix = self.data.get_rating_matrix_with_zero()
+    def __init__(self, data = None, sparse = False):
+        """
+        :param sparse: keep the ratings in a :py:class:`mrs.datamodel.matrix.SparseRatingMatrix` instead of the dense rating matrix
+        :type sparse:  bool
+        """
+        self.sparse = sparse
+        Predict.__init__(self, data)
+        self.rating_matrix = self.get_rating_matrix()
 
         # create the RBM
         self.rbm = RBM_user.RBM_User(self.rating_matrix.shape[1] - 1, 500)
 
+    def get_rating_matrix(self):
+        if self.sparse:
+            return self.data.get_sparse_rating_matrix(np.int8)
+        return self.data.get_rating_matrix_with_zero()
+
+    def ratings_changed(self, users, items):
+        """
+        picks up the rating matrix with the changed ratings, see :py:meth:`Predict.ratings_changed`
+        """
+        self.rating_matrix = self.get_rating_matrix()
+
     def load_hyperparameters(self):
         """
         loads the hyperparameters from the file which has been saved by training the RBM model
         """
-        self.hyperparam   = pickle.load(open(hyperparam_loc, 'rb'))
+        self.hyperparam   = pickle.load(open(config.get_model_path(hyperparam_filename), 'rb'))
         self.rbm.bvisible = self.hyperparam[0]
         self.rbm.weights  = self.hyperparam[1]
         self.rbm.bhidden  = self.hyperparam[2]
@@ -170,3 +436,14 @@ class PredictRBM(Predict):
         v, h = self.rbm.negative_phase(h)
         if movie_id != None: return v[0][movie_id]
         else: return v[0]
+
+    def recommend(self, user_id, n = 10, exclude_rated = True, genre = None, batch_size = 4096):
+        """
+        the visible layer is reconstructed once for all the items, only the selection goes over them in batches
+
+        :return: ids and predicted values of the *n* best items, see :py:func:`mrs.recsys.recommend.recommend`
+        :rtype:  tuple
+        """
+        v = self.predict(user_id)
+        # the visible layer starts from the item with id 1
+        return recommend(lambda item_ids: v[item_ids - 1], self.data, user_id, n, exclude_rated, genre, batch_size)
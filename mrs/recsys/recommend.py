@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module: recommend
+   :synopsis: the items with the highest predicted ratings of a user without predicting the whole catalog at once
+
+:py:func:`recommend` goes over the candidate items of a user in batches of *batch_size* ids, scores every batch with the
+predictor and keeps only the *n* best items seen so far, ties broken by id so the result doesn't depend on *batch_size*.
+Neither the candidates nor the predictions of the whole catalog are ever held at once, the memory depends on *n* and
+*batch_size* and on the number of items tied with the *n*-th best score. The predictors offer it as their *recommend* method.
+
+:Example:
+
+>>> item_ids, ratings = knn.recommend(196, 10, genre = 'Comedy')
+"""
+
+# third party packages
+import numpy as np
+
+def candidates(data, user_id, exclude_rated = True, genre = None, batch_size = 4096):
+    """
+    :param data:          the loaded data set
+    :type data:           :py:class:`mrs.datamodel.loaddata.Data`
+    :param user_id:       id of the user
+    :type user_id:        int
+    :param exclude_rated: leave out the items the user has rated
+    :type exclude_rated:  bool
+    :param genre:         keep only the items of this genre, see :py:data:`mrs.datamodel.genre_names`
+    :type genre:          str
+    :param batch_size:    number of item ids checked at once
+    :type batch_size:     int
+    :return: the ids of the candidate items, one array per batch
+    :rtype:  generator
+    """
+    users = data.get_users()
+    rated = np.sort(np.asarray(users.get_ratings(user_id)[0], dtype = np.int64)) if exclude_rated and user_id in users else None
+    nitems = data.get_shape()[1]
+    for start in range(1, nitems, batch_size):
+        item_ids = np.arange(start, min(start + batch_size, nitems), dtype = np.int64)
+        if rated is not None and len(rated):
+            pos = np.minimum(np.searchsorted(rated, item_ids), len(rated) - 1)
+            item_ids = item_ids[rated[pos] != item_ids]
+        if genre is not None:
+            item_ids = item_ids[data.get_items().get_genre_flags(item_ids, genre)]
+        if len(item_ids):
+            yield item_ids
+
+def top_n(batches, n):
+    """
+    :param batches: *(ids, scores)* arrays of one batch after the other
+    :type batches:  iterable
+    :param n:       number of ids to keep
+    :type n:        int
+    :return: the *n* ids with the highest scores and their scores, ordered from the highest score, ties by id.
+             Scores of nan never come before a number.
+    :rtype:  tuple
+    """
+    best_ids, best_scores = np.empty(0, dtype = np.int64), np.empty(0)
+    for ids, scores in batches:
+        ids = np.concatenate((best_ids, np.asarray(ids, dtype = np.int64)))
+        scores = np.concatenate((best_scores, np.asarray(scores, dtype = np.float64)))
+        keys = np.where(np.isnan(scores), -np.inf, scores)
+        if len(ids) > n:
+            # every item tied with the n-th best score stays, the order by id decides which of them are kept
+            keep = keys >= np.partition(keys, len(keys) - n)[len(keys) - n] if n > 0 else np.zeros(len(ids), dtype = bool)
+            ids, scores, keys = ids[keep], scores[keep], keys[keep]
+        order = np.lexsort((ids, -keys))[:max(n, 0)]
+        best_ids, best_scores = ids[order], scores[order]
+
+    return best_ids, best_scores
+
+def recommend(score_items, data, user_id, n = 10, exclude_rated = True, genre = None, batch_size = 4096):
+    """
+    :param score_items:   called with an array of item ids, returns the predicted rating of every item
+    :type score_items:    callable
+    :param data:          the loaded data set
+    :type data:           :py:class:`mrs.datamodel.loaddata.Data`
+    :param user_id:       id of the user
+    :type user_id:        int
+    :param n:             number of items to recommend
+    :type n:              int
+    :param exclude_rated: leave out the items the user has rated
+    :type exclude_rated:  bool
+    :param genre:         recommend only items of this genre, see :py:data:`mrs.datamodel.genre_names`
+    :type genre:          str
+    :param batch_size:    number of items scored at once
+    :type batch_size:     int
+    :return: ids and predicted ratings of the *n* items with the highest predicted rating, from the highest one
+    :rtype:  tuple
+    """
+    return top_n(((item_ids, score_items(item_ids)) for item_ids in candidates(data, user_id, exclude_rated, genre, batch_size)), n)
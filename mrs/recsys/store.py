@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+.. module: store
+   :synopsis: similarity matrices and neighbor lists saved to disk and memory-mapped
+
+:py:func:`open_similarity` returns the similarity matrix and the :py:class:`mrs.recsys.neighbors.NeighborIndex` of a data set.
+They are kept as raw *.npy* files in a :py:class:`SimilarityStore` in the model location and opened with
+``np.load(mmap_mode = 'r')``, so a process opens a ready model without computing anything and all the processes which open
+the same store share its pages through the cache of the operating system. The *header.json* of the store records the
+fingerprint of the ratings (:py:meth:`mrs.datamodel.loaddata.Data.get_fingerprint`), the kernel and its parameters and the
+number of neighbors. A store whose header doesn't match is stale and is built again.
+
+:Example:
+
+>>> similarity, neighbor_index = open_similarity(d, 'pearson')
+>>> knn = KNN.open(d)
+"""
+
+# library packages
+import os
+import json
+import hashlib
+
+# third party packages
+import numpy as np
+
+# local files
+from ..config import config
+from .cf import Correlation, get_kernel
+from .neighbors import NeighborIndex
+
+# version of the on-disk layout, bump it whenever the arrays or the header change
+STORE_VERSION = 1
+
+# name of the directory in the model location where the stores are kept
+store_dirname = 'similarity'
+
+header_filename = 'header.json'
+
+class SimilarityStore:
+    """
+    Reads and writes named arrays to a directory of *.npy* files with a header which says what they were computed from.
+
+    :param path: directory of the store
+    :type path:  str
+    """
+    def __init__(self, path):
+        self._path = path
+
+    def get_path(self):
+        """
+        :return: the directory of the store
+        :rtype:  str
+        """
+        return self._path
+
+    def get_header(self):
+        """
+        :return: the header of the store, None if there is none
+        :rtype:  dict
+        """
+        try:
+            with open(os.path.join(self._path, header_filename)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def load(self, header):
+        """
+        Memory-maps the arrays of the store read only.
+
+        :param header: what the arrays have to be computed from, it is compared to the header of the store
+        :type header:  dict
+        :return: name to ndarray, or None if the store is missing or stale
+        :rtype:  dict
+        """
+        saved = self.get_header()
+        if saved is None or saved.get('version') != STORE_VERSION or saved.get('header') != header:
+            return None
+
+        try:
+            return {name: np.load(os.path.join(self._path, name + '.npy'), mmap_mode = 'r') for name in saved['arrays']}
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save(self, arrays, header):
+        """
+        Writes the arrays to the store. The header is written last so a partially written store is never loaded, and every
+        file is written under a temporary name and then renamed, so processes which have the old arrays mapped keep them.
+        Failing to write the store (e.g. a read only model location) is not an error, the arrays will be computed again next time.
+
+        :param arrays: name to ndarray
+        :type arrays:  dict
+        :param header: what the arrays were computed from
+        :type header:  dict
+        :return: True if the store was written
+        :rtype:  bool
+        """
+        header_path = os.path.join(self._path, header_filename)
+        try:
+            os.makedirs(self._path, exist_ok = True)
+            if os.path.exists(header_path):
+                os.remove(header_path)
+
+            for name, array in arrays.items():
+                path = os.path.join(self._path, name + '.npy')
+                with open(path + '.tmp', 'wb') as f:
+                    np.save(f, np.ascontiguousarray(array))
+                os.replace(path + '.tmp', path)
+
+            with open(header_path + '.tmp', 'w') as f:
+                json.dump({'version': STORE_VERSION, 'header': header, 'arrays': sorted(arrays)}, f)
+            os.replace(header_path + '.tmp', header_path)
+        except OSError:
+            return False
+
+        return True
+
+def get_store_path(parameters):
+    """
+    :param parameters: kernel and parameters of the similarity and number of neighbors
+    :type parameters:  dict
+    :return: the directory of the store in the model location, one per kernel and parameters
+    :rtype:  str
+    """
+    digest = hashlib.sha1(json.dumps(parameters, sort_keys = True).encode()).hexdigest()[:12]
+    return config.get_model_path(os.path.join(store_dirname, '%s_%s' % (parameters['kernel'], digest)))
+
+def open_similarity(data, kernel = None, neighbors = None, sparse = False, path = None):
+    """
+    :param data:      the loaded data set
+    :type data:       :py:class:`mrs.datamodel.loaddata.Data`
+    :param kernel:    the similarity, see :py:meth:`mrs.recsys.cf.Correlation.similarity`
+    :type kernel:     :py:class:`mrs.recsys.cf.Kernel`
+    :param neighbors: number of neighbors kept per user, see :py:meth:`mrs.recsys.neighbors.NeighborIndex.build`
+    :type neighbors:  int
+    :param sparse:    compute from the sparse rating matrix, the result is the same
+    :type sparse:     bool
+    :param path:      directory of the store, by default one in the model location per kernel and parameters
+    :type path:       str
+    :return: similarity matrix and neighbor index of the ratings of *data*, memory-mapped read only from the store, which
+             is built first if it is missing or stale
+    :rtype:  tuple
+    """
+    kernel = get_kernel(kernel)
+    parameters = dict(kernel.get_parameters(), neighbors = neighbors)
+    store = SimilarityStore(path or get_store_path(parameters))
+    header = {'fingerprint': data.get_fingerprint(), 'parameters': parameters}
+
+    arrays = store.load(header)
+    if arrays is None:
+        rating_matrix = data.get_sparse_rating_matrix() if sparse else data.get_rating_matrix_with_nan()
+        similarity = Correlation().similarity(rating_matrix, kernel)
+        index = NeighborIndex.build(similarity, neighbors)
+        if not store.save({'similarity': similarity, 'ids': index.ids, 'weights': index.weights}, header):
+            return similarity, index
+        arrays = store.load(header)
+        if arrays is None:
+            return similarity, index
+    return arrays['similarity'], NeighborIndex(arrays['ids'], arrays['weights'])
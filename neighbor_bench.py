@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# compares the approximate neighbors of mrs.recsys.approximate.IVFIndex with the exact ones: recall@40 of a sample of users,
+# the build time of the index and the query time per user of the approximate and of the exact search
+# usage: neighbor_bench.py [--data ml-20m] [--nprobe 1 4 8 16] [--refine 4] [--shrinkage 100] [--sample 200]
+
+# library packages
+import time
+import argparse
+
+# third party packages
+import numpy as np
+
+# local files
+from mrs.datamodel import loaddata
+from mrs.recsys.approximate import IVFIndex
+from mrs.recsys.cf import Correlation
+from mrs.recsys.neighbors import NeighborIndex
+
+k = 40
+
+def top(index, user_id, ids, weights):
+    """
+    :return: ids of the *k* most correlated candidates
+    :rtype:  set
+    """
+    index.set_neighbors(user_id, ids, weights)
+    return set(index.get_neighbors(user_id)[0].tolist())
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "recall and speed of the approximate neighbor search")
+    parser.add_argument('--data', default = None, help = "directory of a large MovieLens data set, ml-100k of the config if not given")
+    parser.add_argument('--nprobe', type = int, nargs = '+', default = [1, 2, 4, 8, 16], help = "numbers of probed lists: %(default)s")
+    parser.add_argument('--refine', type = int, default = 4, help = "refined candidates per neighbor: %(default)s")
+    parser.add_argument('--min-overlap', type = int, default = 1, help = "minimum number of co-rated items: %(default)s")
+    parser.add_argument('--shrinkage', type = float, default = 100, help = "shrinkage of the correlations: %(default)s")
+    parser.add_argument('--sample', type = int, default = 200, help = "number of users whose exact neighbors are computed: %(default)s")
+    args = parser.parse_args()
+
+    data = loaddata.Data()
+    if args.data:
+        data.load_stream(args.data, verbose = False)
+    else:
+        data.load_data()
+    m = data.get_sparse_rating_matrix()
+    users = np.where(m.row_nnz() > 0)[0]
+    sample = np.random.RandomState(0).choice(users, min(args.sample, len(users)), replace = False)
+    print('%d users, %d items, %d ratings' % (len(users), m.shape[1] - 1, m.nnz()))
+
+    index = NeighborIndex.empty(m.shape[0], k)
+    start = time.time()
+    exact = [top(index, u, users, Correlation().pearson_candidates(m, u, users, args.min_overlap, args.shrinkage)) for u in sample.tolist()]
+    exact_time = (time.time() - start) / len(sample)
+
+    start = time.time()
+    ivf = IVFIndex(m, data.get_stats().user_mean, refine = args.refine)
+    build_time = time.time() - start
+
+    print('%-8s %10s %10s %14s %14s' % ('nprobe', 'recall@%d' % k, 'build s', 'query ms/user', 'exact ms/user'))
+    for nprobe in args.nprobe:
+        start = time.time()
+        found = [top(index, u, *ivf.query(u, k, nprobe, min_overlap = args.min_overlap, shrinkage = args.shrinkage)) for u in sample.tolist()]
+        query_time = (time.time() - start) / len(sample)
+        recall = sum(len(f & e) for f, e in zip(found, exact)) / max(sum(len(e) for e in exact), 1)
+        print('%-8d %10.3f %10.2f %14.2f %14.2f' % (nprobe, recall, build_time, query_time * 1000, exact_time * 1000))
@@ -220,6 +220,7 @@ def setup_package():
           packages=setuptools.find_packages(exclude=['tests', 'tests.*']),
           namespace_packages=namespace,
           install_requires=install_reqs,
+          python_requires='>=3.8',
           setup_requires=['six', 'setuptools_scm'] + pytest_runner,
           extras_require=extras_require,
           cmdclass={'docs': build_cmd_docs(), 'doctest': build_cmd_docs()},
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# compares the similarity kernels of mrs.recsys.cf on the ml-100k folds: the time to build the user user similarity matrix,
+# the peak memory allocated while building it and the RMSE of KNN with it on the test ratings, averaged over the folds
+# usage: similarity_bench.py [--kernels pearson cosine] [--folds u1 u2 u3 u4 u5] [--sparse]
+
+# library packages
+import os
+import time
+import argparse
+import tracemalloc
+
+# third party packages
+import numpy as np
+
+# local files
+from mrs.config import config
+from mrs.datamodel import loaddata
+from mrs.recsys.cf import Correlation, get_kernel, kernels
+from mrs.recsys.knn import KNN
+
+def bench(data, kernel_name, users, items, ratings, sparse):
+    """
+    :return: build time in seconds, peak memory in MB and RMSE of the kernel on one fold
+    :rtype:  tuple
+    """
+    knn_data = data.get_sparse_rating_matrix() if sparse else data.get_rating_matrix_with_nan()
+    kernel = get_kernel(kernel_name)
+
+    tracemalloc.start()
+    start = time.time()
+    similarity = Correlation().similarity(knn_data, kernel)
+    build_time = time.time() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    knn = KNN(data, sparse = sparse, correlation_matrix = similarity, similarity = kernel)
+    predicted = np.zeros(len(ratings))
+    columns = knn._rated_columns()
+    for user_id in np.unique(users).tolist():
+        rows = np.where(users == user_id)[0]
+        predicted[rows] = knn.score_user(user_id, columns)[items[rows]]
+    data.remove_listener(knn.ratings_changed)
+    return build_time, peak / 2 ** 20, np.sqrt(np.mean((predicted - ratings) ** 2))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = "build time, memory and RMSE of the similarity kernels of KNN")
+    parser.add_argument('--kernels', nargs = '+', default = sorted(kernels), help = "kernels to compare: %(default)s")
+    parser.add_argument('--folds', nargs = '+', default = ['u1', 'u2', 'u3', 'u4', 'u5'], help = "folds of ml-100k: %(default)s")
+    parser.add_argument('--sparse', action = 'store_true', help = "compute from the sparse rating matrix")
+    args = parser.parse_args()
+
+    results = {name: [] for name in args.kernels}
+    for fold in args.folds:
+        data = loaddata.Data()
+        data.load_data('/%s.base' % fold)
+        users, items, ratings, _ = loaddata.read_ratings(os.path.join(config.get_data_location(), fold + '.test'))
+        users, items = users.astype(np.int64), items.astype(np.int64)
+        for name in args.kernels:
+            results[name].append(bench(data, name, users, items, ratings, args.sparse))
+
+    print('%-16s %10s %10s %8s' % ('kernel', 'build s', 'peak MB', 'rmse'))
+    for name in args.kernels:
+        build_time, peak, rmse = np.mean(results[name], axis = 0)
+        print('%-16s %10.3f %10.1f %8.4f' % (name, build_time, peak, rmse))
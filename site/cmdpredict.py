@@ -5,7 +5,7 @@
 import sys, pickle
 
 # local packages
-from mrs.recsys import predict
+from mrs.config import config
 
 # usage: arg1: ['knn', 'ann', 'rbm']
 #        arg2: user_id
@@ -13,17 +13,18 @@ from mrs.recsys import predict
 
 if __name__ == '__main__':
     if sys.argv[1] == 'knn':
-        with open('predicted_rating_knn.bin', 'rb') as f:
+        with open(config.get_model_path('predicted_rating_knn.bin'), 'rb') as f:
             rating = pickle.load(f)
             print(rating[int(sys.argv[2])][int(sys.argv[3])])
     elif sys.argv[1] == 'ann':
-        with open('predicted_rating_ann.bin', 'rb') as f:
+        with open(config.get_model_path('predicted_rating_ann.bin'), 'rb') as f:
             rating = pickle.load(f)
             print(rating[int(sys.argv[2])][int(sys.argv[3])])
     elif sys.argv[1] == 'rbm':
-        with open('predicted_rating_rbm.bin', 'rb') as f:
+        with open(config.get_model_path('predicted_rating_rbm.bin'), 'rb') as f:
             rating = pickle.load(f)
             print(rating[int(sys.argv[2])][int(sys.argv[3])])
+        #from mrs.recsys import predict
         #p = predict.PredictRBM()
         #p.load_hyperparameters()
         #print(p.predict(int(sys.argv[2]), int(sys.argv[3])))
@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# measures how long a cold import of the package takes, every import is done in a fresh interpreter
+# usage: startup_bench.py [repeat]
+
+# library packages
+import sys
+import subprocess
+
+modules = ['mrs', 'mrs.datamodel', 'mrs.recsys', 'mrs.recsys.predict', 'mrs.recsys.knn']
+
+timer = 'import time; start = time.perf_counter(); %s; print(time.perf_counter() - start)'
+
+def cold_import_time(module, repeat):
+    """
+    :return: the median time in seconds of importing *module* in *repeat* fresh interpreters
+    :rtype:  float
+    """
+    times = []
+    for _ in range(repeat):
+        out = subprocess.check_output([sys.executable, '-c', timer % ('import ' + module)])
+        times.append(float(out))
+    times.sort()
+    return times[len(times) // 2]
+
+if __name__ == '__main__':
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+    print('%-22s %10s' % ('module', 'ms'))
+    for module in modules:
+        print('%-22s %10.2f' % (module, cold_import_time(module, repeat) * 1000))
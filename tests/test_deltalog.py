@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import print_function, absolute_import, division
+
+# local files
+from mrs.datamodel.deltalog import RatingLog
+
+def test_append_after_torn_record(tmpdir):
+    log = RatingLog(str(tmpdir.join('ratings.log')))
+    log.append([1, 2], [3, 4], [5, 4], [100, 200])
+
+    # a process killed while appending leaves a partial record behind
+    with open(log.get_path(), 'ab') as f:
+        f.write(b'\x01\x02\x03')
+    assert len(log) == 2
+    assert log.read()[0].tolist() == [1, 2]
+
+    log.append([7], [8], [3], [300])
+    users, items, ratings, timestamps = log.read()
+    assert users.tolist() == [1, 2, 7]
+    assert items.tolist() == [3, 4, 8]
+    assert ratings.tolist() == [5, 4, 3]
+    assert timestamps.tolist() == [100, 200, 300]
+    assert len(log) == 3
+
+def test_read_missing_log(tmpdir):
+    log = RatingLog(str(tmpdir.join('missing.log')))
+    assert len(log) == 0
+    assert all(len(column) == 0 for column in log.read())
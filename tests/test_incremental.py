@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import print_function, absolute_import, division
+
+# third party packages
+import numpy as np
+import pytest
+
+# local files
+from mrs.config import config
+from mrs.datamodel import loaddata
+from mrs.recsys.cf import Correlation
+from mrs.recsys.knn import KNN
+from mrs.recsys.neighbors import NeighborIndex
+
+nusers, nitems = 30, 25
+
+@pytest.fixture
+def data(tmpdir):
+    """
+    a small random data set written in the format of ml-100k
+    """
+    rng = np.random.RandomState(0)
+    rated = rng.rand(nusers, nitems) < .4
+    users, items = np.nonzero(rated)
+    with open(str(tmpdir.join('u.info')), 'w') as f:
+        f.write("%d users\n%d items\n%d ratings\n" % (nusers, nitems, len(users)))
+    with open(str(tmpdir.join('u.user')), 'w') as f:
+        f.writelines("%d|30|M|other|00000\n" % (user_id + 1) for user_id in range(nusers))
+    with open(str(tmpdir.join('u.item')), 'w') as f:
+        f.writelines("%d|Movie %d (1995)|01-Jan-1995|||%s\n" % (item_id + 1, item_id + 1, '|'.join('0' * 19)) for item_id in range(nitems))
+    with open(str(tmpdir.join('u.data')), 'w') as f:
+        f.writelines("%d\t%d\t%d\t%d\n" % (u + 1, i + 1, rng.randint(1, 6), 880000000 + n) for n, (u, i) in enumerate(zip(users, items)))
+
+    location = config.get_data_location()
+    config.set_data_location(str(tmpdir))
+    d = loaddata.Data()
+    d.load_data()
+    yield d
+    config.set_data_location(location)
+
+def random_batch(rng, data, size):
+    """
+    :return: new and changed ratings, some of them by new users for new items
+    :rtype:  tuple
+    """
+    shape = data.get_shape()
+    users = rng.randint(1, shape[0] + 3, size = size)
+    items = rng.randint(1, shape[1] + 2, size = size)
+    return users, items, rng.randint(1, 6, size = size)
+
+def assert_rebuilt(knn, data, sparse, neighbors):
+    rating_matrix = data.get_sparse_rating_matrix() if sparse else data.get_rating_matrix_with_nan()
+    correlation_matrix = Correlation().similarity(rating_matrix)
+    assert knn.correlation_matrix.shape == correlation_matrix.shape
+    np.testing.assert_allclose(knn.correlation_matrix, correlation_matrix, rtol = 1e-5, atol = 1e-5)
+
+    # the neighbors may be in another order where weights are tied, their weights and correlations must be the rebuilt ones
+    index = NeighborIndex.build(correlation_matrix, neighbors)
+    assert knn.neighbor_index.ids.shape == index.ids.shape
+    np.testing.assert_allclose(knn.neighbor_index.weights, index.weights, rtol = 1e-5, atol = 1e-5)
+    ids = knn.neighbor_index.ids
+    found = ids >= 0
+    assert (found == (index.ids >= 0)).all()
+    rows = np.repeat(np.arange(len(ids)), found.sum(axis = 1))
+    np.testing.assert_allclose(knn.neighbor_index.weights[found], correlation_matrix[rows, ids[found]], rtol = 1e-5, atol = 1e-5)
+    assert (ids[found] != rows).all()
+
+@pytest.mark.parametrize('sparse', [False, True])
+@pytest.mark.parametrize('neighbors', [None, 10])
+def test_add_ratings_matches_rebuild(data, sparse, neighbors):
+    rng = np.random.RandomState(1)
+    knn = KNN(data, sparse = sparse, neighbors = neighbors)
+    for size in (1, 5, 20, 3, 40):
+        data.add_ratings(random_batch(rng, data, size), log = False)
+        assert_rebuilt(knn, data, sparse, neighbors)
+    assert data.get_shape()[0] > nusers + 1